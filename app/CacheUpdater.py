@@ -1,48 +1,83 @@
+import contextlib
 import logging
 import os
+import signal
+import threading
 import time
 
 import data_fetch
+from cacheUtil import CentralCache, recording_failures
+from indicators import (
+    INDICATOR_PERIOD,
+    missing_indicators,
+    price_indicators,
+    warm_universe_indicators,
+)
 from common_data import default_time_periods
 from key_metrics import fetch_key_metrics
-from quarterly_financials import fetch_financials
+from quarterly_financials import fetch_financials, refresh_latest_quarter_table
 from ratios import _fetch_financial_ratio_for_single_symbol
 from returns import calculate_returns
 from stock_data import fetch_stock_data, calculate_return_on_capital_employed
+from updater_pool import get_updater_pool
 from utils import get_app_custom_config
 
 logger = logging.getLogger(__name__)
 if get_app_custom_config("cache_updater_details"):
     logger.setLevel(logging.DEBUG)
 
+# Prefix of the leases coordinating the processes refreshing a shared cache, see sharding
+UPDATER_LEASE = "cache_updater"
+# Timestamp of the end of the last refresh cycle
+LAST_REFRESH_KEY = "cache_updater_last_refresh"
+
+
+class ItemTimeout(BaseException):
+    """
+    Raised when a work item of the cache updater runs out of time. Derives from BaseException, like
+    KeyboardInterrupt, so that the `except Exception` handlers of the fetch functions don't swallow it and cache
+    a partial result.
+    """
+
 
 class CacheUpdater:
     def __init__(self, count):
         self.count = count
+        self.item_timeout = get_app_custom_config("updater_item_timeout")
+        # build written by update_symbol, see CentralCache.begin_generation
+        self.build = None
 
-    def update_cache(self, args):
+    def update_symbol(self, symbol):
         """
-        Updates cached data for a set of functions for top `count` stocks in the given sector.
+        Updates cached data for a set of functions for one stock, the work item of a refresh cycle.
+        The update is abandoned after `updater_item_timeout` seconds, keeping the data already updated. It fails if
+        any of the functions failed, see recording_failures.
 
         Returns:
-            str: Message indicating successful cache update with timestamp.
+            tuple: (succeeded, seconds taken, message indicating the outcome of the update with timestamp).
         """
-        sector, symbol_and_weight_list = args
-        logger.debug("CacheUpdater :- Updating cached data for sector %s", sector)
+        logger.debug("CacheUpdater :- Updating cached data for symbol %s", symbol)
+        start = time.perf_counter()
         try:
-            producer_functions_list = [
-                data_fetch.info,
-                data_fetch.annual_financials,
-                data_fetch.annual_balance_sheet,
-                data_fetch.quarterly_financials,
-                data_fetch.quarterly_balance_sheet,
-            ]
-            for symbol_and_weight in symbol_and_weight_list[: self.count]:
-                symbol = symbol_and_weight[0]
+            # all writes for the symbol are applied to the build of the cycle in one round-trip
+            with CentralCache.write_batch(self.build), _item_timeout(
+                self.item_timeout
+            ), recording_failures() as failures:
+                producer_functions_list = [
+                    data_fetch.info,
+                    data_fetch.annual_financials,
+                    data_fetch.annual_balance_sheet,
+                    data_fetch.quarterly_financials,
+                    data_fetch.quarterly_balance_sheet,
+                ]
                 for func in producer_functions_list:
                     func(symbol, force_update=True)
                 for period in default_time_periods.values():
                     data_fetch.history(symbol, period, force_update=True)
+                # after the histories, which they are updated from; the stocks without indicators yet get them
+                # all at once when the cycle is published, see update_symbols
+                if not missing_indicators([symbol]):
+                    price_indicators(symbol, INDICATOR_PERIOD, force_update=True)
 
                 consumer_functions_list = [
                     calculate_return_on_capital_employed,
@@ -55,13 +90,118 @@ class CacheUpdater:
                 for func in consumer_functions_list:
                     func(symbol, force_update=True)
 
-        except Exception as e:
-            logger.error(
-                f"CacheUpdater @process:- {os.getpid()} : Failed to run cache update for sector {sector} due to: {e}"
+        except (Exception, ItemTimeout) as e:
+            message = f"CacheUpdater @process:- {os.getpid()} : Failed to run cache update for symbol {symbol} due to: {e}"
+            logger.error(message)
+            return False, time.perf_counter() - start, message
+
+        if failures:
+            name, args, error = failures[0]
+            message = (
+                f"CacheUpdater @process:- {os.getpid()} : {len(failures)} cached call(s) failed for symbol {symbol}, "
+                f"first {name}{args}: {error}"
+            )
+            logger.warning(message)
+            return False, time.perf_counter() - start, message
+
+        return (
+            True,
+            time.perf_counter() - start,
+            f"CacheUpdater @process:- {os.getpid()}  :- Successful Update for symbol {symbol} @{time.ctime(time.time())}",
+        )
+
+    def symbols_to_update(self, sector_wise_stock_symbol_and_weight_dict):
+        """
+        Returns the top `count` stocks of every sector, once each even if they are in several sectors
+        (e.g. in the 'S&P 500 Index' list).
+
+        Parameters:
+            sector_wise_stock_symbol_and_weight_dict (dict): Sectors mapped to their lists of (Symbol, Weight).
+
+        Returns:
+            list: Symbols, in sector order.
+        """
+        return list(
+            dict.fromkeys(
+                symbol
+                for symbol_and_weight_list in sector_wise_stock_symbol_and_weight_dict.values()
+                for symbol, weight in symbol_and_weight_list[: self.count]
             )
-            return f"CacheUpdater @process:- {os.getpid()} : Failed to run cache update for sector {sector} due to: {e}"
+        )
+
+    def update_symbols(self, symbols, workers=None, on_result=None):
+        """
+        Updates the given stocks in the long-lived worker processes of the updater pool, into a new generation of
+        the cache published atomically once all of them are updated.
+
+        Every stock is a separate work item handed to the next idle worker, so a worker picks the next stock
+        whatever its sector, and a slow stock only holds up its own worker. The indicators of the stocks that have
+        none yet are then computed all at once, see warm_universe_indicators.
 
-        logger.debug(
-            f"CacheUpdater @process:- {os.getpid()} :- Finished its task for sector {sector}. Exiting ...."
+        Parameters:
+            symbols (list): Symbols to update.
+            workers (int): Number of worker processes, if the pool is started by this call, see get_updater_pool.
+            on_result (callable): Called with the symbol and the result of update_symbol as every stock is
+                updated, in the order they finish.
+
+        Returns:
+            int: The number of the generation published.
+        """
+        start = time.time()
+        build = CentralCache.begin_generation()
+
+        def log_result(symbol, result):
+            logger.debug(result[2])
+            if on_result is not None:
+                on_result(symbol, result)
+
+        try:
+            get_updater_pool(workers).update_symbols(symbols, build, log_result)
+        except BaseException:
+            CentralCache.discard_generation(build)
+            raise
+
+        generation = CentralCache.publish_generation(build)
+        # from the published generation, which holds the data of this cycle
+        refresh_latest_quarter_table(symbols)
+        warm_universe_indicators(missing_indicators(symbols))
+        logger.info(
+            f"CacheUpdater :- updated {len(symbols)} symbols in {time.time() - start:.1f}s, published generation {generation}"
+        )
+        return generation
+
+    def refresh(self, sector_wise_stock_symbol_and_weight_dict):
+        """
+        Runs one cache update cycle over the top `count` stocks of every sector.
+
+        Parameters:
+            sector_wise_stock_symbol_and_weight_dict (dict): Sectors mapped to their lists of (Symbol, Weight).
+
+        Returns:
+            int: The number of the generation published.
+        """
+        return self.update_symbols(
+            self.symbols_to_update(sector_wise_stock_symbol_and_weight_dict)
         )
-        return f"CacheUpdater @process:- {os.getpid()}  :- Successful Update for sector {sector} @{time.ctime(time.time())}"
+
+
+@contextlib.contextmanager
+def _item_timeout(seconds):
+    """
+    Raises ItemTimeout in the block after `seconds` (none if 0), using SIGALRM, so only in the main thread of
+    a worker process. Cache round-trips in flight are completed first, see CacheStoreProxy.
+    """
+    if not seconds or threading.current_thread() is not threading.main_thread():
+        yield
+        return
+
+    def on_timeout(signum, frame):
+        raise ItemTimeout(f"cache update did not finish in {seconds}s")
+
+    previous_handler = signal.signal(signal.SIGALRM, on_timeout)
+    signal.setitimer(signal.ITIMER_REAL, seconds)
+    try:
+        yield
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous_handler)
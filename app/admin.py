@@ -0,0 +1,169 @@
+import time
+
+import pandas as pd
+import plotly.graph_objects as go
+import streamlit as st
+
+import sharding
+import tracing
+from cacheUtil import CentralCache
+from memory import process_memory, tracemalloc_control
+from updater_pool import updater_pool_memory
+from utils import get_app_custom_config
+
+MB = 2**20
+
+
+def process_table(cache_process):
+    """
+    Returns the memory of the processes of the deployment: this server process and its updater workers, the
+    process holding the cache, and the other updater nodes as last reported by them.
+
+    Parameters:
+        cache_process (dict): Memory of the process holding the cache, see CentralCache.memory_usage.
+
+    Returns:
+        pandas.DataFrame: One row per process.
+    """
+    server = process_memory()
+    rows = [
+        {"process": "Dashboard server (this process)", **server},
+        {"process": "Cache", **cache_process},
+    ]
+    rows.extend(
+        {"process": "Updater worker", "pid": pid, "rss_mb": rss_mb}
+        for pid, rss_mb in updater_pool_memory().items()
+    )
+    now = time.time()
+    for node, record in sharding.node_memory().items():
+        if node == sharding.node_id():
+            continue
+        rows.append(
+            {
+                "process": f"Updater node {node}",
+                "pid": record["pid"],
+                "rss_mb": record["rss_mb"],
+                "peak_rss_mb": record["peak_rss_mb"],
+                "workers": len(record["workers"]),
+                "workers_rss_mb": sum(filter(None, record["workers"].values())),
+                "reported_s_ago": now - record["reported_at"],
+            }
+        )
+    return pd.DataFrame(rows).set_index("process")
+
+
+def function_table(usage):
+    """
+    Returns the memory of the cache per function, largest first.
+
+    Parameters:
+        usage (dict): See CentralCache.memory_usage.
+
+    Returns:
+        pandas.DataFrame: Keys, stored and decoded MB, KB per key and share of the cache of every function.
+    """
+    frame = pd.DataFrame.from_dict(usage["functions"], orient="index")
+    if frame.empty:
+        return frame
+    frame = frame.sort_values("bytes", ascending=False)
+    return pd.DataFrame(
+        {
+            "Keys": frame["keys"],
+            "Stored (MB)": frame["bytes"] / MB,
+            "Decoded (MB)": frame["decoded_bytes"] / MB,
+            "KB per Key": frame["bytes"] / frame["keys"] / 1024,
+            "Share (%)": frame["bytes"] / max(usage["bytes"], 1) * 100,
+        }
+    )
+
+
+def display_tracemalloc():
+    """
+    Displays the tracemalloc controls and the top allocators of the last snapshot of this process.
+    """
+    col1, col2, col3, col4 = st.columns([1, 1, 1, 3])
+    with col1:
+        frames = st.number_input("Frames", min_value=1, max_value=25, value=1)
+    action = "status"
+    with col2:
+        if st.button("Start tracing"):
+            action = "start"
+    with col3:
+        if st.button("Snapshot"):
+            action = "snapshot"
+    with col4:
+        if st.button("Stop tracing"):
+            action = "stop"
+
+    status = tracemalloc_control(action, frames=frames, limit=25)
+    if "top" in status:
+        st.session_state.tracemalloc_snapshot = status["top"]
+    elif not status["tracing"]:
+        st.session_state.pop("tracemalloc_snapshot", None)
+
+    if status["tracing"]:
+        st.caption(
+            f"Tracing pid {status['pid']}: {status['current_mb']:.1f} MB traced, peak {status['peak_mb']:.1f} MB. "
+            "Tracing slows every allocation down, stop it once done."
+        )
+    else:
+        st.caption(f"Allocations of pid {status['pid']} are not traced.")
+    if st.session_state.get("tracemalloc_snapshot"):
+        st.dataframe(
+            pd.DataFrame(st.session_state.tracemalloc_snapshot).rename(
+                columns={
+                    "location": "Location",
+                    "size_kb": "Size (KB)",
+                    "count": "Blocks",
+                    "size_diff_kb": "Since Previous Snapshot (KB)",
+                }
+            ),
+            hide_index=True,
+            use_container_width=True,
+        )
+
+
+def display_admin():
+    """
+    Displays the memory of the processes of the deployment and of the cache contents, and allocation tracing.
+    """
+    with tracing.span("memory usage"):
+        usage = CentralCache.memory_usage(top=20)
+
+    st.subheader("Processes")
+    st.dataframe(process_table(usage["process"]).round(1), use_container_width=True)
+
+    st.subheader("Cache")
+    col1, col2, col3, col4 = st.columns(4)
+    col1.metric("Keys", f"{usage['keys']:,}")
+    col2.metric("Stored", f"{usage['bytes'] / MB:,.1f} MB")
+    col3.metric(
+        "Held by Older Generations",
+        f"{usage['retained_generation_bytes'] / MB:,.1f} MB",
+    )
+    col4.metric("Builds in Progress", f"{usage['build_bytes'] / MB:,.1f} MB")
+    st.caption(f"Stocks refreshed per sector (count): {get_app_custom_config('count')}")
+
+    functions = function_table(usage)
+    if not functions.empty:
+        with tracing.span("build figure"):
+            fig = go.Figure(
+                go.Bar(x=functions.index, y=functions["Stored (MB)"], name="Stored")
+            )
+            fig.update_layout(
+                title="Cache Memory by Function",
+                yaxis_title="MB",
+                template="plotly_dark",
+            )
+        st.plotly_chart(fig, use_container_width=True)
+        st.dataframe(functions.round(2), use_container_width=True)
+        st.dataframe(
+            pd.DataFrame(usage["top_keys"], columns=["Largest Keys", "KB"]).assign(
+                KB=lambda frame: (frame["KB"] / 1024).round(1)
+            ),
+            hide_index=True,
+            use_container_width=True,
+        )
+
+    st.subheader("Allocation Tracing")
+    display_tracemalloc()
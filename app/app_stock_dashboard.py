@@ -1,4 +1,3 @@
-import concurrent.futures
 import logging
 import resource
 import threading
@@ -6,11 +5,18 @@ import time
 
 import streamlit as st
 import streamlit_antd_components as sac
+from streamlit.runtime.scriptrunner import get_script_run_ctx
 
 # Importing functions from other modules
-import data_fetch
-from CacheUpdater import CacheUpdater
-from cacheUtil import CentralCache
+import prefetch
+import sharding
+import tracing
+from admin import display_admin
+from backtest import display_backtest
+from CacheUpdater import LAST_REFRESH_KEY
+from cacheUtil import CentralCache, ChangeFeed
+from constituents import get_constituent_index
+from correlation import display_correlation
 from common_data import (
     industry_dataframe_default_cols,
     industry_dataframe_all_cols,
@@ -18,11 +24,16 @@ from common_data import (
     available_time_series,
     menus,
 )
+from indicators import oscillator_overlays, price_overlays
 from key_metrics import display_key_metrics
 from quarterly_financials import display_quarterly_stats
 from ratios import display_financial_ratios
 from returns import display_returns
-from stock_data import fetch_multiple_stocks_data, display_industry_wide_stock_data
+from stock_data import (
+    fetch_multiple_stocks_data,
+    fetch_stock_data,
+    display_industry_wide_stock_data,
+)
 from time_series import fetch_time_series_data_and_plot
 from utils import get_app_custom_config
 
@@ -34,19 +45,14 @@ logging.basicConfig(
     level=logging.INFO,
     format="%(asctime)s - %(name)s - %(levelname)s - %(message)s (%(filename)s:%(lineno)d)",
 )
-logging.VERBOSE = 5
-logging.addLevelName(logging.VERBOSE, "VERBOSE")
-logging.Logger.verbose = lambda inst, msg, *args, **kwargs: inst.log(
-    logging.VERBOSE, msg, *args, **kwargs
-)
-logging.verbose = lambda msg, *args, **kwargs: logging.log(
-    logging.VERBOSE, msg, *args, **kwargs
-)
 logger = logging.getLogger(__name__)
 
 if get_app_custom_config("debug"):
     logger.setLevel(logging.DEBUG)
 
+# sampled span tracing of this rerun, finished at the end of the script
+tracing.start_rerun()
+
 
 @st.cache_resource()
 def get_data_cache_available_event_and_background_thread_detail():
@@ -71,38 +77,34 @@ _sleep_time = get_app_custom_config("sleep_time")
 
 
 def background_task(count):
+    # With a shared (remote) cache several replicas run this task, the stocks are split into `updater_shards`
+    # shards and every replica refreshes the shards it holds a lease on (a single one refreshes everything with the
+    # default of one shard). The shards of a crashed replica are reclaimed once its leases expire.
+    owner = sharding.node_id()
     while True:
         logger.info(
             f"background_task :- starting cache update @{time.ctime(time.time())}"
         )
-
-        cache_updater = CacheUpdater(count)
-
-        sector_wise_stock_symbol_and_weight_dict = (
-            data_fetch.get_sector_wise_stock_symbol_and_weight()
-        )
-        sector_wise_stock_symbol_and_weight_list = list(
-            sector_wise_stock_symbol_and_weight_dict.items()
-        )
-
-        with concurrent.futures.ProcessPoolExecutor() as executor:
-
-            results = executor.map(
-                cache_updater.update_cache,
-                sector_wise_stock_symbol_and_weight_list,
+        refreshed_shards = sharding.refresh_owned_shards(count, owner)
+        sharding.publish_node_memory(owner)
+        if refreshed_shards:
+            logger.info(f"cache update finished for shards {refreshed_shards}")
+        else:
+            logger.info(
+                "background_task :- cache update skipped, all shards are held by other replicas"
             )
 
-            # Print results of processing
-            for result in results:
-                logger.debug(result)
-
-        # When both threads are done we can let the main thread know we are done updating the cache
+        # When the cache has been updated (by this or another replica) we can let the main thread know
         # and set the data_cache_available event if not already set
-        if not data_cache_available_event.is_set():
+        if not data_cache_available_event.is_set() and CentralCache.exists(
+            LAST_REFRESH_KEY
+        ):
             data_cache_available_event.set()
-        logger.info("cache update finished")
 
-        time.sleep(_sleep_time)
+        # poll more often until the first update is available
+        time.sleep(
+            _sleep_time if data_cache_available_event.is_set() else min(_sleep_time, 30)
+        )
 
 
 def start_background_task():
@@ -127,6 +129,11 @@ def start_app():
     )
     # initialize central cache
     CentralCache.initialise()
+    if get_app_custom_config("external_cache_updater"):
+        # The cache is filled and refreshed by another process (e.g. the load test harness), nothing to start here
+        shared_dict["background_thread_detail"] = "external cache updater"
+        data_cache_available_event.set()
+        return
     start_background_task()
     st.success("Background task started.")
     time.sleep(30)
@@ -160,199 +167,270 @@ if not shared_dict.get("background_thread_detail"):
         st.button("Submit", on_click=verify_password)
     else:
         start_app()
-if not data_cache_available_event.is_set():
-    st.write(
-        "App is starting......  \nPlease wait while cache update is in process......  \nRefresh Page to check status"
-    )
-else:
-
-    # Initialize session state for tracking selected_columns,selected tickers,time period,time series,page_num and
-    # entries_per_page
-    if "selected_columns" not in st.session_state:
-        st.session_state.selected_columns = industry_dataframe_default_cols
-    if "selected_time_period_index" not in st.session_state:
-        st.session_state.selected_time_period_index = 4  # for ytd
-    if "selected_time_series_index" not in st.session_state:
-        st.session_state.selected_time_series_index = 3  # close
-    if "page_num" not in st.session_state:
-        st.session_state.page_num = 1
-    if "entries_per_page" not in st.session_state:
-        st.session_state.entries_per_page = _cnt
-
-    # Sidebar for navigation
-    with st.sidebar.container():
-        # title
-        st.subheader("Navigation")
-        # menu
-        menu = sac.menu(
-            items=[sac.MenuItem(el) for el in menus],
-            key="menu",
-            open_all=True,
-            indent=20,
-            format_func="title",
-        )
-
-    # Define a function to delete the session state entry
-    def delete_session_state_variable(*state_variables):
-        for state_variable in state_variables:
-            if state_variable in st.session_state:
-                del st.session_state[state_variable]
-
-    # Get SP500 tickers
-    sector_wise_stock_symbol_and_weight = (
-        data_fetch.get_sector_wise_stock_symbol_and_weight()
-    )
-    sector_names = data_fetch.get_gics_sector()
-
-    def sector_filter_and_ticker_selector():
-        col1, col2 = st.columns([2, 2])
-        with col1:
-            sector_choice = st.selectbox(
-                "Filter by Sector",
-                sector_names,
-                on_change=lambda: delete_session_state_variable(
-                    "selected_tickers", "page_num", "entries_per_page"
-                ),  # it's better to delete the "page_num", "entries_per_page" states on changing sectors because
-                # number of tickers vary from sector to sector
-            )
-        # Apply sector filter to tickers
-        filtered_tickers_and_weight_by_sector = sector_wise_stock_symbol_and_weight.get(
-            sector_choice
+# reader pinning a generation of the cache for this rerun, once the cache is available
+_generation_reader = None
+# the pin is released and the trace finished even if the rerun is interrupted, e.g. by st.stop or by a rerun
+# requested by a widget, so that an old generation of the cache is not kept alive until the pin expires
+try:
+    if not data_cache_available_event.is_set():
+        st.write(
+            "App is starting......  \nPlease wait while cache update is in process......  \nRefresh Page to check status"
         )
-        filtered_tickers_by_sector = list(
-            map(
-                lambda ticker_and_weight: ticker_and_weight[0],
-                filtered_tickers_and_weight_by_sector,
-            )
-        )
-        if "selected_tickers" not in st.session_state:
-            st.session_state.selected_tickers = filtered_tickers_by_sector[
-                : min(3, _cnt)
-            ]
-        with col2:
-            selected_stocks = st.multiselect(
-                "Select stock symbols",
-                filtered_tickers_by_sector,
-                default=st.session_state.selected_tickers,
-            )
-        st.session_state.selected_tickers = selected_stocks
-        return selected_stocks
-
-    # Navigation handling
-    if menu == "Industry Data":
-        # Layout configuration with Streamlit columns
-        col1, col2, col3, col4 = st.columns([2, 1, 1, 3])
-        with col1:
-            sector_choice = st.selectbox(
-                "Filter by Sector",
-                sector_names,
-                on_change=lambda: delete_session_state_variable(
-                    "selected_tickers", "page_num", "entries_per_page"
-                ),  # it's better to delete the "page_num", "entries_per_page" states on changing sectors because
-                # number of tickers vary from sector to sector
+    else:
+        # every read of this rerun is from the same generation of the cache, even if a refresh cycle is published
+        # meanwhile
+        _generation_reader = get_script_run_ctx().session_id
+        CentralCache.pin_generation(_generation_reader)
+
+        # let the user know when the stock data was refreshed since the previous rerun of the session
+        if "stock_data_changes" not in st.session_state:
+            st.session_state.stock_data_changes = ChangeFeed(
+                prefixes=(f"{fetch_stock_data.__name__}(",)
             )
+        _changed = st.session_state.stock_data_changes.poll()
+        if _changed is None:
+            st.toast("Stock data updated since your last view")
+        else:
+            # keys added (e.g. by prefetching) are not updates
+            _updated = [key for key, (old_hash, _) in _changed.items() if old_hash]
+            if _updated:
+                st.toast(
+                    f"Stock data updated for {len(_updated)} stocks since your last view"
+                )
 
-        # Apply sector filter to tickers
-        filtered_tickers_and_weight_by_sector = sector_wise_stock_symbol_and_weight.get(
-            sector_choice
-        )
-        filtered_tickers_by_sector = list(
-            map(
-                lambda ticker_and_weight: ticker_and_weight[0],
-                filtered_tickers_and_weight_by_sector,
+        # Initialize session state for tracking selected_columns,selected tickers,time period,time series,page_num and
+        # entries_per_page
+        if "selected_columns" not in st.session_state:
+            st.session_state.selected_columns = industry_dataframe_default_cols
+        if "selected_time_period_index" not in st.session_state:
+            st.session_state.selected_time_period_index = 4  # for ytd
+        if "selected_time_series_index" not in st.session_state:
+            st.session_state.selected_time_series_index = 3  # close
+        if "selected_overlays" not in st.session_state:
+            st.session_state.selected_overlays = []
+        if "page_num" not in st.session_state:
+            st.session_state.page_num = 1
+        if "entries_per_page" not in st.session_state:
+            st.session_state.entries_per_page = _cnt
+
+        # Sidebar for navigation
+        with st.sidebar.container():
+            # title
+            st.subheader("Navigation")
+            # menu
+            menu = sac.menu(
+                items=[
+                    sac.MenuItem(el)
+                    for el in menus
+                    if el != "Admin" or get_app_custom_config("admin_page")
+                ],
+                key="menu",
+                open_all=True,
+                indent=20,
+                format_func="title",
             )
-        )
-        with col2:
-            entries_per_page = st.number_input(
-                "Results per Page",
-                min_value=1,
-                max_value=len(filtered_tickers_by_sector),
-                value=st.session_state.entries_per_page,
-            )
-            st.session_state.entries_per_page = entries_per_page
-            total_pages = (len(filtered_tickers_by_sector) - 1) // entries_per_page + 1
-
-        with col3:
-            page = st.number_input(
-                "Page",
-                min_value=1,
-                max_value=total_pages,
-                value=st.session_state.page_num,
-                step=1,
-            )
-            st.session_state.page_num = page
-
-        with col4:
-            popover = st.popover("Select Columns to Display")
-            with popover:
-                selected_columns = st.multiselect(
-                    "Choose Columns",
-                    options=industry_dataframe_all_cols,
-                    default=st.session_state.selected_columns,
+
+        # Define a function to delete the session state entry
+        def delete_session_state_variable(*state_variables):
+            for state_variable in state_variables:
+                if state_variable in st.session_state:
+                    del st.session_state[state_variable]
+
+        # Get SP500 tickers, precomputed once a day in this process
+        constituent_index = get_constituent_index()
+        if constituent_index is None:
+            st.error("Failed to load the S&P 500 constituents, please try again later")
+            st.stop()
+        sector_names = constituent_index.sectors
+
+        def default_selected_tickers(tickers_by_sector):
+            return tickers_by_sector[: min(3, _cnt)]
+
+        def sector_filter_and_ticker_selector():
+            col1, col2 = st.columns([2, 2])
+            with col1:
+                sector_choice = st.selectbox(
+                    "Filter by Sector",
+                    sector_names,
+                    on_change=lambda: delete_session_state_variable(
+                        "selected_tickers", "page_num", "entries_per_page"
+                    ),  # it's better to delete the "page_num", "entries_per_page" states on changing sectors because
+                    # number of tickers vary from sector to sector
+                )
+            # Apply sector filter to tickers
+            filtered_tickers_by_sector = constituent_index.sector_symbols[sector_choice]
+            if "selected_tickers" not in st.session_state:
+                st.session_state.selected_tickers = default_selected_tickers(
+                    filtered_tickers_by_sector
+                )
+            with col2:
+                selected_stocks = st.multiselect(
+                    "Select stock symbols",
+                    filtered_tickers_by_sector,
+                    default=st.session_state.selected_tickers,
+                )
+            st.session_state.selected_tickers = selected_stocks
+            return selected_stocks
+
+        # Navigation handling
+        with tracing.span(menu):
+            if menu == "Industry Data":
+                # Layout configuration with Streamlit columns
+                col1, col2, col3, col4 = st.columns([2, 1, 1, 3])
+                with col1:
+                    sector_choice = st.selectbox(
+                        "Filter by Sector",
+                        sector_names,
+                        on_change=lambda: delete_session_state_variable(
+                            "selected_tickers", "page_num", "entries_per_page"
+                        ),  # it's better to delete the "page_num", "entries_per_page" states on changing sectors because
+                        # number of tickers vary from sector to sector
+                    )
+
+                # Apply sector filter to tickers
+                filtered_tickers_and_weight_by_sector = (
+                    constituent_index.tickers_and_weights[sector_choice]
+                )
+                filtered_tickers_by_sector = constituent_index.sector_symbols[
+                    sector_choice
+                ]
+                with col2:
+                    entries_per_page = st.number_input(
+                        "Results per Page",
+                        min_value=1,
+                        max_value=len(filtered_tickers_by_sector),
+                        value=st.session_state.entries_per_page,
+                    )
+                    st.session_state.entries_per_page = entries_per_page
+                    total_pages = (
+                        len(filtered_tickers_by_sector) - 1
+                    ) // entries_per_page + 1
+
+                with col3:
+                    page = st.number_input(
+                        "Page",
+                        min_value=1,
+                        max_value=total_pages,
+                        value=st.session_state.page_num,
+                        step=1,
+                    )
+                    st.session_state.page_num = page
+
+                with col4:
+                    popover = st.popover("Select Columns to Display")
+                    with popover:
+                        selected_columns = st.multiselect(
+                            "Choose Columns",
+                            options=industry_dataframe_all_cols,
+                            default=st.session_state.selected_columns,
+                        )
+                        # saving state
+                        st.session_state.selected_columns = selected_columns
+
+                # filtered_tickers based on page number and entries_per_page
+                start = (page - 1) * entries_per_page
+                end = start + entries_per_page
+                filtered_tickers_and_weight_by_sector_and_page_cnt = (
+                    filtered_tickers_and_weight_by_sector[start:end]
                 )
-                # saving state
-                st.session_state.selected_columns = selected_columns
 
-        # filtered_tickers based on page number and entries_per_page
-        start = (page - 1) * entries_per_page
-        end = start + entries_per_page
-        filtered_tickers_and_weight_by_sector_and_page_cnt = (
-            filtered_tickers_and_weight_by_sector[start:end]
-        )
+                # fetch data for filtered_tickers on given page
+                filtered_data = fetch_multiple_stocks_data(
+                    filtered_tickers_and_weight_by_sector_and_page_cnt
+                )
 
-        # fetch data for filtered_tickers on given page
-        filtered_data = fetch_multiple_stocks_data(
-            filtered_tickers_and_weight_by_sector_and_page_cnt
-        )
+                st.header("Industry Data")
+                # Display the data table with industry data
+                display_industry_wide_stock_data(filtered_data, selected_columns)
+                st.write(f"Showing page {page} of {total_pages}")
 
-        st.header("Industry Data")
-        # Display the data table with industry data
-        display_industry_wide_stock_data(filtered_data, selected_columns)
-        st.write(f"Showing page {page} of {total_pages}")
-
-    elif menu == "Stock Details":
-        selected_stocks = sector_filter_and_ticker_selector()
-
-        # Time series and period selection for charts
-        col1, col2 = st.columns(2)
-        with col1:
-            time_series = st.selectbox(
-                "Select the time series data to plot",
-                available_time_series,
-                index=st.session_state.selected_time_series_index,
-            )
-            # saving state
-            st.session_state.selected_time_series_index = available_time_series.index(
-                time_series
-            )
+                # warm the cache for the likely next steps: the next page, and the details of the stocks selected by
+                # default in this sector
+                prefetch.prefetch_industry_page(
+                    filtered_tickers_and_weight_by_sector, page, entries_per_page
+                )
+                prefetch.prefetch_stock_details(
+                    st.session_state.get(
+                        "selected_tickers",
+                        default_selected_tickers(filtered_tickers_by_sector),
+                    ),
+                    list(all_time_periods.values())[
+                        st.session_state.selected_time_period_index
+                    ],
+                )
 
-        with col2:
-            time_frame = st.selectbox(
-                "Select the time period for chart",
-                all_time_periods.keys(),
-                index=st.session_state.selected_time_period_index,
-            )
-            # saving state
-            st.session_state.selected_time_period_index = list(
-                all_time_periods.keys()
-            ).index(time_frame)
+            elif menu == "Stock Details":
+                selected_stocks = sector_filter_and_ticker_selector()
+
+                # Time series and period selection for charts
+                col1, col2 = st.columns(2)
+                with col1:
+                    time_series = st.selectbox(
+                        "Select the time series data to plot",
+                        available_time_series,
+                        index=st.session_state.selected_time_series_index,
+                    )
+                    # saving state
+                    st.session_state.selected_time_series_index = (
+                        available_time_series.index(time_series)
+                    )
+
+                with col2:
+                    time_frame = st.selectbox(
+                        "Select the time period for chart",
+                        all_time_periods.keys(),
+                        index=st.session_state.selected_time_period_index,
+                    )
+                    # saving state
+                    st.session_state.selected_time_period_index = list(
+                        all_time_periods.keys()
+                    ).index(time_frame)
+
+                    time_frame = all_time_periods[time_frame]
+
+                selected_overlays = st.multiselect(
+                    "Indicators",
+                    list(price_overlays) + list(oscillator_overlays),
+                    default=st.session_state.selected_overlays,
+                )
+                # saving state
+                st.session_state.selected_overlays = selected_overlays
+
+                fetch_time_series_data_and_plot(
+                    selected_stocks, time_series, time_frame, selected_overlays
+                )
+
+            elif menu == "Quarterly Financials":
+                selected_stocks = sector_filter_and_ticker_selector()
+                display_quarterly_stats(selected_stocks)
+
+            elif menu == "Metrics":
+                selected_stocks = sector_filter_and_ticker_selector()
+                display_key_metrics(selected_stocks)
 
-            time_frame = all_time_periods[time_frame]
+            elif menu == "Ratios":
+                selected_stocks = sector_filter_and_ticker_selector()
+                display_financial_ratios(selected_stocks)
 
-        fetch_time_series_data_and_plot(selected_stocks, time_series, time_frame)
+            elif menu == "Returns":
+                selected_stocks = sector_filter_and_ticker_selector()
+                display_returns(selected_stocks)
 
-    elif menu == "Quarterly Financials":
-        selected_stocks = sector_filter_and_ticker_selector()
-        display_quarterly_stats(selected_stocks)
+            elif menu == "Correlation":
+                selected_stocks = sector_filter_and_ticker_selector()
+                display_correlation(selected_stocks)
 
-    elif menu == "Metrics":
-        selected_stocks = sector_filter_and_ticker_selector()
-        display_key_metrics(selected_stocks)
+            elif menu == "Backtest":
+                selected_stocks = sector_filter_and_ticker_selector()
+                display_backtest(selected_stocks)
 
-    elif menu == "Ratios":
-        selected_stocks = sector_filter_and_ticker_selector()
-        display_financial_ratios(selected_stocks)
+            elif menu == "Admin" and get_app_custom_config("admin_page"):
+                display_admin()
+finally:
+    if _generation_reader is not None:
+        CentralCache.unpin_generation(_generation_reader)
+    trace = tracing.finish_rerun()
 
-    elif menu == "Returns":
-        selected_stocks = sector_filter_and_ticker_selector()
-        display_returns(selected_stocks)
+if trace is not None:
+    tracing.display_trace(trace)
+    tracing.display_recent_traces()
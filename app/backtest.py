@@ -0,0 +1,196 @@
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+import streamlit as st
+
+import data_fetch
+import tracing
+from common_data import backtest_periods, rebalance_frequencies
+from constituents import ALL_SECTORS, get_constituent_index
+
+# Symbol of the S&P 500 index, the benchmark of the backtests
+BENCHMARK_SYMBOL = "^GSPC"
+TRADING_DAYS = 252
+
+
+def close_panel(symbols, period):
+    """
+    Returns the closes of stocks aligned on their trading days, from their cached histories.
+
+    Parameters:
+        symbols (list of str): The symbols.
+        period (str): The history period, e.g. '5y'.
+
+    Returns:
+        pandas.DataFrame: Closes indexed by date, one column per stock having a history; NaN before a stock was
+        listed, and the last close carried forward after it stopped trading.
+    """
+    histories = data_fetch.history.many([(symbol, period) for symbol in symbols])
+    closes = {
+        symbol: history["Close"]
+        for symbol, history in zip(symbols, histories)
+        if history is not None and not history.empty
+    }
+    if not closes:
+        return pd.DataFrame()
+    return pd.concat(closes, axis=1).sort_index().astype("float64").ffill()
+
+
+def backtest(closes, weights, rebalance=None):
+    """
+    Backtests a portfolio of stocks bought with the given weights and rebalanced to them at the first close of every
+    period, vectorized over the whole panel: between two rebalancing dates, each holding grows with the close of its
+    stock relative to the close it was bought at.
+
+    Parameters:
+        closes (pandas.DataFrame): Closes indexed by date, one column per stock, see close_panel.
+        weights (pandas.Series): Target weight of every stock, normalized to 1 over the stocks trading at each
+            rebalancing date. A period in which none of the weighted stocks trades at its start is held as cash.
+        rebalance (str): Rebalancing frequency as a pandas period, e.g. 'M', 'Q' or 'Y'. None to buy and hold.
+
+    Returns:
+        pandas.Series: Value of the portfolio indexed by date, starting at 1.
+    """
+    prices = closes.to_numpy()
+    weights = weights.reindex(closes.columns).fillna(0).to_numpy("float64")
+    if rebalance:
+        periods = closes.index.to_period(rebalance)
+        starts = np.flatnonzero(np.r_[True, periods[1:] != periods[:-1]])
+    else:
+        starts = np.array([0])
+
+    # weights of every holding period, among the stocks trading at its start
+    start_prices = prices[starts]
+    period_weights = np.where(np.isnan(start_prices), 0.0, weights)
+    totals = period_weights.sum(axis=1, keepdims=True)
+    period_weights = np.divide(
+        period_weights, totals, out=np.zeros_like(period_weights), where=totals > 0
+    )
+
+    # the holding period of every day, a rebalancing day closing the previous period
+    holding = np.clip(
+        np.searchsorted(starts, np.arange(len(prices)), side="left") - 1, 0, None
+    )
+    with np.errstate(invalid="ignore"):
+        growth = np.nan_to_num(prices / start_prices[holding])
+    relative_value = (growth * period_weights[holding]).sum(axis=1)
+    relative_value[totals[holding, 0] == 0] = 1.0
+
+    # value at the start of every period, chaining the value each period ended with
+    ends = np.r_[starts[1:], len(prices) - 1]
+    start_values = np.r_[1.0, np.cumprod(relative_value[ends])[:-1]]
+    return pd.Series(start_values[holding] * relative_value, index=closes.index)
+
+
+def performance(values):
+    """
+    Parameters:
+        values (pandas.Series): Value of a portfolio indexed by date.
+
+    Returns:
+        dict: Total return, CAGR, annualized volatility, Sharpe ratio (no risk free rate) and maximum drawdown,
+        in percent except the Sharpe ratio.
+    """
+    returns = values.pct_change().dropna()
+    years = (values.index[-1] - values.index[0]).days / 365.25
+    volatility = returns.std() * np.sqrt(TRADING_DAYS)
+    return {
+        "Total Return (%)": (values.iloc[-1] / values.iloc[0] - 1) * 100,
+        "CAGR (%)": (
+            ((values.iloc[-1] / values.iloc[0]) ** (1 / years) - 1) * 100
+            if years > 0
+            else np.nan
+        ),
+        "Volatility (%)": volatility * 100,
+        "Sharpe Ratio": (
+            returns.mean() * TRADING_DAYS / volatility if volatility else np.nan
+        ),
+        "Max Drawdown (%)": ((values / values.cummax()).min() - 1) * 100,
+    }
+
+
+def index_weights(symbols):
+    """
+    Returns the weights of stocks in the S&P 500, from the constituent index.
+    """
+    constituent_index = get_constituent_index()
+    weights = dict(constituent_index.tickers_and_weights[ALL_SECTORS])
+    return pd.Series({symbol: weights.get(symbol, 0.0) for symbol in symbols})
+
+
+def display_backtest(selected_stocks):
+    """
+    Displays the backtest of a portfolio of the selected stocks against the S&P 500.
+
+    Parameters:
+        selected_stocks (list of str): A list of stock symbols.
+    """
+    if not selected_stocks:
+        st.warning("Please select at least one stock to proceed.")
+        return
+
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        weighting = st.radio("Weights", ["Equal", "Index", "Custom"], horizontal=True)
+    with col2:
+        rebalance = st.selectbox("Rebalancing", rebalance_frequencies.keys(), index=2)
+    with col3:
+        period = st.selectbox("Period", backtest_periods.keys(), index=4)
+
+    if weighting == "Equal":
+        weights = pd.Series(1.0, index=selected_stocks)
+    elif weighting == "Index":
+        weights = index_weights(selected_stocks)
+    else:
+        edited = st.data_editor(
+            pd.DataFrame({"Symbol": selected_stocks, "Weight": 1.0}),
+            disabled=["Symbol"],
+            hide_index=True,
+            use_container_width=True,
+        )
+        weights = edited.set_index("Symbol")["Weight"].clip(lower=0)
+
+    with tracing.span("close panel"):
+        closes = close_panel(selected_stocks, backtest_periods[period])
+    # from the first close of a stock with a weight, the panel starts with the earliest listing of all the stocks
+    weighted = closes[[symbol for symbol in closes if weights.get(symbol, 0) > 0]]
+    first_close = weighted.first_valid_index()
+    if first_close is None:
+        st.error("Failed to retrieve data for the backtest.")
+        return
+    closes = closes.loc[first_close:]
+    with tracing.span("backtest"):
+        values = {
+            "Portfolio": backtest(closes, weights, rebalance_frequencies[rebalance])
+        }
+        benchmark = close_panel([BENCHMARK_SYMBOL], backtest_periods[period])
+        if not benchmark.empty:
+            values["S&P 500"] = backtest(
+                benchmark.loc[closes.index[0] :],
+                pd.Series({BENCHMARK_SYMBOL: 1.0}),
+            )
+
+    with tracing.span("build figure"):
+        fig = go.Figure(
+            [
+                go.Scatter(x=series.index, y=series, name=name, mode="lines")
+                for name, series in values.items()
+            ]
+        )
+        fig.update_layout(
+            title="Growth of $1",
+            xaxis_title="Date",
+            yaxis_title="Value",
+            template="plotly_dark",
+            hovermode="x unified",
+        )
+    with tracing.span("st.plotly_chart"):
+        st.plotly_chart(fig, use_container_width=True)
+    if "S&P 500" not in values:
+        st.info("The S&P 500 benchmark is not available.")
+    st.dataframe(
+        pd.DataFrame(
+            {name: performance(series) for name, series in values.items()}
+        ).transpose(),
+        use_container_width=True,
+    )
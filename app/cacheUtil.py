@@ -1,9 +1,16 @@
+import collections
+import contextlib
 import functools
 import logging
-import multiprocessing
+import signal
+import threading
 import time
+from multiprocessing.managers import BaseManager, DictProxy, SyncManager
 
-from utils import get_app_custom_config, CacheExpiredException
+import tracing
+from cache_codec import encode, decode, content_hash, stored_size
+from memory import process_memory
+from utils import get_app_custom_config, CacheExpiredException, DataProviderError
 
 logger = logging.getLogger(__name__)
 level = logging.INFO
@@ -14,109 +21,1130 @@ if get_app_custom_config("cache_util_verbose_log"):
 logger.setLevel(level)
 
 
+class CacheStore(dict):
+    """
+    The dict living in the manager process, with batched operations so that many keys cost one round-trip,
+    and leases to coordinate the processes (and replicas) sharing it.
+
+    Refresh cycles of the cache updater write into a build, which is published atomically as a new generation: a
+    snapshot of all the keys written by the updater. Readers pin a generation for the duration of a rerun, and
+    generations no longer current nor pinned are released. Keys written outside of a build (values computed on
+    demand on a cache miss, constituent lists, statuses) live in the dict itself; a lookup returns the newer of
+    the entry of the generation and the one of the dict.
+
+    Entries are (value, timestamp, content hash). A write of the content already stored only refreshes the
+    timestamp, and every actual change is recorded in a change feed that readers poll to invalidate what they
+    derived from the changed keys.
+    """
+
+    def __init__(self, *args, change_feed_size=10000, **kwargs):
+        super().__init__(*args, **kwargs)
+        # the manager serves every client connection in its own thread
+        self._lock = threading.Lock()
+        self._leases = {}
+        # (sequence number, key, old hash, new hash, time) of the latest changes, None hashes for absent keys
+        self._changes = collections.deque(maxlen=change_feed_size)
+        self._change_seq = 0
+        # generation number -> snapshot, dict of key -> (value, timestamp, hash)
+        self._generations = {0: {}}
+        self._current_generation = 0
+        # readers use this reference, replaced (not mutated) on publish
+        self._current_snapshot = self._generations[0]
+        # build id -> (items, dropped keys) written by a refresh cycle in progress
+        self._builds = {}
+        self._next_build = 1
+        # reader -> (generation, expiry)
+        self._pins = {}
+
+    def _snapshot(self, generation):
+        snapshot = None if generation is None else self._generations.get(generation)
+        return self._current_snapshot if snapshot is None else snapshot
+
+    @staticmethod
+    def _newer(entry, other):
+        if entry is None or (other is not None and other[1] > entry[1]):
+            return other
+        return entry
+
+    def lookup(self, key, generation=None):
+        return self._newer(self._snapshot(generation).get(key), self.get(key))
+
+    def contains(self, key, generation=None):
+        return key in self or key in self._snapshot(generation)
+
+    def get_many(self, keys, generation=None):
+        snapshot = self._snapshot(generation)
+        entries = {}
+        for key in keys:
+            entry = self._newer(snapshot.get(key), self.get(key))
+            if entry is not None:
+                entries[key] = entry
+        return entries
+
+    def get_hashes(self, keys, generation=None):
+        # (timestamp, content hash) of the entries, without sending their values
+        snapshot = self._snapshot(generation)
+        hashes = {}
+        for key in keys:
+            entry = self._newer(snapshot.get(key), self.get(key))
+            if entry is not None:
+                hashes[key] = entry[1:]
+        return hashes
+
+    def _record_change(self, key, old_entry, new_entry, now):
+        self._change_seq += 1
+        self._changes.append(
+            (
+                self._change_seq,
+                key,
+                None if old_entry is None else old_entry[2],
+                None if new_entry is None else new_entry[2],
+                now,
+            )
+        )
+
+    @staticmethod
+    def _deduplicated(old_entry, new_entry):
+        if old_entry is not None and old_entry[2] == new_entry[2]:
+            # same content, the value already stored is kept and only its freshness changes
+            return (old_entry[0], new_entry[1], old_entry[2]), False
+        return new_entry, True
+
+    def apply_batch(self, items, dropped_keys, build=None):
+        with self._lock:
+            if build is not None:
+                build_items, build_dropped_keys = self._builds[build]
+                for key in dropped_keys:
+                    build_items.pop(key, None)
+                build_dropped_keys.update(dropped_keys)
+                build_dropped_keys.difference_update(items)
+                build_items.update(items)
+                return
+            now = time.time()
+            for key in dropped_keys:
+                old_entry = self.pop(key, None)
+                if old_entry is not None:
+                    self._record_change(key, old_entry, None, now)
+            snapshot = self._current_snapshot
+            for key, entry in items.items():
+                old_entry = self._newer(snapshot.get(key), self.get(key))
+                self[key], changed = self._deduplicated(old_entry, entry)
+                if changed:
+                    self._record_change(key, old_entry, entry, now)
+
+    def get_changes(self, since):
+        """
+        Returns the sequence number of the latest change, the changes made after `since` (none if None) and
+        whether they are complete (False if older changes were already evicted from the feed).
+        """
+        with self._lock:
+            if since is None:
+                return self._change_seq, [], True
+            complete = not self._changes or self._changes[0][0] <= since + 1
+            return (
+                self._change_seq,
+                [change for change in self._changes if change[0] > since],
+                complete,
+            )
+
+    def begin_build(self):
+        with self._lock:
+            build = self._next_build
+            self._next_build += 1
+            self._builds[build] = ({}, set())
+            return build
+
+    def publish_build(self, build):
+        with self._lock:
+            items, dropped_keys = self._builds.pop(build)
+            # the build is applied on top of the current generation, so that builds of different updater nodes
+            # (each refreshing its own shards) add up
+            snapshot = dict(self._current_snapshot)
+            now = time.time()
+            for key in dropped_keys:
+                old_entry = self._newer(snapshot.pop(key, None), self.pop(key, None))
+                if old_entry is not None:
+                    self._record_change(key, old_entry, None, now)
+            for key, entry in items.items():
+                # superseded by the new generation
+                old_entry = self._newer(snapshot.get(key), self.pop(key, None))
+                snapshot[key], changed = self._deduplicated(old_entry, entry)
+                if changed:
+                    self._record_change(key, old_entry, entry, now)
+            generation = self._current_generation + 1
+            self._generations[generation] = snapshot
+            self._current_generation = generation
+            self._current_snapshot = snapshot
+            self._release_generations()
+            return generation
+
+    def discard_build(self, build):
+        with self._lock:
+            self._builds.pop(build, None)
+
+    def pin_generation(self, reader, ttl):
+        with self._lock:
+            generation = self._current_generation
+            self._pins[reader] = (generation, time.time() + ttl)
+            self._release_generations()
+            return generation
+
+    def unpin_generation(self, reader):
+        with self._lock:
+            self._pins.pop(reader, None)
+            self._release_generations()
+
+    def _release_generations(self):
+        now = time.time()
+        self._pins = {reader: pin for reader, pin in self._pins.items() if pin[1] > now}
+        referenced = {self._current_generation}
+        referenced.update(generation for generation, _ in self._pins.values())
+        for generation in list(self._generations):
+            if generation not in referenced:
+                del self._generations[generation]
+
+    def get_generations(self):
+        with self._lock:
+            pins = {}
+            for generation, _ in self._pins.values():
+                pins[generation] = pins.get(generation, 0) + 1
+            return {
+                "current": self._current_generation,
+                "generations": {
+                    generation: {"keys": len(snapshot), "pins": pins.get(generation, 0)}
+                    for generation, snapshot in self._generations.items()
+                },
+                "builds": len(self._builds),
+            }
+
+    def memory_usage(self, top=20):
+        """
+        Accounts for the memory held by the cache values, each value counted once however many generations share it:
+        per function (the part of the key before its arguments), the `top` largest keys, and the values only held
+        by older generations still pinned or by builds in progress. Also returns the memory of this process.
+        """
+        with self._lock:
+            current = dict(self._current_snapshot)
+            # entries of the dict superseded by the current generation, or the other way round
+            retained = []
+            for key, entry in self.items():
+                newer = self._newer(current.get(key), entry)
+                retained.append(entry if newer is not entry else current.get(key))
+                current[key] = newer
+            retained.extend(
+                entry
+                for generation, snapshot in self._generations.items()
+                if generation != self._current_generation
+                for entry in snapshot.values()
+            )
+            building = [
+                entry for items, _ in self._builds.values() for entry in items.values()
+            ]
+
+        seen = set()
+        functions = {}
+        sizes = {}
+        for key, entry in current.items():
+            seen.add(id(entry[0]))
+            size, decoded_size = stored_size(entry[0])
+            sizes[key] = size
+            name = key.split("(", 1)[0].split(":", 1)[0]
+            usage = functions.setdefault(
+                name, {"keys": 0, "bytes": 0, "decoded_bytes": 0}
+            )
+            usage["keys"] += 1
+            usage["bytes"] += size
+            usage["decoded_bytes"] += decoded_size
+
+        def unshared_bytes(entries):
+            total = 0
+            for entry in entries:
+                if entry is not None and id(entry[0]) not in seen:
+                    seen.add(id(entry[0]))
+                    total += stored_size(entry[0])[0]
+            return total
+
+        return {
+            "process": process_memory(),
+            "keys": len(current),
+            "bytes": sum(sizes.values()),
+            "functions": functions,
+            "top_keys": sorted(sizes.items(), key=lambda item: -item[1])[:top],
+            "retained_generation_bytes": unshared_bytes(retained),
+            "build_bytes": unshared_bytes(building),
+        }
+
+    def acquire_lease(self, name, owner, ttl):
+        with self._lock:
+            now = time.time()
+            lease = self._leases.get(name)
+            if lease is None or lease[0] == owner or lease[1] <= now:
+                self._leases[name] = (owner, now + ttl)
+                return True
+            return False
+
+    def release_lease(self, name, owner):
+        with self._lock:
+            if name in self._leases and self._leases[name][0] == owner:
+                del self._leases[name]
+
+    def get_leases(self):
+        with self._lock:
+            return dict(self._leases)
+
+
+class CacheStoreProxy(DictProxy):
+    _exposed_ = DictProxy._exposed_ + (
+        "lookup",
+        "contains",
+        "get_many",
+        "get_hashes",
+        "apply_batch",
+        "begin_build",
+        "publish_build",
+        "discard_build",
+        "pin_generation",
+        "unpin_generation",
+        "get_generations",
+        "get_changes",
+        "memory_usage",
+        "acquire_lease",
+        "release_lease",
+        "get_leases",
+    )
+
+    def _callmethod(self, methodname, args=(), kwds={}):
+        # SIGALRM (the per-item timeout of the cache updater) is delivered after the round-trip, an exception raised
+        # half way through it would leave the connection to the manager out of sync
+        signal.pthread_sigmask(signal.SIG_BLOCK, {signal.SIGALRM})
+        try:
+            return super()._callmethod(methodname, args, kwds)
+        finally:
+            signal.pthread_sigmask(signal.SIG_UNBLOCK, {signal.SIGALRM})
+
+    def lookup(self, key, generation=None):
+        return self._callmethod("lookup", (key, generation))
+
+    def contains(self, key, generation=None):
+        return self._callmethod("contains", (key, generation))
+
+    def get_many(self, keys, generation=None):
+        return self._callmethod("get_many", (keys, generation))
+
+    def get_hashes(self, keys, generation=None):
+        return self._callmethod("get_hashes", (keys, generation))
+
+    def apply_batch(self, items, dropped_keys, build=None):
+        return self._callmethod("apply_batch", (items, dropped_keys, build))
+
+    def begin_build(self):
+        return self._callmethod("begin_build")
+
+    def publish_build(self, build):
+        return self._callmethod("publish_build", (build,))
+
+    def discard_build(self, build):
+        return self._callmethod("discard_build", (build,))
+
+    def pin_generation(self, reader, ttl):
+        return self._callmethod("pin_generation", (reader, ttl))
+
+    def unpin_generation(self, reader):
+        return self._callmethod("unpin_generation", (reader,))
+
+    def get_generations(self):
+        return self._callmethod("get_generations")
+
+    def get_changes(self, since):
+        return self._callmethod("get_changes", (since,))
+
+    def memory_usage(self, top=20):
+        return self._callmethod("memory_usage", (top,))
+
+    def acquire_lease(self, name, owner, ttl):
+        return self._callmethod("acquire_lease", (name, owner, ttl))
+
+    def release_lease(self, name, owner):
+        return self._callmethod("release_lease", (name, owner))
+
+    def get_leases(self):
+        return self._callmethod("get_leases")
+
+
+class CacheManager(SyncManager):
+    pass
+
+
+CacheManager.register("CacheStore", CacheStore, CacheStoreProxy)
+
+
+class CacheClientManager(BaseManager):
+    pass
+
+
+# served by cache_server.py
+CacheClientManager.register("get_cache_store", proxytype=CacheStoreProxy)
+
+
+# Value of cache_server_authkey in the secrets.toml template, which is not a key
+CACHE_SERVER_AUTHKEY_PLACEHOLDER = "<insert cache server key here>"
+
+
+def check_cache_server_authkey(authkey):
+    """
+    Rejects a missing cache server key. The cache server and its clients exchange pickles, so whoever can reach the
+    server with the key can run code on the cache host and on every replica: there is no default key.
+
+    Parameters:
+        authkey (str): The `cache_server_authkey` config.
+
+    Raises:
+        ValueError: If the key is not set or still the placeholder of the secrets.toml template.
+    """
+    if not authkey or authkey.strip() == CACHE_SERVER_AUTHKEY_PLACEHOLDER:
+        raise ValueError(
+            "cache_server_authkey is not set, set it to a long random secret shared by the cache server and the "
+            "replicas, e.g. python -c 'import secrets; print(secrets.token_hex(32))'"
+        )
+
+
+def parse_cache_server_address(address):
+    """
+    Parses the `cache_server_address` config: 'host:port' for TCP, otherwise the path of a unix socket.
+
+    Parameters:
+        address (str): The address.
+
+    Returns:
+        tuple or str: (host, port) or the socket path.
+    """
+    host, separator, port = address.rpartition(":")
+    if separator and port.isdigit():
+        return host, int(port)
+    return address
+
+
+class LocalCacheBackend:
+    """
+    Cache store in a manager process started by this process and shared with the processes it starts.
+    """
+
+    name = "local"
+
+    def connect(self):
+        manager = CacheManager()
+        manager.start()
+        return manager, manager.CacheStore(
+            change_feed_size=get_app_custom_config("change_feed_size")
+        )
+
+
+class RemoteCacheBackend:
+    """
+    Cache store served by a standalone cache server (cache_server.py) over TCP or a unix socket, shared by every
+    dashboard replica connecting to it.
+    """
+
+    name = "remote"
+
+    def __init__(self, address, authkey):
+        check_cache_server_authkey(authkey)
+        self.address = address
+        self.authkey = authkey
+
+    def connect(self):
+        manager = CacheClientManager(
+            address=parse_cache_server_address(self.address),
+            authkey=self.authkey.encode(),
+        )
+        manager.connect()
+        return manager, manager.get_cache_store()
+
+
+def get_cache_backend():
+    """
+    Returns the cache backend selected by the `cache_backend` config.
+
+    Returns:
+        LocalCacheBackend or RemoteCacheBackend: The backend.
+    """
+    backend = get_app_custom_config("cache_backend")
+    if backend == "local":
+        return LocalCacheBackend()
+    if backend == "remote":
+        return RemoteCacheBackend(
+            get_app_custom_config("cache_server_address"),
+            get_app_custom_config("cache_server_authkey"),
+        )
+    raise ValueError(f"Invalid cache backend {backend}")
+
+
 class CentralCache:
-    # A central cache accessible to all the process leveraging multiprocessing.Manager().dict() for shared caching it
+    # A central cache accessible to all the process leveraging multiprocessing.Manager() for shared caching it
     # Also has an option to set TTL.
+    # Values are serialized (cache_codec) by the writing process and decoded by the reading one.
     cache = None
+    manager = None
     ttl = 3600
+    # Number of round-trips to the manager process made by this process, for load testing
+    proxy_calls = 0
+    # Pending writes of the write batch in progress, per thread
+    _batch = threading.local()
+    # Generation read by the current thread, see pin_generation
+    _reader = threading.local()
 
     @staticmethod
-    def initialise(ttl=3600):
+    def initialise(ttl=3600, backend=None):
         if CentralCache.cache is None:
-            manager = multiprocessing.Manager()
-            CentralCache.cache = manager.dict()
+            if backend is None:
+                backend = get_cache_backend()
+            CentralCache.manager, CentralCache.cache = backend.connect()
             CentralCache.ttl = ttl
-            logger.info("Central cache initialised")
+            logger.info(f"Central cache initialised with {backend.name} backend")
+
+    @staticmethod
+    def _pending():
+        return getattr(CentralCache._batch, "pending", None)
+
+    @staticmethod
+    def _pinned_generation():
+        return getattr(CentralCache._reader, "generation", None)
+
+    @staticmethod
+    def _entry(value, timestamp):
+        encoded = encode(value)
+        value_hash = content_hash(encoded)
+        if isinstance(value, NegativeEntry):
+            value_hash = NEGATIVE_HASH_PREFIX + value_hash
+        return encoded, timestamp, value_hash
 
     @staticmethod
     def set(key, value):
         # key = pickle.dumps(key)
-        timestamp = time.time()
-        CentralCache.cache[key] = (value, timestamp)
+        entry = CentralCache._entry(value, time.time())
+        pending = CentralCache._pending()
+        if pending is not None:
+            pending["items"][key] = entry
+            pending["dropped_keys"].discard(key)
+            return
+        CentralCache.proxy_calls += 1
+        CentralCache.cache.apply_batch({key: entry}, [])
 
     @staticmethod
     def get(key):
         # key = pickle.dumps(key)
-        if CentralCache.exists(key):
-            value, timestamp = CentralCache.cache.get(key)
-            # logger.verbose(f"timestamp: {time.time() - timestamp}")
-            if time.time() - timestamp < CentralCache.ttl:
-                return value
-            else:
-                CentralCache.cache.pop(key)
-                raise CacheExpiredException("Cache expired")
-        raise KeyError("Key Not found")
+        pending = CentralCache._pending()
+        if pending is not None:
+            if key in pending["items"]:
+                return decode(pending["items"][key][0])
+            if key in pending["dropped_keys"]:
+                raise KeyError("Key Not found")
+        CentralCache.proxy_calls += 1
+        entry = CentralCache.cache.lookup(key, CentralCache._pinned_generation())
+        if entry is None:
+            raise KeyError("Key Not found")
+        value, timestamp, _ = entry
+        # logger.verbose(f"timestamp: {time.time() - timestamp}")
+        if time.time() - timestamp < CentralCache.ttl:
+            return decode(value)
+        CentralCache.proxy_calls += 1
+        CentralCache.cache.apply_batch({}, [key])
+        raise CacheExpiredException("Cache expired")
 
     @staticmethod
     def exists(key):
         # key = pickle.dumps(key)
-        return key in CentralCache.cache
+        pending = CentralCache._pending()
+        if pending is not None:
+            if key in pending["items"]:
+                return True
+            if key in pending["dropped_keys"]:
+                return False
+        CentralCache.proxy_calls += 1
+        return CentralCache.cache.contains(key, CentralCache._pinned_generation())
 
     @staticmethod
     def drop(key):
         # key = pickle.dumps(key)
+        pending = CentralCache._pending()
+        if pending is not None:
+            pending["items"].pop(key, None)
+            pending["dropped_keys"].add(key)
+            return
         if CentralCache.exists(key):
-            CentralCache.cache.pop(key)
+            CentralCache.proxy_calls += 1
+            CentralCache.cache.apply_batch({}, [key])
+
+    @staticmethod
+    def acquire_lease(name, owner, ttl):
+        """
+        Acquires (or renews, for its owner) a named lease shared by all the processes using the cache.
 
+        Parameters:
+            name (str): Name of the lease.
+            owner (str): Identifier of the process acquiring it.
+            ttl (float): Seconds after which the lease can be taken over if it is not renewed.
+
+        Returns:
+            bool: True if the owner holds the lease.
+        """
+        CentralCache.proxy_calls += 1
+        return CentralCache.cache.acquire_lease(name, owner, ttl)
+
+    @staticmethod
+    def release_lease(name, owner):
+        CentralCache.proxy_calls += 1
+        CentralCache.cache.release_lease(name, owner)
 
-def cached_with_force_update(maxsize=3000, ttl=3600):
+    @staticmethod
+    def leases():
+        """
+        Returns:
+            dict: Lease name mapped to (owner, expiry timestamp).
+        """
+        CentralCache.proxy_calls += 1
+        return CentralCache.cache.get_leases()
+
+    @staticmethod
+    def get_many(keys, expire=True, pinned=True):
+        """
+        Reads several keys in one round-trip. Expired entries are dropped.
+
+        Parameters:
+            keys (list of str): The keys to read.
+            expire (bool): False to read entries whatever their age, for records that don't expire (e.g. the
+                status of a shard, which must show how stale it is).
+            pinned (bool): False to read the current generation rather than the one pinned by the thread, e.g. for
+                the keys reported by a ChangeFeed, which follows the current generation.
+
+        Returns:
+            dict: The values found, by key.
+        """
+        return {
+            key: value
+            for key, (value, _) in CentralCache.get_many_with_hashes(
+                keys, expire, pinned
+            ).items()
+        }
+
+    @staticmethod
+    def get_many_with_hashes(keys, expire=True, pinned=True):
+        """
+        Reads several keys with the content hashes of their values (see cache_codec.content_hash) in one round-trip.
+        Expired entries are dropped.
+
+        Parameters:
+            keys (list of str): The keys to read.
+            expire (bool): False to read entries whatever their age, see get_many.
+            pinned (bool): False to read the current generation, see get_many.
+
+        Returns:
+            dict: (value, content hash) of the unexpired entries found, by key.
+        """
+        values = {}
+        pending = CentralCache._pending()
+        if pending is not None:
+            values = {
+                key: (decode(pending["items"][key][0]), pending["items"][key][2])
+                for key in keys
+                if key in pending["items"]
+            }
+            keys = [
+                key
+                for key in keys
+                if key not in values and key not in pending["dropped_keys"]
+            ]
+        if not keys:
+            return values
+        CentralCache.proxy_calls += 1
+        entries = CentralCache.cache.get_many(
+            keys, CentralCache._pinned_generation() if pinned else None
+        )
+        now = time.time()
+        expired_keys = []
+        for key, (value, timestamp, value_hash) in entries.items():
+            if not expire or now - timestamp < CentralCache.ttl:
+                values[key] = (decode(value), value_hash)
+            else:
+                expired_keys.append(key)
+        if expired_keys:
+            CentralCache.proxy_calls += 1
+            CentralCache.cache.apply_batch({}, expired_keys)
+        return values
+
+    @staticmethod
+    def get_hashes(keys):
+        """
+        Reads the content hashes of several keys in one round-trip, without transferring their values, e.g. to
+        tell whether a client already has them.
+
+        Parameters:
+            keys (list of str): The keys to read.
+
+        Returns:
+            dict: Content hash of the unexpired entries found, by key. The hashes of NegativeEntry values start with
+            NEGATIVE_HASH_PREFIX.
+        """
+        values = {}
+        pending = CentralCache._pending()
+        if pending is not None:
+            values = {
+                key: pending["items"][key][2] for key in keys if key in pending["items"]
+            }
+            keys = [
+                key
+                for key in keys
+                if key not in values and key not in pending["dropped_keys"]
+            ]
+        if not keys:
+            return values
+        CentralCache.proxy_calls += 1
+        hashes = CentralCache.cache.get_hashes(keys, CentralCache._pinned_generation())
+        now = time.time()
+        values.update(
+            (key, value_hash)
+            for key, (timestamp, value_hash) in hashes.items()
+            if now - timestamp < CentralCache.ttl
+        )
+        return values
+
+    @staticmethod
+    def set_many(items):
+        """
+        Writes several keys in one round-trip.
+
+        Parameters:
+            items (dict): Values by key.
+        """
+        timestamp = time.time()
+        items = {
+            key: CentralCache._entry(value, timestamp) for key, value in items.items()
+        }
+        pending = CentralCache._pending()
+        if pending is not None:
+            pending["items"].update(items)
+            pending["dropped_keys"].difference_update(items)
+            return
+        CentralCache.proxy_calls += 1
+        CentralCache.cache.apply_batch(items, [])
+
+    @staticmethod
+    @contextlib.contextmanager
+    def write_batch(build=None):
+        """
+        Context manager buffering the writes and drops made by the current thread, which are applied in one
+        round-trip on exit (even if the block raises). Reads inside the block see the buffered writes.
+
+        Parameters:
+            build (int): Build (see begin_generation) receiving the writes, instead of the live keys.
+        """
+        if CentralCache._pending() is not None:
+            # already batching, the outer batch applies the writes
+            yield
+            return
+        pending = {"items": {}, "dropped_keys": set()}
+        CentralCache._batch.pending = pending
+        try:
+            yield
+        finally:
+            CentralCache._batch.pending = None
+            if pending["items"] or pending["dropped_keys"]:
+                CentralCache.proxy_calls += 1
+                CentralCache.cache.apply_batch(
+                    pending["items"], list(pending["dropped_keys"]), build
+                )
+
+    @staticmethod
+    def begin_generation():
+        """
+        Starts building a new generation of the cache, for a refresh cycle. Writes made with
+        write_batch(build) are invisible to readers until the build is published.
+
+        Returns:
+            int: The build id.
+        """
+        CentralCache.proxy_calls += 1
+        return CentralCache.cache.begin_build()
+
+    @staticmethod
+    def publish_generation(build):
+        """
+        Atomically publishes a build as the current generation, applied on top of the previous one.
+
+        Parameters:
+            build (int): The build id.
+
+        Returns:
+            int: The number of the new generation.
+        """
+        CentralCache.proxy_calls += 1
+        return CentralCache.cache.publish_build(build)
+
+    @staticmethod
+    def discard_generation(build):
+        CentralCache.proxy_calls += 1
+        CentralCache.cache.discard_build(build)
+
+    @staticmethod
+    def pin_generation(reader, ttl=None):
+        """
+        Pins the current generation for the reads of the current thread, so that a rerun sees the data of a
+        single refresh cycle even if a new one is published meanwhile. A reader holds one pin at most, a new pin
+        replaces its previous one, and pins expire after `ttl` seconds in case they are never released.
+
+        Parameters:
+            reader (str): Identifier of the reader, e.g. the session id.
+            ttl (float): Pin expiry, defaults to the `generation_pin_ttl` config.
+
+        Returns:
+            int: The pinned generation.
+        """
+        CentralCache.proxy_calls += 1
+        generation = CentralCache.cache.pin_generation(
+            reader, ttl or get_app_custom_config("generation_pin_ttl")
+        )
+        CentralCache._reader.generation = generation
+        return generation
+
+    @staticmethod
+    def unpin_generation(reader):
+        """
+        Releases the pin of a reader, the current thread reads the latest generation again.
+        """
+        CentralCache._reader.generation = None
+        CentralCache.proxy_calls += 1
+        CentralCache.cache.unpin_generation(reader)
+
+    @staticmethod
+    def generations():
+        """
+        Returns:
+            dict: Current generation number, key count and pins of every retained generation, builds in progress.
+        """
+        CentralCache.proxy_calls += 1
+        return CentralCache.cache.get_generations()
+
+    @staticmethod
+    def memory_usage(top=20):
+        """
+        Accounts for the memory of the cache, in the process holding it (the manager or the cache server).
+
+        Parameters:
+            top (int): Number of largest keys returned.
+
+        Returns:
+            dict: 'process' (pid, rss_mb and peak_rss_mb of the process holding the cache), 'keys' and 'bytes' of
+            the current values, 'functions' mapping every cached function (or key prefix) to its 'keys', 'bytes'
+            and 'decoded_bytes', 'top_keys' as (key, bytes), and the bytes of the values only held by older
+            generations ('retained_generation_bytes') or builds in progress ('build_bytes').
+        """
+        CentralCache.proxy_calls += 1
+        return CentralCache.cache.memory_usage(top)
+
+    @staticmethod
+    def changes(since=0):
+        """
+        Reads the change feed: writes that changed the content of a key, and drops.
+
+        Parameters:
+            since (int): Sequence number of the last change already seen, None to only get the latest one.
+
+        Returns:
+            tuple: (sequence number of the latest change, list of (sequence number, key, old hash, new hash, time)
+            made after `since`, False if some of them were evicted from the feed).
+        """
+        CentralCache.proxy_calls += 1
+        return CentralCache.cache.get_changes(since)
+
+
+class ChangeFeed:
+    """
+    Subscription to the change feed of the central cache, for the caches derived from its values. Each poll
+    returns the keys changed since the previous one.
+    """
+
+    def __init__(self, prefixes=None):
+        """
+        Parameters:
+            prefixes (tuple of str): Only report keys starting with one of these, e.g. a function name followed by
+                "(" for the results of a cached function. All keys if None.
+        """
+        self.prefixes = prefixes
+        self.since = None
+
+    def poll(self):
+        """
+        Returns:
+            dict or None: Keys changed since the previous poll mapped to their (old hash, new hash), a None hash
+            for an absent key; empty on the first poll. None if changes were missed, in which case everything
+            derived should be invalidated.
+        """
+        since = self.since
+        self.since, changes, complete = CentralCache.changes(since)
+        if since is None:
+            return {}
+        if not complete:
+            return None
+        changed = {}
+        for _, key, old_hash, new_hash, _ in changes:
+            if self.prefixes is None or key.startswith(self.prefixes):
+                changed[key] = (changed.get(key, (old_hash,))[0], new_hash)
+        return changed
+
+
+def make_cache_key(func_name, args):
+    """
+    Builds the CentralCache key under which `cached_with_force_update` stores the result of func_name(*args).
+
+    Parameters:
+        func_name (str): Name of the cached function.
+        args (tuple): Positional arguments of the call.
+
+    Returns:
+        str: The cache key.
+    """
+    return func_name + str(args)
+
+
+class NegativeEntry:
+    """
+    Cached in place of the result of a call that failed, or whose dependencies failed, as the circuit breaker of
+    the function and arguments of its key. While the breaker is open, calls return `value` (None for a failed fetch)
+    without calling the function; the first call after `retry_at` tries again. A breaker opens for
+    `negative_cache_ttl` seconds after a failure, doubling with every consecutive failure up to
+    `negative_cache_max_ttl`.
+    """
+
+    __slots__ = ("value", "error", "failures", "retry_at")
+
+    def __init__(self, value, error, failures, retry_at):
+        self.value = value
+        self.error = error
+        self.failures = failures
+        self.retry_at = retry_at
+
+    @classmethod
+    def after_failure(cls, previous, value, error):
+        failures = previous.failures + 1 if isinstance(previous, NegativeEntry) else 1
+        ttl = min(
+            get_app_custom_config("negative_cache_ttl") * 2 ** (failures - 1),
+            get_app_custom_config("negative_cache_max_ttl"),
+        )
+        return cls(value, str(error), failures, time.time() + ttl)
+
+    @property
+    def is_open(self):
+        return time.time() < self.retry_at
+
+
+# Marker of a key not found in the cache
+_MISSING = object()
+# Marker of a key found in the cache whose value was not read, see cached_call
+_NOT_READ = object()
+# Prefix of the content hash of the NegativeEntry values, which tells them apart without reading them
+NEGATIVE_HASH_PREFIX = "negative:"
+
+# Per thread, one flag per cached call being computed, set when one of its dependencies failed
+_dependency_state = threading.local()
+
+
+def _dependency_failures():
+    if not hasattr(_dependency_state, "failures"):
+        _dependency_state.failures = []
+    return _dependency_state.failures
+
+
+def _mark_dependency_failed():
+    failures = _dependency_failures()
+    if failures:
+        failures[-1] = True
+
+
+def _record_failure(name, args, error):
+    recorded = getattr(_dependency_state, "recorded", None)
+    if recorded is not None:
+        recorded.append((name, args, str(error)))
+
+
+@contextlib.contextmanager
+def recording_failures():
+    """
+    Records the cached calls made in the block (in this thread) that have no good value: the ones that failed,
+    whether the previous value was kept or a NegativeEntry cached, and the ones skipped as their circuit is open.
+
+    Yields:
+        list: (function name, args, error) of every such call, filled as the block runs.
+    """
+    outer = getattr(_dependency_state, "recorded", None)
+    _dependency_state.recorded = recorded = []
+    try:
+        yield recorded
+    finally:
+        _dependency_state.recorded = outer
+        if outer is not None:
+            outer.extend(recorded)
+
+
+def cached_with_force_update(maxsize=3000, ttl=3600, incremental=False):
     """
     Decorator to cache the output of a function, with the option to force an update.
     This is required because in some case we may want to update cache before it expires
 
+    A function signals a failed fetch by raising DataProviderError. The failure is cached as a NegativeEntry, and
+    so is the result of any cached function computed from it, so that broken symbols are not fetched again on
+    every call; a failed update keeps the last good value instead.
+
     Parameters:
         maxsize (int): Maximum size of the cache.
         ttl (int): Time to live for the cache entries in seconds.
+        incremental (bool): Call the function with the value in the cache as its `previous` keyword argument (None
+            if there is none), for the functions that update it instead of computing it again.
     """
 
     def decorator(func):
 
-        def evaluate(cache_key, funct, *args, **kwargs):
+        def read(cache_key):
             try:
-                value = funct(*args, **kwargs)
-                CentralCache.set(cache_key, value)
-                return value
+                return CentralCache.get(cache_key)
+            except (CacheExpiredException, KeyError) as exception:
+                logger.debug(f"{cache_key}: {exception!r}")
+                return _MISSING
+
+        def compute(cache_key, args, kwargs, previous=_MISSING):
+            """
+            Calls the function and caches its result, or a NegativeEntry if it failed.
+            `previous` is the entry in the cache if any, _NOT_READ if there is one that is only read if the call
+            fails.
+            """
+            if incremental:
+                kwargs = dict(
+                    kwargs,
+                    previous=(
+                        None
+                        if previous is _MISSING or isinstance(previous, NegativeEntry)
+                        else previous
+                    ),
+                )
+            failures = _dependency_failures()
+            failures.append(False)
+            error = None
+            try:
+                value = func(*args, **kwargs)
+            except DataProviderError as e:
+                value, error = None, e
             except Exception as e:
                 logger.error(
-                    f"Error in {funct.__name__} with args {args} and {kwargs}: {str(e)}"
+                    f"Error in {func.__name__} with args {args} and {kwargs}: {str(e)}"
                 )
-            return None
+                _record_failure(func.__name__, args, e)
+                return None
+            finally:
+                dependency_failed = failures.pop()
+
+            if error is None and dependency_failed:
+                error = "a dependency failed"
+            if error is None:
+                CentralCache.set(cache_key, value)
+                return value
+
+            _record_failure(func.__name__, args, error)
+            if previous is _NOT_READ:
+                previous = read(cache_key)
+            if previous is not _MISSING and not isinstance(previous, NegativeEntry):
+                logger.warning(
+                    f"Keeping the cached {func.__name__}{args}, its update failed: {error}"
+                )
+                return previous
+            entry = NegativeEntry.after_failure(previous, value, error)
+            logger.warning(
+                f"{func.__name__}{args} failed {entry.failures} time(s), retrying in "
+                f"{entry.retry_at - time.time():.0f}s: {error}"
+            )
+            CentralCache.set(cache_key, entry)
+            _mark_dependency_failed()
+            return value
+
+        def from_cache(cache_key, args, kwargs, previous, force_update):
+            """
+            Returns the value of a call given its entry in the cache (_MISSING if none), computing it if needed.
+            """
+            if isinstance(previous, NegativeEntry):
+                if previous.is_open:
+                    logger.verbose(f"Circuit open for {func.__name__} with args {args}")
+                    _mark_dependency_failed()
+                    _record_failure(func.__name__, args, previous.error)
+                    return previous.value
+            elif previous is not _MISSING and not force_update:
+                logger.verbose(
+                    f"Using Cached values for {func.__name__} with args {args}"
+                )
+                return previous
+
+            if previous is _MISSING and not force_update:
+                logger.debug(
+                    f"Unforced cache update for function: {func.__name__}{args}"
+                )
+            logger.verbose(f"Calculating values for {func.__name__} with args {args}")
+            with tracing.span("compute"):
+                return compute(cache_key, args, kwargs, previous)
 
         @functools.wraps(func)
         def wrapper(*args, **kwargs):
+            with tracing.span(func.__name__):
+                return cached_call(*args, **kwargs)
+
+        def cached_call(*args, **kwargs):
             force_update = kwargs.pop("force_update", False)
-            cache_key = func.__name__ + str(args)
+            cache_key = make_cache_key(func.__name__, args)
 
-            if force_update or not CentralCache.exists(cache_key):
-                if not force_update:
-                    logger.debug(
-                        f"Unforced cache update for function: {func.__name__}{args}"
-                    )
-                CentralCache.drop(cache_key)  # Clear cache entry if forcing update
+            with tracing.span("cache lookup"):
+                if not force_update or incremental:
+                    previous = read(cache_key)
+                else:
+                    # unless the function is incremental, a forced update only needs the previous value if it is a
+                    # NegativeEntry, to check its circuit, or if the update fails, to keep serving it: until then
+                    # only its hash is read
+                    value_hash = CentralCache.get_hashes([cache_key]).get(cache_key)
+                    if value_hash is None:
+                        previous = _MISSING
+                    elif value_hash.startswith(NEGATIVE_HASH_PREFIX):
+                        previous = read(cache_key)
+                    else:
+                        previous = _NOT_READ
+            return from_cache(cache_key, args, kwargs, previous, force_update)
 
-                logger.verbose(
-                    f"Calculating values for {func.__name__} with args {args}"
-                )
-                value = evaluate(cache_key, func, *args, **kwargs)
+        def many(args_list):
+            """
+            Calls the function for every item of args_list, reading all the cached results in one round-trip and
+            writing the missing ones, once computed, in one more.
 
-                # logger.verbose(value)
-                return value
+            Parameters:
+                args_list (list): Positional arguments of each call, a tuple or a single argument.
 
-            else:
-                try:
-                    logger.verbose(
-                        f"Using Cached values for {func.__name__} with args {args}"
-                    )
-                    value = CentralCache.get(cache_key)
-                    # logger.verbose(f"{cache_key} :- {value}")
-                    return value
-                except (CacheExpiredException, KeyError) as exception:
-                    logger.debug(exception)
-                    value = func(*args, **kwargs)
-                    return value
-                except Exception as e:
-                    logger.error(e)
+            Returns:
+                list: The results, in the order of args_list.
+            """
+            with tracing.span(f"{func.__name__}.many"):
+                args_list = [
+                    args if isinstance(args, tuple) else (args,) for args in args_list
+                ]
+                cache_keys = [make_cache_key(func.__name__, args) for args in args_list]
+                with tracing.span("cache lookup"):
+                    cached_values = CentralCache.get_many(cache_keys)
+
+                with CentralCache.write_batch():
+                    return [
+                        from_cache(
+                            cache_key,
+                            args,
+                            {},
+                            cached_values.get(cache_key, _MISSING),
+                            False,
+                        )
+                        for cache_key, args in zip(cache_keys, args_list)
+                    ]
 
+        wrapper.many = many
         return wrapper
 
     return decorator
@@ -0,0 +1,150 @@
+import hashlib
+import logging
+import pickle
+
+import pandas as pd
+
+from utils import get_app_custom_config
+
+# pyarrow is installed with streamlit, but the cache works without it
+try:
+    import pyarrow as pa
+except ImportError:
+    pa = None
+
+logger = logging.getLogger(__name__)
+
+VALUE_FORMATS = ("pickle", "arrow", "raw")
+COMPRESSIONS = ("lz4", "zstd", "none")
+
+
+class EncodedValue:
+    """
+    A cache value serialized by the process writing it. The manager process only stores and sends its bytes, it never
+    unpickles the pandas objects inside, and the value is only decoded by the process reading it.
+
+    kind is "pickle" (pickle protocol 5) or "arrow" (Arrow IPC stream of a DataFrame, compressed per buffer).
+    """
+
+    __slots__ = ("kind", "payload", "size", "compression")
+
+    def __init__(self, kind, payload, size, compression):
+        self.kind = kind
+        self.payload = payload
+        self.size = size  # size of the uncompressed payload
+        self.compression = compression
+
+    @property
+    def nbytes(self):
+        return len(self.payload)
+
+
+def _value_format_and_compression():
+    value_format = get_app_custom_config("cache_value_format")
+    compression = get_app_custom_config("cache_compression")
+    if value_format not in VALUE_FORMATS:
+        raise ValueError(f"Invalid cache value format {value_format}")
+    if compression not in COMPRESSIONS:
+        raise ValueError(f"Invalid cache compression {compression}")
+    if pa is None:
+        # both Arrow IPC and the compression codecs come from pyarrow
+        return ("raw" if value_format == "arrow" else value_format), "none"
+    return value_format, compression
+
+
+def _encode_arrow(frame, compression):
+    table = pa.Table.from_pandas(frame, preserve_index=True)
+    options = pa.ipc.IpcWriteOptions(
+        compression=None if compression == "none" else compression
+    )
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema, options=options) as writer:
+        writer.write_table(table)
+    payload = sink.getvalue().to_pybytes()
+    return EncodedValue("arrow", payload, len(payload), "none")
+
+
+def encode(value):
+    """
+    Serializes a value for the central cache according to the `cache_value_format` and `cache_compression` config.
+    None and scalars are stored as they are.
+
+    Parameters:
+        value: The value to store.
+
+    Returns:
+        EncodedValue or the value itself.
+    """
+    value_format, compression = _value_format_and_compression()
+    if value_format == "raw" or value is None or isinstance(value, (int, float, str)):
+        return value
+    if value_format == "arrow" and isinstance(value, pd.DataFrame):
+        try:
+            return _encode_arrow(value, compression)
+        except (pa.ArrowException, TypeError, ValueError) as e:
+            logger.debug(f"Falling back to pickle, Arrow can't encode the frame: {e}")
+
+    payload = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+    size = len(payload)
+    if compression != "none":
+        payload = pa.compress(payload, codec=compression, asbytes=True)
+    return EncodedValue("pickle", payload, size, compression)
+
+
+def decode(value):
+    """
+    Deserializes a value read from the central cache.
+
+    Parameters:
+        value: EncodedValue or a value stored as it is.
+
+    Returns:
+        The original value.
+    """
+    if not isinstance(value, EncodedValue):
+        return value
+    payload = value.payload
+    if value.compression != "none":
+        payload = pa.decompress(
+            payload, value.size, codec=value.compression, asbytes=True
+        )
+    if value.kind == "arrow":
+        return pa.ipc.open_stream(payload).read_all().to_pandas()
+    return pickle.loads(payload)
+
+
+def content_hash(value):
+    """
+    Hash of the content of a value as stored in the central cache, used to detect writes that change nothing.
+
+    Parameters:
+        value: EncodedValue or a value stored as it is.
+
+    Returns:
+        str: Hex digest.
+    """
+    if isinstance(value, EncodedValue):
+        payload = value.payload
+    else:
+        payload = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+    return hashlib.blake2b(payload, digest_size=16).hexdigest()
+
+
+def stored_size(value):
+    """
+    Bytes held by a value as stored in the central cache: the payload of an EncodedValue, the deep memory usage of
+    pandas objects stored as they are, and the pickled size of other values.
+
+    Parameters:
+        value: EncodedValue or a value stored as it is.
+
+    Returns:
+        tuple: (bytes stored, bytes once decoded), the decoded size being the pickled size for pickled values.
+    """
+    if isinstance(value, EncodedValue):
+        return value.nbytes, value.size
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        size = int(value.memory_usage(deep=True).sum())
+    else:
+        size = len(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+    return size, size
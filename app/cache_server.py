@@ -0,0 +1,68 @@
+import argparse
+import logging
+from multiprocessing.managers import BaseManager
+
+from cacheUtil import (
+    CacheStore,
+    CacheStoreProxy,
+    check_cache_server_authkey,
+    parse_cache_server_address,
+)
+from utils import get_app_custom_config
+
+logger = logging.getLogger(__name__)
+
+
+class CacheServerManager(BaseManager):
+    pass
+
+
+def serve(address, authkey):
+    """
+    Serves one shared cache store to every dashboard replica configured with `cache_backend = 'remote'`.
+    Blocks until the process is terminated.
+
+    Parameters:
+        address (str): 'host:port' to listen on TCP, otherwise the path of a unix socket.
+        authkey (str): Shared secret the clients must present.
+
+    Raises:
+        ValueError: If the key is not set, see check_cache_server_authkey.
+    """
+    check_cache_server_authkey(authkey)
+    store = CacheStore(change_feed_size=get_app_custom_config("change_feed_size"))
+    CacheServerManager.register(
+        "get_cache_store", callable=lambda: store, proxytype=CacheStoreProxy
+    )
+    manager = CacheServerManager(
+        address=parse_cache_server_address(address), authkey=authkey.encode()
+    )
+    server = manager.get_server()
+    logger.info(f"Cache server listening on {address}")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+    )
+    parser = argparse.ArgumentParser(
+        description="Shared cache server for multi-replica deployments"
+    )
+    parser.add_argument(
+        "--address",
+        default=get_app_custom_config("cache_server_address"),
+        help="host:port or unix socket path, defaults to the cache_server_address config",
+    )
+    parser.add_argument(
+        "--authkey",
+        default=get_app_custom_config("cache_server_authkey"),
+        help="defaults to the cache_server_authkey config",
+    )
+    args = parser.parse_args()
+    try:
+        check_cache_server_authkey(args.authkey)
+    except ValueError as e:
+        parser.error(str(e))
+    serve(args.address, args.authkey)
@@ -0,0 +1,184 @@
+"""
+Warms the shared cache out of band: runs the CacheUpdater workload for a set of stocks into the cache server, without
+starting the dashboard, e.g. to pre-warm the cache of a new deployment before it takes traffic or to refresh it from
+cron.
+
+Usage: python app/cache_warmer.py [--count 10 | --all | --symbols AAPL MSFT | --sector 'Energy'] [--workers 8]
+"""
+
+import argparse
+import logging
+import sys
+import time
+
+import numpy as np
+
+from CacheUpdater import CacheUpdater, LAST_REFRESH_KEY
+from cacheUtil import CentralCache, RemoteCacheBackend
+from constituents import get_constituent_index
+from utils import get_app_custom_config
+
+logger = logging.getLogger(__name__)
+
+
+def select_symbols(constituent_index, count=None, sectors=None):
+    """
+    Returns the stocks to warm: the top `count` of every sector (all of them if count is None), once each.
+
+    Parameters:
+        constituent_index (ConstituentIndex): The constituents.
+        count (int): Top stocks per sector, by weight.
+        sectors (list of str): Only the stocks of these sectors, all sectors if None.
+
+    Returns:
+        list: Symbols, in sector order.
+    """
+    unknown = set(sectors or ()) - set(constituent_index.sectors)
+    if unknown:
+        raise ValueError(f"Unknown sectors: {', '.join(sorted(unknown))}")
+    tickers_and_weights = {
+        sector: symbol_and_weight_list
+        for sector, symbol_and_weight_list in constituent_index.tickers_and_weights.items()
+        if sectors is None or sector in sectors
+    }
+    return CacheUpdater(count).symbols_to_update(tickers_and_weights)
+
+
+class Progress:
+    """
+    Prints a line per stock updated, with the throughput so far and the time left, and summarizes the run.
+    """
+
+    def __init__(self, total, quiet=False):
+        self.total = total
+        self.quiet = quiet
+        self.start = time.perf_counter()
+        self.durations = []
+        self.failed = []
+
+    def __call__(self, symbol, result):
+        succeeded, duration, message = result
+        self.durations.append(duration)
+        if not succeeded:
+            self.failed.append(symbol)
+        if self.quiet:
+            return
+        done = len(self.durations)
+        elapsed = time.perf_counter() - self.start
+        rate = done / elapsed if elapsed else 0.0
+        eta = (self.total - done) / rate if rate else 0.0
+        print(
+            f"[{done:>{len(str(self.total))}}/{self.total}] {symbol:<6} "
+            f"{'ok' if succeeded else 'FAILED'} in {duration:.1f}s  "
+            f"({rate:.1f} symbols/s, {eta:.0f}s left)",
+            flush=True,
+        )
+
+    def summary(self):
+        elapsed = time.perf_counter() - self.start
+        lines = [
+            f"Warmed {len(self.durations) - len(self.failed)}/{self.total} symbols in {elapsed:.1f}s: "
+            f"{len(self.durations) / elapsed if elapsed else 0.0:.2f} symbols/s, {len(self.failed)} failed"
+        ]
+        if self.durations:
+            p50, p95, p_max = np.percentile(self.durations, [50, 95, 100])
+            lines.append(
+                f"Per symbol: p50 {p50:.2f}s, p95 {p95:.2f}s, max {p_max:.2f}s"
+            )
+        if self.failed:
+            lines.append(f"Failed: {' '.join(self.failed)}")
+        return "\n".join(lines)
+
+
+def warm(symbols, workers=None, quiet=False):
+    """
+    Updates the cached data of stocks into a new generation of the cache, published once all of them are updated,
+    then records the refresh so that the dashboard replicas consider the cache available.
+
+    Parameters:
+        symbols (list of str): The symbols.
+        workers (int): Number of worker processes, the number of CPUs by default.
+        quiet (bool): Print the summary only.
+
+    Returns:
+        Progress: The outcome of every stock.
+    """
+    progress = Progress(len(symbols), quiet)
+    generation = CacheUpdater(None).update_symbols(
+        symbols, workers=workers, on_result=progress
+    )
+    CentralCache.set(LAST_REFRESH_KEY, time.time())
+    print(f"{progress.summary()}\nPublished generation {generation}")
+    return progress
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.WARNING,
+        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+    )
+    parser = argparse.ArgumentParser(
+        description="Warms the shared cache server with the data of the dashboard"
+    )
+    parser.add_argument(
+        "--address",
+        default=get_app_custom_config("cache_server_address"),
+        help="defaults to the cache_server_address config",
+    )
+    parser.add_argument(
+        "--authkey",
+        default=get_app_custom_config("cache_server_authkey"),
+        help="defaults to the cache_server_authkey config",
+    )
+    selection = parser.add_mutually_exclusive_group()
+    selection.add_argument(
+        "--count",
+        type=int,
+        default=get_app_custom_config("count"),
+        help="top stocks per sector, defaults to the count config",
+    )
+    selection.add_argument(
+        "--all", action="store_true", help="every stock of the sectors"
+    )
+    selection.add_argument("--symbols", nargs="+", metavar="SYMBOL")
+    parser.add_argument(
+        "--sector",
+        action="append",
+        dest="sectors",
+        help="only the stocks of this sector, can be repeated",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        help="worker processes, defaults to the number of CPUs",
+    )
+    parser.add_argument(
+        "--max-failure-rate",
+        type=float,
+        default=0.1,
+        help="exit with status 1 when a larger fraction of the stocks failed",
+    )
+    parser.add_argument(
+        "--quiet", action="store_true", help="print the summary only, e.g. for cron"
+    )
+    args = parser.parse_args()
+    if args.symbols and args.sectors:
+        parser.error("--sector can't be combined with --symbols")
+
+    CentralCache.initialise(backend=RemoteCacheBackend(args.address, args.authkey))
+    if args.symbols:
+        symbols = list(dict.fromkeys(args.symbols))
+    else:
+        constituent_index = get_constituent_index()
+        if constituent_index is None:
+            sys.exit("The S&P 500 constituents could not be loaded")
+        try:
+            symbols = select_symbols(
+                constituent_index, None if args.all else args.count, args.sectors
+            )
+        except ValueError as e:
+            parser.error(str(e))
+
+    progress = warm(symbols, args.workers, args.quiet)
+    if len(progress.failed) > args.max_failure_rate * len(symbols):
+        sys.exit(1)
@@ -5,6 +5,7 @@ industry_dataframe_default_cols = [
     "Name",
     "Weight",
     "Current Price",
+    "Day Change",
     "Price to Earning",
     "Market Capitalization",
     "Dividend Yield",
@@ -22,6 +23,7 @@ industry_dataframe_all_cols = [
     "Weight",
     "Sector",
     "Current Price",
+    "Day Change",  # Live during market hours, see quotes.py
     "Price to Earning",  # Trailing P/E	https://finance.yahoo.com/quote/MSFT/key-statistics
     # PE Ratio(TTM) Earnings per Share(Diluted)
     "Market Capitalization",  # Market Cap https://finance.yahoo.com/quote/MSFT/key-statistics
@@ -49,6 +51,11 @@ stock_dataframe_column_config = {
     "Current Price": st.column_config.NumberColumn(
         "Current Price ($)", format="%.2f", help="Current Price now in USD"
     ),
+    "Day Change": st.column_config.NumberColumn(
+        "Day Change (%)",
+        format="%.2f",
+        help="Change from the previous close, live during market hours",
+    ),
     "Market Capitalization": st.column_config.NumberColumn(
         "Market Cap ($)",
         format="%.2f",
@@ -161,6 +168,32 @@ default_time_periods = {
     "5 Years": "5y",
 }
 
+# windows of the correlation matrices, in trading days
+correlation_windows = {
+    "1 Month": 21,
+    "3 Months": 63,
+    "6 Months": 126,
+    "1 Year": 250,
+}
+
+# history periods of the backtests, the ones up to 5 years are cached by the updater
+backtest_periods = {
+    "6 Months": "6mo",
+    "YTD": "ytd",
+    "1 Year": "1y",
+    "2 Years": "2y",
+    "5 Years": "5y",
+    "10 Years": "10y",
+}
+
+# rebalancing frequencies of the backtests, as pandas periods
+rebalance_frequencies = {
+    "None": None,
+    "Monthly": "M",
+    "Quarterly": "Q",
+    "Annually": "Y",
+}
+
 # available_time_series for plotting
 available_time_series = ["Open", "High", "Low", "Close", "Volume"]
 
@@ -172,4 +205,7 @@ menus = [
     "Metrics",
     "Ratios",
     "Returns",
+    "Correlation",
+    "Backtest",
+    "Admin",
 ]
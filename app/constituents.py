@@ -0,0 +1,177 @@
+import datetime
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+import data_fetch
+from utils import get_app_custom_config
+
+logger = logging.getLogger(__name__)
+
+# Pseudo sector of all the constituents
+ALL_SECTORS = "S&P 500 Index"
+
+
+class ConstituentIndex:
+    """
+    The S&P 500 constituents of a day, precomputed into the structures the app reads them through. It is shared by
+    all the sessions of the process and must not be modified.
+
+    Attributes:
+        as_of (datetime.date): Day of the constituents.
+        symbols (list of str): All the symbols, by decreasing weight.
+        symbol_id (dict): Id of every symbol, its position in `symbols`.
+        sector_of (dict): GICS sector of every symbol.
+        sectors (list of str): ALL_SECTORS followed by the GICS sectors, sorted.
+        sector_symbols (dict): Symbols of every sector (and of ALL_SECTORS), by decreasing weight.
+        sector_weights (dict): Weights (Portfolio%) of the symbols of every sector, as a numpy array.
+        tickers_and_weights (dict): (symbol, weight) of every sector, as returned by
+            data_fetch.get_sector_wise_stock_symbol_and_weight.
+    """
+
+    def __init__(self, constituents, as_of):
+        """
+        Parameters:
+            constituents (list of tuple(str, str, float)): (symbol, sector, weight) of every constituent.
+            as_of (datetime.date): Day of the constituents.
+        """
+        constituents = sorted(constituents, key=lambda constituent: -constituent[2])
+        self.as_of = as_of
+        self.symbols = [symbol for symbol, _, _ in constituents]
+        self.symbol_id = {symbol: i for i, symbol in enumerate(self.symbols)}
+        self.sector_of = {symbol: sector for symbol, sector, _ in constituents}
+        self.sectors = [ALL_SECTORS] + sorted(set(self.sector_of.values()))
+
+        by_sector = {sector: [] for sector in self.sectors}
+        for symbol, sector, weight in constituents:
+            by_sector[ALL_SECTORS].append((symbol, weight))
+            by_sector[sector].append((symbol, weight))
+        self.tickers_and_weights = by_sector
+        self.sector_symbols = {
+            sector: [symbol for symbol, _ in tickers_and_weights]
+            for sector, tickers_and_weights in by_sector.items()
+        }
+        self.sector_weights = {
+            sector: np.array([weight for _, weight in tickers_and_weights])
+            for sector, tickers_and_weights in by_sector.items()
+        }
+
+    @classmethod
+    def from_sector_dict(cls, sector_dict, as_of=None):
+        """
+        Builds the index from the result of data_fetch.get_sector_wise_stock_symbol_and_weight.
+
+        Parameters:
+            sector_dict (dict): Lists of (symbol, weight) by sector, including ALL_SECTORS.
+            as_of (datetime.date): Day of the constituents, defaults to today.
+        """
+        return cls(
+            [
+                (symbol, sector, float(weight))
+                for sector, tickers_and_weights in sector_dict.items()
+                if sector != ALL_SECTORS
+                for symbol, weight in tickers_and_weights
+            ],
+            as_of or datetime.date.today(),
+        )
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as file:
+            stored = json.load(file)
+        return cls(
+            [tuple(constituent) for constituent in stored["constituents"]],
+            datetime.date.fromisoformat(stored["as_of"]),
+        )
+
+    def save(self, path):
+        """
+        Writes the constituents to a JSON file, atomically so that other processes never read a partial file.
+        """
+        stored = {
+            "as_of": self.as_of.isoformat(),
+            "constituents": [
+                (symbol, self.sector_of[symbol], weight)
+                for symbol, weight in self.tickers_and_weights[ALL_SECTORS]
+            ],
+        }
+        directory = os.path.dirname(os.path.abspath(path))
+        with tempfile.NamedTemporaryFile(
+            "w", dir=directory, suffix=".tmp", delete=False
+        ) as file:
+            json.dump(stored, file)
+        os.chmod(file.name, 0o644)
+        os.replace(file.name, path)
+
+
+_index = None
+_next_refresh = 0
+_lock = threading.Lock()
+
+
+def _load_or_refresh(today):
+    """
+    Returns the constituents stored in the `constituents_file`, refreshed from the data sources first if they are
+    not of today. If the refresh fails, the stored constituents are returned as they are (None if there are none).
+    """
+    path = get_app_custom_config("constituents_file")
+    try:
+        stored = ConstituentIndex.load(path)
+    except FileNotFoundError:
+        stored = None
+    except (OSError, ValueError, KeyError) as e:
+        logger.warning(f"Ignoring the unreadable constituents file {path}: {e}")
+        stored = None
+    if stored is not None and stored.as_of == today:
+        return stored
+
+    sector_dict = data_fetch.refresh_sector_wise_stock_symbol_and_weight()
+    if not sector_dict:
+        logger.warning(
+            "Failed to refresh the constituents, keeping the ones of "
+            f"{stored.as_of if stored else 'no day'}"
+        )
+        return stored
+    index = ConstituentIndex.from_sector_dict(sector_dict, today)
+    try:
+        index.save(path)
+    except OSError as e:
+        logger.warning(f"Failed to store the constituents in {path}: {e}")
+    logger.info(f"Constituents refreshed: {len(index.symbols)} symbols")
+    return index
+
+
+def get_constituent_index():
+    """
+    Returns the constituent index of this process, loaded from the `constituents_file` and refreshed once a day
+    from the data sources, which other processes then load from the file. Only the first call of a day costs more
+    than a date comparison; a failed refresh keeps the previous constituents and is retried after
+    `negative_cache_ttl` seconds.
+
+    Returns:
+        ConstituentIndex: The index, None if the constituents could neither be loaded nor fetched.
+    """
+    global _index, _next_refresh
+    today = datetime.date.today()
+    index = _index
+    if index is not None and (index.as_of == today or time.time() < _next_refresh):
+        return index
+    with _lock:
+        if _index is None or (_index.as_of != today and time.time() >= _next_refresh):
+            _index = _load_or_refresh(today) or _index
+            _next_refresh = time.time() + get_app_custom_config("negative_cache_ttl")
+        return _index
+
+
+def set_constituent_index(index):
+    """
+    Replaces the constituent index of this process, e.g. by a harness serving fixture data.
+    """
+    global _index
+    with _lock:
+        _index = index
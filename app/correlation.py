@@ -0,0 +1,304 @@
+import threading
+
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+import streamlit as st
+
+import data_fetch
+import tracing
+from cacheUtil import CentralCache, ChangeFeed, make_cache_key
+from common_data import correlation_windows
+from constituents import get_constituent_index
+
+# History period the daily returns are computed from, covering the longest window
+RETURNS_PERIOD = "1y"
+
+
+def _window_sums(returns, signs=None):
+    """
+    Returns the running sums of a block of daily returns (days x stocks, NaN for no return) from which the
+    pairwise complete statistics of every pair of stocks (a, b) are derived, each a stocks x stocks matrix:
+    'xy' the sum of the products of the returns of a and b, 'x' the sum of the returns of a and 'xx' the sum of
+    their squares on the days b has a return, and 'n' the number of days both have a return.
+
+    Parameters:
+        returns (numpy.ndarray): The block of returns.
+        signs (numpy.ndarray): +1 or -1 per day, to sum the days entering a window and subtract the ones leaving
+            it in one go.
+    """
+    mask = ~np.isnan(returns)
+    values = np.where(mask, returns, 0.0)
+    mask = mask.astype("float64")
+    signed_values, signed_mask = values, mask
+    if signs is not None:
+        signed_values, signed_mask = values * signs[:, None], mask * signs[:, None]
+    return {
+        "xy": signed_values.T @ values,
+        "x": signed_values.T @ mask,
+        "xx": (signed_values * values).T @ mask,
+        "n": signed_mask.T @ mask,
+    }
+
+
+class CorrelationEngine:
+    """
+    Correlation and covariance matrices of the daily returns of a universe of stocks over rolling windows of the
+    latest days. Every window is kept as running sums (see _window_sums) updated with the returns entering and
+    leaving it as the histories gain days, so that any sub-matrix is derived without going over the returns again.
+    Statistics are pairwise complete, over the days both stocks have a return, like pandas.DataFrame.corr.
+    """
+
+    def __init__(self, windows):
+        """
+        Parameters:
+            windows (dict): Window names mapped to their number of days.
+        """
+        self.windows = windows
+        self.symbols = []
+        self.symbol_index = {}
+        self.dates = pd.DatetimeIndex([])
+        # the latest returns, as many days as the longest window
+        self.returns = np.empty((0, 0))
+        self.sums = {}
+        self._closes = {}
+        self._updates = 0
+        self._feed = None
+        self._lock = threading.Lock()
+
+    def _rebuild(self, frame):
+        self.symbols = list(frame.columns)
+        self.symbol_index = {symbol: i for i, symbol in enumerate(self.symbols)}
+        self.dates = frame.index
+        self.returns = frame.to_numpy("float64")
+        self.sums = {
+            days: _window_sums(self.returns[-days:]) for days in self.windows.values()
+        }
+        self._updates = 0
+
+    def update(self, frame):
+        """
+        Brings the windows up to date with the daily returns of the universe: the days appended since the last
+        update enter the windows and the oldest ones leave them. Days whose returns changed (e.g. the provisional
+        return of the current day) are taken out and added again.
+
+        Parameters:
+            frame (pandas.DataFrame): Daily returns indexed by date, one column per stock.
+        """
+        max_days = max(self.windows.values())
+        frame = frame.iloc[-max_days:]
+        if (
+            list(frame.columns) != self.symbols
+            or not len(self.dates)
+            # running sums drift with every update, they are computed again once a longest window went by
+            or self._updates >= max_days
+        ):
+            self._rebuild(frame)
+            return
+
+        # days kept as they are: the leading ones equal in both
+        old = self.returns
+        known = self.dates.isin(frame.index)
+        compared = frame.reindex(self.dates[known]).to_numpy("float64")
+        equal = (
+            (old[known] == compared) | (np.isnan(old[known]) & np.isnan(compared))
+        ).all(axis=1)
+        changed = np.flatnonzero(known)[~equal]
+        keep = changed[0] if len(changed) else len(old)
+        appended = frame[frame.index > self.dates[keep - 1]] if keep else frame
+        new = np.concatenate([old[:keep], appended.to_numpy("float64")])
+
+        for days in self.windows.values():
+            old_start = max(len(old) - days, 0)
+            new_start = max(len(new) - days, 0)
+            positions = np.arange(max(len(old), len(new)))
+            leaving = positions[
+                (positions >= old_start)
+                & (positions < len(old))
+                & ((positions >= keep) | (positions < new_start))
+            ]
+            entering = positions[
+                (positions >= new_start)
+                & (positions < len(new))
+                & ((positions >= keep) | (positions < old_start))
+            ]
+            delta = _window_sums(
+                np.concatenate([new[entering], old[leaving]]),
+                np.repeat([1.0, -1.0], [len(entering), len(leaving)]),
+            )
+            for name, sums in self.sums[days].items():
+                sums += delta[name]
+
+        self.dates = self.dates[:keep].append(appended.index)[-max_days:]
+        self.returns = new[-max_days:]
+        self._updates += len(new) - keep
+
+    def matrix(self, symbols, window, measure="correlation", min_days=None):
+        """
+        Returns the correlation or covariance matrix of the daily returns of stocks over a window.
+
+        Parameters:
+            symbols (list of str): The stocks, the ones outside the universe are left out.
+            window (int): Number of days of the window, one of `windows`.
+            measure (str): 'correlation' or 'covariance'.
+            min_days (int): Fewest days both stocks of a pair must have a return on, half the window by default.
+
+        Returns:
+            pandas.DataFrame: The matrix, NaN for the pairs with too few days.
+        """
+        # under the lock of sync, which the sessions of the process share: the sums are updated in place
+        with self._lock:
+            symbols = [symbol for symbol in symbols if symbol in self.symbol_index]
+            index = [self.symbol_index[symbol] for symbol in symbols]
+            sums = self.sums.get(window)
+            if not index or sums is None:
+                return pd.DataFrame(index=symbols, columns=symbols, dtype="float64")
+            grid = np.ix_(index, index)
+            xy, x, xx, n = (sums[name][grid] for name in ("xy", "x", "xx", "n"))
+        with np.errstate(divide="ignore", invalid="ignore"):
+            covariance = (xy - x * x.T / n) / (n - 1)
+            if measure == "correlation":
+                variance = (xx - x * x / n) / (n - 1)
+                values = covariance / np.sqrt(variance * variance.T)
+            else:
+                values = covariance
+        values[n < (min_days or max(window // 2, 2))] = np.nan
+        return pd.DataFrame(values, index=symbols, columns=symbols)
+
+    def _history_keys(self, symbols):
+        return {
+            make_cache_key(
+                data_fetch.history.__name__, (symbol, RETURNS_PERIOD)
+            ): symbol
+            for symbol in symbols
+        }
+
+    def sync(self, symbols=()):
+        """
+        Loads the closes of the universe (the constituents) from the histories in the cache, then only the histories
+        changed since, and updates the windows. Histories not in the cache are left out, except the ones of `symbols`
+        which are fetched.
+
+        Parameters:
+            symbols (list of str): Stocks that must be part of the universe, e.g. the ones displayed.
+        """
+        with self._lock:
+            if self._feed is None:
+                self._feed = ChangeFeed(prefixes=(f"{data_fetch.history.__name__}(",))
+                self._feed.poll()
+                changes = None
+            else:
+                changes = self._feed.poll()
+
+            constituent_index = get_constituent_index()
+            universe = set(constituent_index.symbols if constituent_index else ())
+            universe.update(self._closes)
+            if changes is None:
+                keys = self._history_keys(universe)
+            else:
+                keys = {
+                    key: symbol
+                    for key, symbol in self._history_keys(universe).items()
+                    if key in changes
+                }
+            # at the current generation, which the feed follows, whatever the generation pinned by the rerun
+            histories = {
+                keys[key]: history
+                for key, history in CentralCache.get_many(
+                    list(keys), pinned=False
+                ).items()
+                if isinstance(history, pd.DataFrame)
+            }
+            missing = [
+                symbol
+                for symbol in symbols
+                if symbol not in self._closes and symbol not in histories
+            ]
+            if missing:
+                histories.update(
+                    zip(
+                        missing,
+                        data_fetch.history.many(
+                            [(symbol, RETURNS_PERIOD) for symbol in missing]
+                        ),
+                    )
+                )
+            closes = {
+                symbol: history["Close"]
+                for symbol, history in histories.items()
+                if history is not None and not history.empty
+            }
+            if not closes and self.symbols:
+                return
+            self._closes.update(closes)
+            if not self._closes:
+                return
+            with tracing.span("update correlations"):
+                frame = pd.concat(self._closes, axis=1).sort_index(axis=1)
+                returns = frame.astype("float64").pct_change(fill_method=None).iloc[1:]
+                self.update(returns)
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def get_correlation_engine():
+    """
+    Returns the correlation engine of this process, shared by its sessions.
+    """
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            _engine = CorrelationEngine(correlation_windows)
+    return _engine
+
+
+def display_correlation(selected_stocks):
+    """
+    Displays the correlation or covariance heatmap of the daily returns of the selected stocks.
+
+    Parameters:
+        selected_stocks (list of str): A list of stock symbols.
+    """
+    if len(selected_stocks) < 2:
+        st.warning("Please select at least two stocks to compare.")
+        return
+
+    col1, col2 = st.columns(2)
+    with col1:
+        window = st.selectbox("Window", correlation_windows.keys())
+    with col2:
+        measure = st.radio(
+            "Measure", ["Correlation", "Covariance"], horizontal=True
+        ).lower()
+
+    engine = get_correlation_engine()
+    with tracing.span("sync"):
+        engine.sync(selected_stocks)
+    matrix = engine.matrix(selected_stocks, correlation_windows[window], measure)
+    if matrix.empty:
+        st.error("Failed to retrieve data for the selected stocks.")
+        return
+
+    with tracing.span("build figure"):
+        fig = go.Figure(
+            go.Heatmap(
+                z=matrix.values,
+                x=matrix.columns,
+                y=matrix.index,
+                zmin=-1 if measure == "correlation" else None,
+                zmax=1 if measure == "correlation" else None,
+                colorscale="RdBu",
+                zmid=0,
+                text=matrix.round(4 if measure == "covariance" else 2).values,
+                texttemplate="%{text}",
+            )
+        )
+        fig.update_layout(
+            title=f"{measure.capitalize()} of Daily Returns, {window}",
+            template="plotly_dark",
+            yaxis_autorange="reversed",
+        )
+    with tracing.span("st.plotly_chart"):
+        st.plotly_chart(fig, use_container_width=True)
@@ -0,0 +1,459 @@
+import argparse
+import datetime
+import hashlib
+import json
+import logging
+import math
+import threading
+import time
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import numpy as np
+import pandas as pd
+
+import data_fetch
+import sharding
+from cacheUtil import CentralCache, NegativeEntry, make_cache_key
+from common_data import default_time_periods
+from constituents import get_constituent_index
+from key_metrics import fetch_key_metrics
+from memory import process_memory
+from ratios import _fetch_financial_ratio_for_single_symbol
+from returns import calculate_returns
+from stock_data import fetch_stock_data
+from utils import get_app_custom_config
+
+# pyarrow is installed with streamlit, Arrow responses are only available with it
+try:
+    import pyarrow as pa
+except ImportError:
+    pa = None
+
+logger = logging.getLogger(__name__)
+
+# Datasets served, by name: the cached function and the query parameters of its arguments after the symbol, with
+# their default values
+DATASETS = {
+    "stock_data": (fetch_stock_data, {}),
+    "key_metrics": (fetch_key_metrics, {}),
+    "returns": (calculate_returns, {}),
+    "ratios": (_fetch_financial_ratio_for_single_symbol, {}),
+    "history": (data_fetch.history, {"period": "1y"}),
+}
+# Values accepted for the query parameters of the datasets: only the ones the dashboard caches, so that requests
+# can't make the API fetch and cache arbitrary data
+PARAMETER_VALUES = {"period": list(default_time_periods.values())}
+MAX_BATCH_SYMBOLS = 500
+ARROW_CONTENT_TYPE = "application/vnd.apache.arrow.stream"
+METRICS_CONTENT_TYPE = "text/plain; version=0.0.4"
+
+# (time, result) of the last CentralCache.memory_usage, see cached_memory_usage
+_memory_usage = (0.0, None)
+_memory_usage_lock = threading.Lock()
+
+
+def to_json_compatible(value):
+    """
+    Converts a cached value into JSON types: DataFrames into {"columns", "index", "data"}, Series into dicts,
+    dates into ISO strings and NaN into null.
+    """
+    if isinstance(value, pd.DataFrame):
+        return json.loads(value.to_json(orient="split", date_format="iso"))
+    if isinstance(value, pd.Series):
+        return to_json_compatible(value.to_dict())
+    if isinstance(value, dict):
+        return {
+            (key.isoformat() if hasattr(key, "isoformat") else str(key)): (
+                to_json_compatible(item)
+            )
+            for key, item in value.items()
+        }
+    if isinstance(value, (list, tuple)):
+        return [to_json_compatible(item) for item in value]
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, float) and not math.isfinite(value):
+        return None
+    if isinstance(value, (datetime.date, pd.Timestamp)):
+        return value.isoformat()
+    return value
+
+
+def to_frame(values):
+    """
+    Converts the cached values of several symbols into one DataFrame with a 'Symbol' column, for Arrow: one row per
+    symbol for the values that are dicts of scalars, otherwise the rows of every symbol's frame.
+
+    Parameters:
+        values (dict): Cached values by symbol.
+
+    Returns:
+        pandas.DataFrame: The frame.
+    """
+    frames = {}
+    for symbol, value in values.items():
+        if isinstance(value, dict) and not any(
+            isinstance(item, pd.Series) for item in value.values()
+        ):
+            frames[symbol] = pd.DataFrame([value]).drop(
+                columns="Symbol", errors="ignore"
+            )
+        else:
+            frames[symbol] = pd.DataFrame(value).rename_axis("Date").reset_index()
+    frame = pd.concat(frames, names=["Symbol", None]).reset_index(level=0)
+    return frame.reset_index(drop=True)
+
+
+def to_arrow(frame):
+    table = pa.Table.from_pandas(frame, preserve_index=False)
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+def entity_tag(dataset, response_format, hashes):
+    """
+    ETag of a response: a digest of the content hashes of the cache entries it is made of, so that it changes
+    only when their values do (a refresh rewriting the same values keeps it).
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(f"{dataset}:{response_format}".encode())
+    for value_hash in hashes:
+        digest.update(value_hash.encode())
+    return f'"{digest.hexdigest()}"'
+
+
+def _gauge(name, help_text, samples):
+    """
+    Returns the lines of a gauge in the Prometheus text format.
+
+    Parameters:
+        name (str): Metric name.
+        help_text (str): Description of the metric.
+        samples (list): (labels dict, value) of every sample.
+    """
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} gauge"]
+    for labels, value in samples:
+        label_text = ",".join(
+            f'{label}="{json.dumps(str(label_value))[1:-1]}"'
+            for label, label_value in labels.items()
+        )
+        lines.append(f"{name}{{{label_text}}} {value}")
+    return lines
+
+
+def cached_memory_usage():
+    """
+    Returns CentralCache.memory_usage, which walks the whole cache, computed at most once every
+    `metrics_cache_seconds` seconds however often the metrics are scraped. Concurrent scrapes wait for the walk in
+    progress rather than starting their own.
+    """
+    global _memory_usage
+    with _memory_usage_lock:
+        timestamp, usage = _memory_usage
+        if usage is None or time.time() - timestamp >= get_app_custom_config(
+            "metrics_cache_seconds"
+        ):
+            usage = CentralCache.memory_usage(top=0)
+            _memory_usage = (time.time(), usage)
+        return usage
+
+
+def memory_metrics():
+    """
+    Returns the memory of the deployment in the Prometheus text format: the RSS of this process, of the process
+    holding the cache and of every live updater node and its workers (as last reported by the node), and the memory
+    of the cache contents per function.
+
+    Returns:
+        str: The metrics.
+    """
+    usage = cached_memory_usage()
+    nodes = sharding.node_memory()
+    rss_samples = [
+        ({"process": "data_api"}, process_memory()["rss_mb"]),
+        ({"process": "cache"}, usage["process"]["rss_mb"]),
+    ]
+    rss_samples.extend(
+        ({"process": "updater_node", "node": node}, record["rss_mb"])
+        for node, record in nodes.items()
+    )
+    lines = _gauge(
+        "stock_dashboard_process_rss_bytes",
+        "Resident memory of the processes of the deployment",
+        [(labels, round((rss_mb or 0) * 2**20)) for labels, rss_mb in rss_samples],
+    )
+    lines += _gauge(
+        "stock_dashboard_updater_workers",
+        "Updater worker processes of every updater node",
+        [({"node": node}, len(record["workers"])) for node, record in nodes.items()],
+    )
+    lines += _gauge(
+        "stock_dashboard_updater_workers_rss_bytes",
+        "Resident memory of the updater workers of every updater node",
+        [
+            (
+                {"node": node},
+                round(sum(filter(None, record["workers"].values())) * 2**20),
+            )
+            for node, record in nodes.items()
+        ],
+    )
+    for name, help_text, column in (
+        ("stock_dashboard_cache_keys", "Keys in the cache per function", "keys"),
+        (
+            "stock_dashboard_cache_bytes",
+            "Bytes stored in the cache per function",
+            "bytes",
+        ),
+        (
+            "stock_dashboard_cache_decoded_bytes",
+            "Bytes of the cache values of every function once decoded",
+            "decoded_bytes",
+        ),
+    ):
+        lines += _gauge(
+            name,
+            help_text,
+            [
+                ({"function": function}, values[column])
+                for function, values in usage["functions"].items()
+            ],
+        )
+    lines += _gauge(
+        "stock_dashboard_cache_retained_bytes",
+        "Bytes of the cache values only held by older generations or builds in progress",
+        [
+            ({"holder": "generations"}, usage["retained_generation_bytes"]),
+            ({"holder": "builds"}, usage["build_bytes"]),
+        ],
+    )
+    return "\n".join(lines) + "\n"
+
+
+class DataApiHandler(BaseHTTPRequestHandler):
+    """
+    Routes:
+        GET /metrics: memory metrics in the Prometheus text format, see memory_metrics.
+        GET /v1: the datasets.
+        GET /v1/<dataset>/<symbol>: the value of one symbol.
+        GET /v1/<dataset>?symbols=A,B: the values of several symbols; POST /v1/<dataset> takes {"symbols": [...]}.
+    Dataset arguments are query parameters (e.g. period for history), and format=arrow (or an Accept header of
+    ARROW_CONTENT_TYPE) returns an Arrow IPC stream instead of JSON. Responses carry an ETag, and requests with a
+    matching If-None-Match are answered 304 after reading the content hashes only.
+    """
+
+    server_version = "StockDashboardDataAPI/1.0"
+
+    def log_message(self, format, *args):
+        logger.debug(format, *args)
+
+    def send_json(self, status, body, headers=None):
+        self.send_body(status, json.dumps(body).encode(), "application/json", headers)
+
+    def send_body(self, status, body, content_type, headers=None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        self.handle_request()
+
+    def do_POST(self):
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+            body = json.loads(self.rfile.read(length) or b"{}")
+            symbols = body["symbols"]
+        except (ValueError, KeyError, TypeError):
+            self.send_json(
+                HTTPStatus.BAD_REQUEST, {"error": 'Expected {"symbols": [...]}'}
+            )
+            return
+        self.handle_request(symbols)
+
+    def handle_request(self, posted_symbols=None):
+        url = urlsplit(self.path)
+        query = {name: values[-1] for name, values in parse_qs(url.query).items()}
+        parts = [part for part in url.path.split("/") if part]
+        if parts == ["metrics"]:
+            self.send_body(
+                HTTPStatus.OK, memory_metrics().encode(), METRICS_CONTENT_TYPE
+            )
+            return
+        if parts == ["v1"]:
+            self.send_json(
+                HTTPStatus.OK,
+                {name: list(params) for name, (_, params) in DATASETS.items()},
+            )
+            return
+        if len(parts) not in (2, 3) or parts[0] != "v1" or parts[1] not in DATASETS:
+            self.send_json(HTTPStatus.NOT_FOUND, {"error": "Unknown dataset"})
+            return
+
+        dataset = parts[1]
+        func, params = DATASETS[dataset]
+        if len(parts) == 3:
+            symbols, single = [parts[2]], True
+        else:
+            symbols = posted_symbols or [
+                symbol for symbol in query.get("symbols", "").split(",") if symbol
+            ]
+            single = False
+        if not symbols or len(symbols) > MAX_BATCH_SYMBOLS:
+            self.send_json(
+                HTTPStatus.BAD_REQUEST,
+                {"error": f"Expected 1 to {MAX_BATCH_SYMBOLS} symbols"},
+            )
+            return
+        constituent_index = get_constituent_index()
+        if constituent_index is None:
+            self.send_json(
+                HTTPStatus.SERVICE_UNAVAILABLE,
+                {"error": "The constituents could not be loaded"},
+            )
+            return
+        unknown = [
+            symbol for symbol in symbols if symbol not in constituent_index.symbol_id
+        ]
+        if unknown:
+            self.send_json(
+                HTTPStatus.NOT_FOUND if single else HTTPStatus.BAD_REQUEST,
+                {"error": f"Not S&P 500 constituents: {','.join(unknown)}"},
+            )
+            return
+        for name, default in params.items():
+            if query.get(name, default) not in PARAMETER_VALUES[name]:
+                self.send_json(
+                    HTTPStatus.BAD_REQUEST,
+                    {
+                        "error": f"Expected {name} to be one of "
+                        f"{', '.join(PARAMETER_VALUES[name])}"
+                    },
+                )
+                return
+        response_format = (
+            "arrow"
+            if query.get("format") == "arrow"
+            or ARROW_CONTENT_TYPE in self.headers.get("Accept", "")
+            else "json"
+        )
+        if response_format == "arrow" and pa is None:
+            self.send_json(
+                HTTPStatus.NOT_ACCEPTABLE, {"error": "Arrow is not available"}
+            )
+            return
+
+        args_list = [
+            (symbol, *(query.get(name, default) for name, default in params.items()))
+            for symbol in symbols
+        ]
+        keys = [make_cache_key(func.__name__, args) for args in args_list]
+
+        if_none_match = self.headers.get("If-None-Match")
+        if if_none_match:
+            hashes = CentralCache.get_hashes(keys)
+            if len(hashes) == len(keys) and if_none_match == entity_tag(
+                dataset, response_format, [hashes[key] for key in keys]
+            ):
+                self.send_response(HTTPStatus.NOT_MODIFIED)
+                self.send_header("ETag", if_none_match)
+                self.end_headers()
+                return
+
+        entries = read_entries(func, args_list, keys)
+        values = {
+            symbol: entries[key][0]
+            for symbol, key in zip(symbols, keys)
+            if key in entries
+        }
+        missing = [symbol for symbol in symbols if symbol not in values]
+        headers = {}
+        if not missing:
+            headers["ETag"] = entity_tag(
+                dataset, response_format, [entries[key][1] for key in keys]
+            )
+        if single and missing:
+            self.send_json(
+                HTTPStatus.NOT_FOUND, {"error": f"No {dataset} for {symbols[0]}"}
+            )
+        elif response_format == "arrow":
+            try:
+                body = to_arrow(to_frame(values)) if values else b""
+            except (pa.ArrowException, ValueError, TypeError) as e:
+                self.send_json(
+                    HTTPStatus.NOT_ACCEPTABLE,
+                    {"error": f"{dataset} can't be served as Arrow: {e}"},
+                )
+                return
+            if missing:
+                headers["X-Missing-Symbols"] = ",".join(missing)
+            self.send_body(HTTPStatus.OK, body, ARROW_CONTENT_TYPE, headers)
+        elif single:
+            self.send_json(
+                HTTPStatus.OK, to_json_compatible(values[symbols[0]]), headers
+            )
+        else:
+            self.send_json(
+                HTTPStatus.OK,
+                {"data": to_json_compatible(values), "missing": missing},
+                headers,
+            )
+
+
+def read_entries(func, args_list, keys):
+    """
+    Reads the cached values of a function with their content hashes, computing (and caching) the missing ones.
+
+    Returns:
+        dict: (value, content hash) by key, without the calls that failed.
+    """
+    entries = CentralCache.get_many_with_hashes(keys)
+    missing = [args for key, args in zip(keys, args_list) if key not in entries]
+    if missing:
+        func.many(missing)
+        entries.update(
+            CentralCache.get_many_with_hashes(
+                [make_cache_key(func.__name__, args) for args in missing]
+            )
+        )
+    return {
+        key: entry
+        for key, entry in entries.items()
+        if not isinstance(entry[0], NegativeEntry) and entry[0] is not None
+    }
+
+
+def serve(host, port):
+    """
+    Serves the cached datasets over HTTP until the process is terminated.
+    """
+    CentralCache.initialise()
+    if get_app_custom_config("cache_backend") == "local":
+        logger.warning(
+            "The cache backend is local, the API does not share the cache of the dashboard: "
+            "set cache_backend = 'remote' and run cache_server.py"
+        )
+    server = ThreadingHTTPServer((host, port), DataApiHandler)
+    logger.info(f"Data API listening on http://{host}:{port}/v1")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+    )
+    parser = argparse.ArgumentParser(
+        description="HTTP API serving the datasets of the dashboard from the shared cache"
+    )
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8600)
+    args = parser.parse_args()
+    serve(args.host, args.port)
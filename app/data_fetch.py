@@ -1,11 +1,15 @@
 import logging
-from io import StringIO
+import pickle
+from collections import namedtuple
 
+import numpy as np
 import pandas as pd
 import requests
-import yfinance as yf
 
 from cacheUtil import cached_with_force_update
+from common_data import available_time_series, default_time_periods
+from data_provider import get_data_provider
+from utils import get_app_custom_config, DataProviderError
 
 logger = logging.getLogger(__name__)
 
@@ -19,15 +23,14 @@ def get_tickers_sector():
         pandas.DataFrame: DataFrame indexed by 'Symbol' with a column for 'GICS Sector'.
 
     Raises:
-        Exception: Raises an exception if the data cannot be fetched or parsed.
+        DataProviderError: If the data cannot be fetched or parsed.
     """
     try:
-        url = "https://en.wikipedia.org/wiki/List_of_S%26P_500_companies"
-        data = pd.read_html(url)[0]
-        tickers_sector = data[["Symbol", "GICS Sector"]].set_index("Symbol")
+        tickers_sector = get_data_provider().tickers_sector()
         return tickers_sector
     except Exception as e:
         logger.error(f"Failed to fetch or parse ticker data from Wikipedia: {e}")
+        raise DataProviderError(e) from e
 
 
 @cached_with_force_update()
@@ -39,19 +42,17 @@ def get_tickers_weight():
         pandas.DataFrame: DataFrame indexed by 'Symbol' with a column for 'Portfolio%'.
 
     Raises:
-        Exception: Raises an exception if the data cannot be fetched or parsed.
+        DataProviderError: If the data cannot be fetched or parsed.
     """
     try:
-        url = "https://www.slickcharts.com/sp500"
-        headers = {"User-Agent": "PostmanRuntime/7.38.0"}
-        response = requests.get(url, headers=headers)
-        data = pd.read_html(StringIO(response.text))[0]
-        tickers_weight = data[["Symbol", "Weight"]].set_index("Symbol")
+        tickers_weight = get_data_provider().tickers_weight()
         return tickers_weight
     except requests.RequestException as e:
         logger.error(f"HTTP error occurred: {e}")
+        raise DataProviderError(e) from e
     except ValueError as e:
         logger.error(f"Error parsing the HTML: {e}")
+        raise DataProviderError(e) from e
 
 
 @cached_with_force_update()
@@ -116,6 +117,113 @@ def get_sector_wise_stock_symbol_and_weight():
         )
 
 
+def refresh_sector_wise_stock_symbol_and_weight():
+    """
+    Scrapes the sectors and weights of the S&P 500 companies again, bypassing the entries cached within the last
+    hour, and updates the cached `get_sector_wise_stock_symbol_and_weight` with them. A scrape that fails keeps the
+    last one cached.
+
+    Returns:
+        dict: A dictionary with sectors as keys and lists of tuples (Symbol, Weight) as values, None if it failed.
+    """
+    get_tickers_sector(force_update=True)
+    get_tickers_weight(force_update=True)
+    return get_sector_wise_stock_symbol_and_weight(force_update=True)
+
+
+# Columns of the history frames as returned by yfinance, the lean frames only keep available_time_series
+HISTORY_COLUMNS = [
+    "Open",
+    "High",
+    "Low",
+    "Close",
+    "Volume",
+    "Dividends",
+    "Stock Splits",
+]
+# Largest price for which float32 still resolves cents (2**24 / 100)
+FLOAT32_MAX_CENT_PRICE = 2**24 / 100
+
+
+def lean_history_frame(data, precision=None):
+    """
+    Normalizes a yfinance history frame into the lean schema cached by `history`: only the OHLCV columns the app
+    uses, prices as float32 (or float64, see the `history_precision` config), volume as uint32 (uint64 if it doesn't
+    fit, 0 where missing) and a timezone-naive date index.
+
+    Parameters:
+        data (pandas.DataFrame): History frame as returned by yfinance.
+        precision (str): 'float32', 'float64' or 'auto' (float32 unless a price is too large to keep its cents),
+            defaults to the `history_precision` config.
+
+    Returns:
+        pandas.DataFrame: The lean frame.
+    """
+    if data is None or data.empty:
+        return data
+    if precision is None:
+        precision = get_app_custom_config("history_precision")
+    prices = [col for col in available_time_series if col != "Volume"]
+    lean = data[available_time_series]
+    if precision == "auto":
+        precision = (
+            "float32"
+            if lean[prices].max().max() < FLOAT32_MAX_CENT_PRICE
+            else "float64"
+        )
+    # volume is missing for provisional or halted bars
+    volume = lean["Volume"].fillna(0)
+    volume_dtype = "uint32" if volume.max() <= np.iinfo(np.uint32).max else "uint64"
+    lean = lean.assign(Volume=volume).astype(
+        {**{col: precision for col in prices}, "Volume": volume_dtype}
+    )
+    if isinstance(lean.index, pd.DatetimeIndex) and lean.index.tz is not None:
+        lean.index = lean.index.tz_localize(None)
+    lean.index.name = "Date"
+    return lean
+
+
+def history_footprint_report(symbols, periods=None):
+    """
+    Reports the memory of the cached lean history frames against the yfinance schema they replace
+    (seven float64/int64 columns and a datetime64 index).
+
+    Parameters:
+        symbols (list of str): The symbols to report on.
+        periods (list of str): History periods, defaults to the periods cached by the updater.
+
+    Returns:
+        pandas.DataFrame: Rows, original bytes, lean bytes and bytes saved per symbol, with a total row.
+    """
+    if periods is None:
+        periods = list(default_time_periods.values())
+    frames = history.many(
+        [(symbol, period) for symbol in symbols for period in periods]
+    )
+    report = {}
+    for i, symbol in enumerate(symbols):
+        symbol_frames = [
+            frame
+            for frame in frames[i * len(periods) : (i + 1) * len(periods)]
+            if frame is not None
+        ]
+        rows = sum(len(frame) for frame in symbol_frames)
+        lean_bytes = sum(
+            int(frame.memory_usage(index=True, deep=True).sum())
+            for frame in symbol_frames
+        )
+        original_bytes = rows * 8 * (len(HISTORY_COLUMNS) + 1)
+        report[symbol] = {
+            "Rows": rows,
+            "Original Bytes": original_bytes,
+            "Lean Bytes": lean_bytes,
+            "Bytes Saved": original_bytes - lean_bytes,
+        }
+    report = pd.DataFrame.from_dict(report, orient="index")
+    report.loc["Total"] = report.sum()
+    return report
+
+
 @cached_with_force_update()
 def history(symbol, period):
     """
@@ -126,15 +234,96 @@ def history(symbol, period):
         period (str): The period over which historical data is requested (e.g., '1mo', '1y').
 
     Returns:
-        DataFrame: Historical stock data as a DataFrame.
+        DataFrame: Historical stock data as a DataFrame, in the lean schema of lean_history_frame.
+
+    Raises:
+        DataProviderError: If the data cannot be retrieved, including no data at all (unknown or delisted symbol).
     """
     try:
-        symbol = symbol.replace(".", "-")
-        return yf.Ticker(symbol).history(period)
+        data = get_data_provider().history(symbol, period)
+        if data is None or data.empty:
+            raise ValueError("no price data")
+        return lean_history_frame(data)
     except Exception as e:
         logging.error(
             f"Failed to fetch historical data for {symbol} over {period}: {e}"
         )
+        raise DataProviderError(e) from e
+
+
+# Fields of the yfinance `info` dict read by the app, out of the well over a hundred it carries
+INFO_FIELDS = (
+    "shortName",
+    "sector",
+    "previousClose",
+    "trailingPE",
+    "forwardPE",
+    "marketCap",
+    "dividendYield",
+    "earningsQuarterlyGrowth",
+    "revenueGrowth",
+    "debtToEquity",
+    "returnOnEquity",
+    "returnOnAssets",
+    "priceToBook",
+    "priceToSalesTrailing12Months",
+    "sharesOutstanding",
+    "trailingEps",
+    "pegRatio",
+    "enterpriseToRevenue",
+    "totalDebt",
+    "currentRatio",
+)
+_INFO_FIELD_INDEX = {field: i for i, field in enumerate(INFO_FIELDS)}
+
+
+class InfoRecord(namedtuple("InfoRecord", INFO_FIELDS)):
+    """
+    The INFO_FIELDS of a yfinance `info` dict, read like the dict with `get`. Being a tuple it pickles as its values
+    alone, without the field names, and without the fields the app never reads.
+    """
+
+    __slots__ = ()
+
+    @classmethod
+    def from_info(cls, info):
+        """
+        Parameters:
+            info (dict): A yfinance `info` dict, or an InfoRecord.
+        """
+        return cls._make(info.get(field) for field in INFO_FIELDS)
+
+    def get(self, field, default=None):
+        index = _INFO_FIELD_INDEX.get(field)
+        return default if index is None else self[index]
+
+
+def info_footprint_report(symbols):
+    """
+    Reports the pickled size of the `info` dicts of the data provider against the InfoRecords cached in their
+    place.
+
+    Parameters:
+        symbols (list of str): The symbols to report on.
+
+    Returns:
+        pandas.DataFrame: Dict bytes, record bytes and bytes saved per symbol, with a total row.
+    """
+    report = {}
+    for symbol in symbols:
+        raw = get_data_provider().info(symbol)
+        dict_bytes = len(pickle.dumps(raw, protocol=pickle.HIGHEST_PROTOCOL))
+        record_bytes = len(
+            pickle.dumps(InfoRecord.from_info(raw), protocol=pickle.HIGHEST_PROTOCOL)
+        )
+        report[symbol] = {
+            "Dict Bytes": dict_bytes,
+            "Record Bytes": record_bytes,
+            "Bytes Saved": dict_bytes - record_bytes,
+        }
+    report = pd.DataFrame.from_dict(report, orient="index")
+    report.loc["Total"] = report.sum()
+    return report
 
 
 @cached_with_force_update()
@@ -146,13 +335,16 @@ def info(symbol):
         symbol (str): The stock symbol.
 
     Returns:
-        dict: A dictionary containing various pieces of financial information about the stock.
+        InfoRecord: The fields of the stock's `info` used by the app, read like a dict with `get`.
+
+    Raises:
+        DataProviderError: If the data cannot be retrieved.
     """
     try:
-        symbol = symbol.replace(".", "-")
-        return yf.Ticker(symbol).info
+        return InfoRecord.from_info(get_data_provider().info(symbol))
     except Exception as e:
         logging.error(f"Failed to fetch info for {symbol}: {e}")
+        raise DataProviderError(e) from e
 
 
 @cached_with_force_update()
@@ -167,16 +359,16 @@ def annual_financials(symbol):
         DataFrame: Annual financial data.
 
     Raises:
-        ValueError: If an invalid symbol is provided or data cannot be retrieved.
+        DataProviderError: If an invalid symbol is provided or data cannot be retrieved.
     """
     try:
-        symbol = symbol.replace(".", "-")
-        data = yf.Ticker(symbol).financials
+        data = get_data_provider().annual_financials(symbol)
         if data.empty:
             logger.warning(f"No financial data found for {symbol}.")
         return data
     except Exception as e:
         logger.error(f"Failed to fetch annual financials for {symbol}: {str(e)}")
+        raise DataProviderError(e) from e
 
 
 @cached_with_force_update()
@@ -191,16 +383,16 @@ def annual_balance_sheet(symbol):
         DataFrame: Annual balance sheet data.
 
     Raises:
-        ValueError: If an invalid symbol is provided or data cannot be retrieved.
+        DataProviderError: If an invalid symbol is provided or data cannot be retrieved.
     """
     try:
-        symbol = symbol.replace(".", "-")
-        data = yf.Ticker(symbol).balance_sheet
+        data = get_data_provider().annual_balance_sheet(symbol)
         if data.empty:
             logger.warning(f"No balance sheet data found for {symbol}.")
         return data
     except Exception as e:
         logger.error(f"Failed to fetch annual balance sheet for {symbol}: {str(e)}")
+        raise DataProviderError(e) from e
 
 
 @cached_with_force_update()
@@ -215,16 +407,16 @@ def quarterly_financials(symbol):
         DataFrame: Quarterly financial data.
 
     Raises:
-        ValueError: If an invalid symbol is provided or data cannot be retrieved.
+        DataProviderError: If an invalid symbol is provided or data cannot be retrieved.
     """
     try:
-        symbol = symbol.replace(".", "-")
-        data = yf.Ticker(symbol).quarterly_financials
+        data = get_data_provider().quarterly_financials(symbol)
         if data.empty:
             logger.warning(f"No quarterly financial data found for {symbol}.")
         return data
     except Exception as e:
         logger.error(f"Failed to fetch quarterly financials for {symbol}: {str(e)}")
+        raise DataProviderError(e) from e
 
 
 @cached_with_force_update()
@@ -239,13 +431,13 @@ def quarterly_balance_sheet(symbol):
         DataFrame: Quarterly balance sheet data.
 
     Raises:
-        ValueError: If an invalid symbol is provided or data cannot be retrieved.
+        DataProviderError: If an invalid symbol is provided or data cannot be retrieved.
     """
     try:
-        symbol = symbol.replace(".", "-")
-        data = yf.Ticker(symbol).quarterly_balance_sheet
+        data = get_data_provider().quarterly_balance_sheet(symbol)
         if data.empty:
             logger.warning(f"No quarterly balance sheet data found for {symbol}.")
         return data
     except Exception as e:
         logger.error(f"Failed to fetch quarterly balance sheet for {symbol}: {str(e)}")
+        raise DataProviderError(e) from e
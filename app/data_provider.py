@@ -0,0 +1,282 @@
+import logging
+import os
+import pickle
+import random
+import time
+from io import StringIO
+
+import pandas as pd
+import requests
+import yfinance as yf
+
+from utils import get_app_custom_config, DataProviderError
+
+logger = logging.getLogger(__name__)
+
+
+class DataProvider:
+    """
+    Source of the raw market data used by data_fetch. Every method returns the data in the shape yfinance (or the
+    constituent tables scraped from Wikipedia and SlickCharts) returns it, and raises on failure.
+    """
+
+    name = None
+
+    def tickers_sector(self):
+        """
+        Returns:
+            pandas.DataFrame: S&P 500 constituents indexed by 'Symbol' with a 'GICS Sector' column.
+        """
+        raise NotImplementedError
+
+    def tickers_weight(self):
+        """
+        Returns:
+            pandas.DataFrame: S&P 500 constituents indexed by 'Symbol' with a 'Weight' column such as '6.52%'.
+        """
+        raise NotImplementedError
+
+    def history(self, symbol, period):
+        raise NotImplementedError
+
+    def info(self, symbol):
+        raise NotImplementedError
+
+    def annual_financials(self, symbol):
+        raise NotImplementedError
+
+    def annual_balance_sheet(self, symbol):
+        raise NotImplementedError
+
+    def quarterly_financials(self, symbol):
+        raise NotImplementedError
+
+    def quarterly_balance_sheet(self, symbol):
+        raise NotImplementedError
+
+    def quotes(self, symbols):
+        """
+        Returns:
+            pandas.DataFrame: Latest 'price' and the 'previous_close' of the symbols, indexed by symbol.
+        """
+        raise NotImplementedError
+
+
+class YFinanceProvider(DataProvider):
+    """
+    Live data from Yahoo Finance through yfinance, constituents from Wikipedia and SlickCharts.
+    """
+
+    name = "yfinance"
+
+    @staticmethod
+    def _ticker(symbol):
+        return yf.Ticker(symbol.replace(".", "-"))
+
+    def tickers_sector(self):
+        url = "https://en.wikipedia.org/wiki/List_of_S%26P_500_companies"
+        data = pd.read_html(url)[0]
+        return data[["Symbol", "GICS Sector"]].set_index("Symbol")
+
+    def tickers_weight(self):
+        url = "https://www.slickcharts.com/sp500"
+        headers = {"User-Agent": "PostmanRuntime/7.38.0"}
+        response = requests.get(url, headers=headers)
+        data = pd.read_html(StringIO(response.text))[0]
+        return data[["Symbol", "Weight"]].set_index("Symbol")
+
+    def history(self, symbol, period):
+        return self._ticker(symbol).history(period)
+
+    def info(self, symbol):
+        return self._ticker(symbol).info
+
+    def annual_financials(self, symbol):
+        return self._ticker(symbol).financials
+
+    def annual_balance_sheet(self, symbol):
+        return self._ticker(symbol).balance_sheet
+
+    def quarterly_financials(self, symbol):
+        return self._ticker(symbol).quarterly_financials
+
+    def quarterly_balance_sheet(self, symbol):
+        return self._ticker(symbol).quarterly_balance_sheet
+
+    def quotes(self, symbols):
+        # one batched download of the 1 minute bars of the last two days
+        tickers = {symbol.replace(".", "-"): symbol for symbol in symbols}
+        closes = yf.download(
+            list(tickers), period="2d", interval="1m", progress=False, group_by="column"
+        )["Close"]
+        if isinstance(closes, pd.Series):
+            closes = closes.to_frame(next(iter(tickers)))
+        days = closes.index.normalize()
+        today = closes[days == days.max()]
+        before = closes[days < days.max()]
+        quotes = pd.DataFrame(
+            {
+                "price": today.ffill().iloc[-1],
+                "previous_close": before.ffill().iloc[-1] if len(before) else None,
+            }
+        )
+        return quotes.rename(index=tickers).dropna(subset=["price"])
+
+
+def _recording_path(directory, method, args):
+    file_name = "__".join(str(arg) for arg in args) or "data"
+    return os.path.join(directory, method, f"{file_name}.pkl")
+
+
+class RecordingProvider(DataProvider):
+    """
+    Passes every call through to another provider and records the responses into a directory,
+    for later use by the ReplayProvider.
+    """
+
+    name = "record"
+
+    def __init__(self, provider, directory):
+        self.provider = provider
+        self.directory = directory
+
+    def _record(self, method, *args):
+        value = getattr(self.provider, method)(*args)
+        path = _recording_path(self.directory, method, args)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as file:
+            pickle.dump(value, file)
+        return value
+
+    def tickers_sector(self):
+        return self._record("tickers_sector")
+
+    def tickers_weight(self):
+        return self._record("tickers_weight")
+
+    def history(self, symbol, period):
+        return self._record("history", symbol, period)
+
+    def info(self, symbol):
+        return self._record("info", symbol)
+
+    def annual_financials(self, symbol):
+        return self._record("annual_financials", symbol)
+
+    def annual_balance_sheet(self, symbol):
+        return self._record("annual_balance_sheet", symbol)
+
+    def quarterly_financials(self, symbol):
+        return self._record("quarterly_financials", symbol)
+
+    def quarterly_balance_sheet(self, symbol):
+        return self._record("quarterly_balance_sheet", symbol)
+
+    def quotes(self, symbols):
+        # quotes are only meaningful live, they are passed through without recording
+        return self.provider.quotes(symbols)
+
+
+class ReplayProvider(DataProvider):
+    """
+    Serves responses recorded by the RecordingProvider (or written by benchmarks/fixtures.py) without any network
+    access. Each call is delayed by `latency` seconds on average and fails with probability `error_rate`, to emulate
+    the live services when load testing.
+    """
+
+    name = "replay"
+
+    def __init__(self, directory, latency=0.0, error_rate=0.0):
+        self.directory = directory
+        self.latency = latency
+        self.error_rate = error_rate
+
+    def _replay(self, method, *args):
+        if self.latency:
+            time.sleep(random.uniform(0.5, 1.5) * self.latency)
+        if self.error_rate and random.random() < self.error_rate:
+            raise DataProviderError(f"Injected error for {method}{args}")
+        path = _recording_path(self.directory, method, args)
+        try:
+            with open(path, "rb") as file:
+                return pickle.load(file)
+        except FileNotFoundError:
+            raise DataProviderError(f"No recorded data for {method}{args} at {path}")
+
+    def tickers_sector(self):
+        return self._replay("tickers_sector")
+
+    def tickers_weight(self):
+        return self._replay("tickers_weight")
+
+    def history(self, symbol, period):
+        return self._replay("history", symbol, period)
+
+    def info(self, symbol):
+        return self._replay("info", symbol)
+
+    def annual_financials(self, symbol):
+        return self._replay("annual_financials", symbol)
+
+    def annual_balance_sheet(self, symbol):
+        return self._replay("annual_balance_sheet", symbol)
+
+    def quarterly_financials(self, symbol):
+        return self._replay("quarterly_financials", symbol)
+
+    def quarterly_balance_sheet(self, symbol):
+        return self._replay("quarterly_balance_sheet", symbol)
+
+    def quotes(self, symbols):
+        # replayed as a random move of up to 2% around the last recorded close of the 1 month history
+        rows = {}
+        for symbol in symbols:
+            closes = self._replay("history", symbol, "1mo")["Close"]
+            rows[symbol] = {
+                "price": closes.iloc[-1] * random.uniform(0.98, 1.02),
+                "previous_close": closes.iloc[-1],
+            }
+        return pd.DataFrame.from_dict(rows, orient="index")
+
+
+_provider = None
+
+
+def set_data_provider(provider):
+    """
+    Installs the provider used by data_fetch in this process (and in the processes forked from it and the updater
+    workers it starts), overriding the `data_provider` config.
+
+    Parameters:
+        provider (DataProvider): The provider to use.
+    """
+    global _provider
+    _provider = provider
+    logger.info(f"Data provider set to {provider.name}")
+
+
+def get_data_provider():
+    """
+    Returns the provider used by data_fetch, created from the `data_provider` config on first use.
+
+    Returns:
+        DataProvider: The active data provider.
+    """
+    if _provider is None:
+        provider_name = get_app_custom_config("data_provider")
+        directory = get_app_custom_config("replay_data_dir")
+        if provider_name == "yfinance":
+            set_data_provider(YFinanceProvider())
+        elif provider_name == "record":
+            set_data_provider(RecordingProvider(YFinanceProvider(), directory))
+        elif provider_name == "replay":
+            set_data_provider(
+                ReplayProvider(
+                    directory,
+                    latency=get_app_custom_config("replay_latency"),
+                    error_rate=get_app_custom_config("replay_error_rate"),
+                )
+            )
+        else:
+            raise ValueError(f"Invalid data provider {provider_name}")
+    return _provider
@@ -0,0 +1,291 @@
+import logging
+
+import numpy as np
+import pandas as pd
+
+import data_fetch
+from cacheUtil import CentralCache, cached_with_force_update, make_cache_key
+from common_data import default_time_periods
+
+logger = logging.getLogger(__name__)
+
+SMA_WINDOW = 20
+EMA_SPAN = 20
+BOLLINGER_WINDOW = 20
+BOLLINGER_WIDTH = 2
+RSI_PERIOD = 14
+ATR_PERIOD = 14
+
+# History period on which the indicators of the default periods are computed and sliced from: the longest cached by
+# the updater, so that the indicators of every shorter period are warmed up
+INDICATOR_PERIOD = "5y"
+
+# Columns of the indicator frames, the ones starting with _ are the state carried to the next bars
+INDICATOR_COLUMNS = [
+    f"SMA {SMA_WINDOW}",
+    f"EMA {EMA_SPAN}",
+    "BB Upper",
+    "BB Lower",
+    f"RSI {RSI_PERIOD}",
+    f"ATR {ATR_PERIOD}",
+    "_Close",
+    "_RSI Gain",
+    "_RSI Loss",
+]
+
+# Chart overlays and the indicator columns they draw, on the price chart or in an oscillator panel below it
+price_overlays = {
+    f"SMA {SMA_WINDOW}": [f"SMA {SMA_WINDOW}"],
+    f"EMA {EMA_SPAN}": [f"EMA {EMA_SPAN}"],
+    "Bollinger Bands": ["BB Upper", "BB Lower"],
+}
+oscillator_overlays = {
+    f"RSI {RSI_PERIOD}": [f"RSI {RSI_PERIOD}"],
+    f"ATR {ATR_PERIOD}": [f"ATR {ATR_PERIOD}"],
+}
+
+
+def _wilder(values, period):
+    # Wilder's smoothing: an exponential average with alpha = 1 / period, seeded by the first value
+    return values.ewm(alpha=1 / period, adjust=False).mean()
+
+
+def _true_range(close, high, low):
+    previous_close = close.shift(1)
+    return np.fmax(
+        high - low, np.fmax((high - previous_close).abs(), (low - previous_close).abs())
+    )
+
+
+def _rsi(gain, loss):
+    return 100 - 100 / (1 + gain / loss)
+
+
+def _indicators(close, high, low):
+    """
+    Computes the indicators over whole price series, vectorized: the arguments are Series of one stock, or
+    DataFrames of one column per stock.
+
+    Returns:
+        dict: The series (or frames) of every column of INDICATOR_COLUMNS.
+    """
+    close, high, low = (prices.astype("float64") for prices in (close, high, low))
+    delta = close.diff()
+    gain = _wilder(delta.clip(lower=0), RSI_PERIOD)
+    loss = _wilder((-delta).clip(lower=0), RSI_PERIOD)
+    sma = close.rolling(SMA_WINDOW).mean()
+    bollinger_mean = close.rolling(BOLLINGER_WINDOW).mean()
+    bollinger_std = close.rolling(BOLLINGER_WINDOW).std(ddof=0)
+    return {
+        f"SMA {SMA_WINDOW}": sma,
+        f"EMA {EMA_SPAN}": close.ewm(span=EMA_SPAN, adjust=False).mean(),
+        "BB Upper": bollinger_mean + BOLLINGER_WIDTH * bollinger_std,
+        "BB Lower": bollinger_mean - BOLLINGER_WIDTH * bollinger_std,
+        f"RSI {RSI_PERIOD}": _rsi(gain, loss),
+        f"ATR {ATR_PERIOD}": _wilder(_true_range(close, high, low), ATR_PERIOD),
+        "_Close": close,
+        "_RSI Gain": gain,
+        "_RSI Loss": loss,
+    }
+
+
+def compute_indicators(history):
+    """
+    Computes the indicators of a stock over its whole history.
+
+    Parameters:
+        history (pandas.DataFrame): History frame of the stock, see data_fetch.history.
+
+    Returns:
+        pandas.DataFrame: The INDICATOR_COLUMNS, indexed like the history.
+    """
+    return pd.DataFrame(
+        _indicators(history["Close"], history["High"], history["Low"]),
+        columns=INDICATOR_COLUMNS,
+    )
+
+
+def compute_universe_indicators(histories):
+    """
+    Computes the indicators of many stocks at once, each column operation running over all the stocks, on the
+    union of their trading days.
+
+    Parameters:
+        histories (dict): History frames by symbol, None for the ones missing.
+
+    Returns:
+        dict: Indicator frames by symbol, each indexed like the history of the stock.
+    """
+    histories = {
+        symbol: history
+        for symbol, history in histories.items()
+        if history is not None and not history.empty
+    }
+    if not histories:
+        return {}
+    wide = {
+        column: pd.concat(
+            {symbol: history[column] for symbol, history in histories.items()}, axis=1
+        )
+        for column in ("Close", "High", "Low")
+    }
+    columns = _indicators(wide["Close"], wide["High"], wide["Low"])
+    return {
+        symbol: pd.DataFrame(
+            {column: columns[column][symbol] for column in INDICATOR_COLUMNS}
+        ).reindex(history.index)
+        for symbol, history in histories.items()
+    }
+
+
+def update_indicators(previous, history):
+    """
+    Updates the indicators of a stock for the bars its history gained since they were computed, carrying the state
+    of the previous bar forward (the last window of closes, the exponential averages) instead of computing the
+    whole history again. The last bar previously computed is computed again, as it may have been provisional
+    (intraday). The indicators are computed from scratch when they don't match the history, e.g. after the prices
+    were adjusted for a split or a dividend.
+
+    Parameters:
+        previous (pandas.DataFrame): Indicators previously computed, see compute_indicators. None if there are none.
+        history (pandas.DataFrame): Current history frame of the stock.
+
+    Returns:
+        pandas.DataFrame: The indicators of the current history.
+    """
+    if previous is None or previous.empty or history.index[-1] < previous.index[-1]:
+        return compute_indicators(history)
+    start = history.index.searchsorted(previous.index[-1])
+    kept = previous.loc[history.index[0] : history.index[start - 1]] if start else None
+    if (
+        start < max(SMA_WINDOW, BOLLINGER_WINDOW)
+        or not kept.index.equals(history.index[:start])
+        or kept["_Close"].iloc[-1] != history["Close"].iloc[start - 1]
+    ):
+        return compute_indicators(history)
+
+    ema, gain, loss, atr = kept.iloc[-1][
+        [f"EMA {EMA_SPAN}", "_RSI Gain", "_RSI Loss", f"ATR {ATR_PERIOD}"]
+    ]
+    close = history["Close"].to_numpy("float64")
+    high = history["High"].to_numpy("float64")
+    low = history["Low"].to_numpy("float64")
+    ema_alpha = 2 / (EMA_SPAN + 1)
+    rows = []
+    for i in range(start, len(history)):
+        # the same recurrences as the exponential averages of _indicators
+        change = close[i] - close[i - 1]
+        ema += ema_alpha * (close[i] - ema)
+        gain += (max(change, 0) - gain) / RSI_PERIOD
+        loss += (max(-change, 0) - loss) / RSI_PERIOD
+        true_range = max(
+            high[i] - low[i], abs(high[i] - close[i - 1]), abs(low[i] - close[i - 1])
+        )
+        atr += (true_range - atr) / ATR_PERIOD
+        bollinger_window = close[i - BOLLINGER_WINDOW + 1 : i + 1]
+        bollinger_mean = bollinger_window.mean()
+        bollinger_std = bollinger_window.std()
+        rows.append(
+            (
+                close[i - SMA_WINDOW + 1 : i + 1].mean(),
+                ema,
+                bollinger_mean + BOLLINGER_WIDTH * bollinger_std,
+                bollinger_mean - BOLLINGER_WIDTH * bollinger_std,
+                _rsi(gain, loss) if loss else (100.0 if gain else np.nan),
+                atr,
+                close[i],
+                gain,
+                loss,
+            )
+        )
+    updated = pd.DataFrame(rows, index=history.index[start:], columns=INDICATOR_COLUMNS)
+    return pd.concat([kept, updated])
+
+
+@cached_with_force_update(incremental=True)
+def price_indicators(symbol, period, previous=None):
+    """
+    Technical indicators of a stock over a history period, stored next to its history in the cache and updated
+    incrementally as the history gains bars, see update_indicators.
+
+    Parameters:
+        symbol (str): The stock symbol.
+        period (str): The history period, e.g. INDICATOR_PERIOD.
+        previous (pandas.DataFrame): The indicators in the cache, passed by cached_with_force_update.
+
+    Returns:
+        pandas.DataFrame: The INDICATOR_COLUMNS indexed by date, None if there is no history.
+    """
+    history = data_fetch.history(symbol, period)
+    if history is None:
+        return None
+    return update_indicators(previous, history)
+
+
+def missing_indicators(symbols, period=INDICATOR_PERIOD):
+    """
+    Returns the stocks whose indicators are not in the cache, in one round-trip that doesn't transfer them.
+
+    Parameters:
+        symbols (list of str): The symbols.
+        period (str): The history period.
+
+    Returns:
+        list of str: The symbols without indicators, in the order given.
+    """
+    keys = [
+        make_cache_key(price_indicators.__name__, (symbol, period))
+        for symbol in symbols
+    ]
+    cached = CentralCache.get_hashes(keys)
+    return [symbol for symbol, key in zip(symbols, keys) if key not in cached]
+
+
+def warm_universe_indicators(symbols, period=INDICATOR_PERIOD):
+    """
+    Computes the indicators of many stocks at once from their cached histories and caches them, for the stocks
+    that have none yet, e.g. in a cold cache, see CacheUpdater.update_symbols. The histories missing are fetched
+    first.
+
+    Parameters:
+        symbols (list of str): The symbols.
+        period (str): The history period.
+
+    Returns:
+        int: Number of stocks whose indicators were cached.
+    """
+    histories = dict(
+        zip(symbols, data_fetch.history.many([(symbol, period) for symbol in symbols]))
+    )
+    indicators = compute_universe_indicators(histories)
+    CentralCache.set_many(
+        {
+            make_cache_key(price_indicators.__name__, (symbol, period)): frame
+            for symbol, frame in indicators.items()
+        }
+    )
+    return len(indicators)
+
+
+def chart_indicators(symbols, period, indexes):
+    """
+    Returns the cached indicators of stocks for a chart of the given period, sliced to the dates of the chart.
+    The indicators of the default periods are sliced from the ones of INDICATOR_PERIOD.
+
+    Parameters:
+        symbols (list of str): The symbols.
+        period (str): The period of the chart.
+        indexes (dict): Date index of the history charted for every symbol.
+
+    Returns:
+        dict: Indicator frames by symbol, for the symbols having indicators.
+    """
+    base_period = (
+        INDICATOR_PERIOD if period in default_time_periods.values() else period
+    )
+    frames = price_indicators.many([(symbol, base_period) for symbol in symbols])
+    return {
+        symbol: frame.reindex(indexes[symbol])
+        for symbol, frame in zip(symbols, frames)
+        if frame is not None
+    }
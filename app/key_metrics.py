@@ -4,6 +4,7 @@ import pandas as pd
 import streamlit as st
 
 import data_fetch
+import tracing
 from cacheUtil import cached_with_force_update
 from stock_data import calculate_return_on_capital_employed
 
@@ -63,12 +64,14 @@ def display_key_metrics(selected_stocks):
         selected_stocks (list of str): List of stock symbols.
     """
     st.subheader("Key Metrics")
-    data = [fetch_key_metrics(symbol) for symbol in selected_stocks]
+    data = fetch_key_metrics.many(selected_stocks)
     if any(data):
-        key_metrics_data = pd.DataFrame(data, index=selected_stocks)
-        st.dataframe(
-            key_metrics_data.transpose().rename_axis("Metrics"),
-            use_container_width=True,
-        )
+        with tracing.span("build DataFrame"):
+            key_metrics_data = pd.DataFrame(data, index=selected_stocks)
+        with tracing.span("st.dataframe"):
+            st.dataframe(
+                key_metrics_data.transpose().rename_axis("Metrics"),
+                use_container_width=True,
+            )
     else:
         st.write("No data available for selected stocks.")
@@ -0,0 +1,105 @@
+import os
+import resource
+import tracemalloc
+
+# Allocation snapshot of this process taken last, the next one is compared to it
+_previous_snapshot = None
+
+
+def process_rss_mb(pid=None):
+    """
+    Returns the resident memory of a process, from /proc.
+
+    Parameters:
+        pid (int): The process, this one if None.
+
+    Returns:
+        float: RSS in MB. For this process without /proc (e.g. macOS), its peak RSS; None for another process
+        without /proc or one that exited.
+    """
+    try:
+        with open(f"/proc/{pid or 'self'}/statm") as statm:
+            pages = int(statm.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except (OSError, ValueError, IndexError):
+        if pid is not None and pid != os.getpid():
+            return None
+        return peak_rss_mb()
+
+
+def peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def process_memory():
+    """
+    Returns:
+        dict: 'pid', 'rss_mb' and 'peak_rss_mb' of this process.
+    """
+    return {
+        "pid": os.getpid(),
+        "rss_mb": process_rss_mb(),
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def tracemalloc_control(action, frames=1, limit=20, group_by="lineno"):
+    """
+    Controls tracemalloc in this process: 'start' tracing allocations (which slows every allocation down, so it is
+    only started on demand), 'stop' it, or take a 'snapshot' of the top allocators, compared with the previous
+    snapshot.
+
+    Parameters:
+        action (str): 'start', 'stop', 'snapshot' or 'status'.
+        frames (int): Frames of traceback stored per allocation, when starting.
+        limit (int): Number of top allocators returned by a snapshot.
+        group_by (str): 'lineno', 'filename' or 'traceback'.
+
+    Returns:
+        dict: 'tracing', the traced 'current_mb' and 'peak_mb', the pid and, for a snapshot, 'top': a list of
+        dicts of 'location', 'size_kb', 'count' and 'size_diff_kb' (since the previous snapshot) of the largest
+        allocators.
+    """
+    global _previous_snapshot
+    if action == "start" and not tracemalloc.is_tracing():
+        tracemalloc.start(frames)
+        _previous_snapshot = None
+    elif action == "stop":
+        tracemalloc.stop()
+        _previous_snapshot = None
+    elif action not in ("start", "snapshot", "status"):
+        raise ValueError(f"Invalid tracemalloc action {action}")
+
+    current, peak = tracemalloc.get_traced_memory()
+    status = {
+        "pid": os.getpid(),
+        "tracing": tracemalloc.is_tracing(),
+        "current_mb": current / 2**20,
+        "peak_mb": peak / 2**20,
+    }
+    if action == "snapshot" and tracemalloc.is_tracing():
+        snapshot = tracemalloc.take_snapshot().filter_traces(
+            [tracemalloc.Filter(False, tracemalloc.__file__)]
+        )
+        statistics = snapshot.statistics(group_by)[:limit]
+        previous_sizes = {}
+        if _previous_snapshot is not None:
+            previous_sizes = {
+                stat.traceback: stat.size - stat.size_diff
+                for stat in snapshot.compare_to(_previous_snapshot, group_by)
+            }
+        _previous_snapshot = snapshot
+        status["top"] = [
+            {
+                "location": " <- ".join(
+                    f"{frame.filename}:{frame.lineno}" for frame in stat.traceback
+                ),
+                "size_kb": stat.size / 1024,
+                "count": stat.count,
+                "size_diff_kb": (stat.size - previous_sizes.get(stat.traceback, 0))
+                / 1024,
+            }
+            for stat in statistics
+        ]
+    return status
@@ -0,0 +1,109 @@
+import concurrent.futures
+import logging
+import threading
+
+import data_fetch
+from cacheUtil import CentralCache, make_cache_key
+from key_metrics import fetch_key_metrics
+from quarterly_financials import fetch_financials
+from ratios import _fetch_financial_ratio_for_single_symbol
+from returns import calculate_returns
+from stock_data import fetch_stock_data
+from utils import get_app_custom_config
+
+logger = logging.getLogger(__name__)
+
+# Shared by all the sessions of the server process
+_executor = None
+_lock = threading.Lock()
+# (function name, args) being prefetched, so that reruns don't queue the same work again
+_in_flight = set()
+
+
+def _get_executor():
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = concurrent.futures.ThreadPoolExecutor(
+                max_workers=get_app_custom_config("prefetch_workers"),
+                thread_name_prefix="prefetch",
+            )
+    return _executor
+
+
+def prefetch(func, args_list):
+    """
+    Warms the central cache with the results of a cached function in the background, computing the ones missing.
+    Which ones are cached is told by their content hashes, without transferring the values.
+    Does nothing if prefetching is disabled (`prefetch_workers` = 0).
+
+    Parameters:
+        func (callable): Function decorated with cached_with_force_update.
+        args_list (list): Positional arguments of each call, a tuple or a single argument.
+    """
+    if not get_app_custom_config("prefetch_workers"):
+        return
+    with _lock:
+        keys = [
+            (func.__name__, args if isinstance(args, tuple) else (args,))
+            for args in args_list
+        ]
+        keys = [key for key in dict.fromkeys(keys) if key not in _in_flight]
+        _in_flight.update(keys)
+    if not keys:
+        return
+
+    def run():
+        try:
+            cache_keys = {make_cache_key(name, args): args for name, args in keys}
+            cached = CentralCache.get_hashes(list(cache_keys))
+            missing = [args for key, args in cache_keys.items() if key not in cached]
+            if missing:
+                func.many(missing)
+        except Exception as e:
+            logger.error(f"Prefetching {func.__name__} failed: {e}")
+        finally:
+            with _lock:
+                _in_flight.difference_update(keys)
+
+    _get_executor().submit(run)
+
+
+def prefetch_industry_page(ticker_and_weight_list, page, entries_per_page):
+    """
+    Prefetches the stock data of the Industry Data page following the given one.
+
+    Parameters:
+        ticker_and_weight_list (list of tuple(str,str)): (ticker, weight) of every stock of the sector.
+        page (int): Current page, starting at 1.
+        entries_per_page (int): Stocks per page.
+    """
+    start = page * entries_per_page
+    prefetch(
+        fetch_stock_data,
+        [
+            symbol
+            for symbol, weight in ticker_and_weight_list[
+                start : start + entries_per_page
+            ]
+        ],
+    )
+
+
+def prefetch_stock_details(symbols, time_frame):
+    """
+    Prefetches what the Stock Details, Quarterly Financials, Metrics, Ratios and Returns pages show for the
+    given stocks.
+
+    Parameters:
+        symbols (list): Stock symbols, e.g. the default selection of a sector.
+        time_frame (str): Period of the price chart, e.g. 'ytd'.
+    """
+    prefetch(data_fetch.history, [(symbol, time_frame) for symbol in symbols])
+    for func in (
+        fetch_financials,
+        fetch_key_metrics,
+        _fetch_financial_ratio_for_single_symbol,
+        calculate_returns,
+    ):
+        prefetch(func, symbols)
@@ -1,14 +1,23 @@
 import logging
 
+import numpy as np
 import pandas as pd
 import streamlit as st
 
 import data_fetch
-from cacheUtil import cached_with_force_update
+import tracing
+from cacheUtil import CentralCache, cached_with_force_update, make_cache_key
 from common_data import financial_columns_renamed, financial_columns
+from utils import CacheExpiredException
 
 logger = logging.getLogger(__name__)
 
+# Line items of the statements shown, and their labels
+LATEST_QUARTER_SOURCE_ROWS = financial_columns + list(financial_columns_renamed)
+LATEST_QUARTER_ROWS = financial_columns + list(financial_columns_renamed.values())
+# Wide table of the latest quarter line items of the universe, see refresh_latest_quarter_table
+LATEST_QUARTER_TABLE_KEY = "latest_quarter_table"
+
 
 @cached_with_force_update()
 def fetch_financials(symbol):
@@ -47,6 +56,100 @@ def fetch_financials(symbol):
         }
 
 
+def latest_quarter_frame(statements):
+    """
+    Builds the wide table of the latest quarter line items of several stocks.
+
+    Parameters:
+        statements (dict): Quarterly financials frames (line items x quarters, most recent first) by symbol.
+
+    Returns:
+        pandas.DataFrame: float64 values, one row per line item of LATEST_QUARTER_ROWS and one column per symbol
+        (NaN for the line items missing from its statement), without the stocks that have no statement.
+    """
+    statements = {
+        symbol: frame
+        for symbol, frame in statements.items()
+        if isinstance(frame, pd.DataFrame) and not frame.empty
+    }
+    values = np.full((len(LATEST_QUARTER_SOURCE_ROWS), len(statements)), np.nan)
+    for i, frame in enumerate(statements.values()):
+        latest = frame.iloc[:, 0]
+        latest = latest[~latest.index.duplicated()]
+        values[:, i] = latest.reindex(LATEST_QUARTER_SOURCE_ROWS).to_numpy(
+            dtype="float64", na_value=np.nan
+        )
+    return pd.DataFrame(
+        values, index=pd.Index(LATEST_QUARTER_ROWS), columns=list(statements)
+    )
+
+
+def refresh_latest_quarter_table(symbols):
+    """
+    Rebuilds the wide table of the universe's latest quarter line items from the cache, in one read: the statements
+    of `symbols` and of the symbols already in the table, as long as their statement is cached. Run by the updater
+    after every cycle, so that the columns refreshed by other updater nodes are kept.
+
+    Parameters:
+        symbols (list of str): Symbols just updated.
+
+    Returns:
+        pandas.DataFrame: The table, see latest_quarter_frame.
+    """
+    universe = dict.fromkeys(symbols)
+    universe.update(dict.fromkeys(latest_quarter_table().columns))
+    keys = {
+        make_cache_key(data_fetch.quarterly_financials.__name__, (symbol,)): symbol
+        for symbol in universe
+    }
+    cached = CentralCache.get_many(list(keys))
+    table = latest_quarter_frame(
+        {keys[key]: cached[key] for key in keys if key in cached}
+    )
+    CentralCache.set(LATEST_QUARTER_TABLE_KEY, table)
+    return table
+
+
+def latest_quarter_table():
+    """
+    Returns the wide table of the universe's latest quarter line items, as last rebuilt by the updater.
+
+    Returns:
+        pandas.DataFrame: See latest_quarter_frame, without columns if the table is not cached.
+    """
+    try:
+        return CentralCache.get(LATEST_QUARTER_TABLE_KEY)
+    except (CacheExpiredException, KeyError):
+        return latest_quarter_frame({})
+
+
+def latest_quarter_financials(symbols):
+    """
+    Returns the latest quarter line items of stocks: their columns of the table, and for the stocks missing from
+    it, the ones of fetch_financials.
+
+    Parameters:
+        symbols (list of str): The stock symbols.
+
+    Returns:
+        pandas.DataFrame: One row per line item of LATEST_QUARTER_ROWS, one column per symbol, in the order of
+        `symbols`.
+    """
+    table = latest_quarter_table()
+    missing = [symbol for symbol in symbols if symbol not in table.columns]
+    if missing:
+        fetched = pd.DataFrame(
+            {
+                symbol: data or {}
+                for symbol, data in zip(missing, fetch_financials.many(missing))
+            },
+            index=LATEST_QUARTER_ROWS,
+            dtype="float64",
+        )
+        table = pd.concat([table, fetched], axis=1)
+    return table[symbols]
+
+
 def display_quarterly_stats(selected_stocks):
     """
     Displays the latest quarterly financial statistics for a list of selected stocks.
@@ -55,10 +158,10 @@ def display_quarterly_stats(selected_stocks):
         selected_stocks (list of str): List of stock symbols to fetch data for.
     """
     st.subheader("Quarterly Financials")
-    data = {stock: fetch_financials(stock) for stock in selected_stocks}
-    # Converting to DataFrame
-    financial_df = pd.DataFrame(data)
+    with tracing.span("select columns"):
+        financial_df = latest_quarter_financials(selected_stocks)
     if not financial_df.empty:
-        st.dataframe(financial_df, use_container_width=True)
+        with tracing.span("st.dataframe"):
+            st.dataframe(financial_df, use_container_width=True)
     else:
         st.write("No financial data to display.")
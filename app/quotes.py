@@ -0,0 +1,219 @@
+import collections
+import datetime
+import logging
+import threading
+import time
+from zoneinfo import ZoneInfo
+
+import pandas as pd
+
+from data_provider import get_data_provider
+from utils import get_app_custom_config
+
+logger = logging.getLogger(__name__)
+
+MARKET_TIMEZONE = ZoneInfo("America/New_York")
+MARKET_OPEN = datetime.time(9, 30)
+MARKET_CLOSE = datetime.time(16, 0)
+
+
+def is_market_open(now=None):
+    """
+    Returns whether the NYSE regular session is open (holidays are not taken into account).
+
+    Parameters:
+        now (datetime.datetime): Time to check, defaults to now.
+
+    Returns:
+        bool: True on weekdays between 9:30 and 16:00 New York time.
+    """
+    now = (now or datetime.datetime.now(datetime.timezone.utc)).astimezone(
+        MARKET_TIMEZONE
+    )
+    return now.weekday() < 5 and MARKET_OPEN <= now.time() < MARKET_CLOSE
+
+
+class QuoteStore:
+    """
+    Latest quotes of the polled symbols, keeping the last `size` prices of every symbol in a ring buffer.
+    """
+
+    def __init__(self, size):
+        self._prices = collections.defaultdict(lambda: collections.deque(maxlen=size))
+        self._previous_close = {}
+        self._lock = threading.Lock()
+
+    def add(self, quotes, timestamp):
+        """
+        Parameters:
+            quotes (pandas.DataFrame): 'price' and 'previous_close' indexed by symbol, see DataProvider.quotes.
+            timestamp (float): Time of the quotes.
+        """
+        with self._lock:
+            for symbol, price, previous_close in zip(
+                quotes.index, quotes["price"], quotes["previous_close"]
+            ):
+                self._prices[symbol].append((timestamp, price))
+                self._previous_close[symbol] = previous_close
+
+    def latest(self, symbols):
+        """
+        Parameters:
+            symbols (list of str): The symbols.
+
+        Returns:
+            pandas.DataFrame: 'price', 'change' (percent from the previous close) and 'time' of the symbols quoted,
+            indexed by symbol.
+        """
+        with self._lock:
+            rows = {
+                symbol: (*self._prices[symbol][-1], self._previous_close[symbol])
+                for symbol in symbols
+                if self._prices.get(symbol)
+            }
+        latest = pd.DataFrame.from_dict(
+            rows, orient="index", columns=["time", "price", "previous_close"]
+        )
+        latest["change"] = (latest["price"] / latest["previous_close"] - 1) * 100
+        return latest[["price", "change", "time"]]
+
+    def history(self, symbol):
+        """
+        Returns:
+            list: (time, price) of the latest quotes of a symbol, oldest first.
+        """
+        with self._lock:
+            return list(self._prices.get(symbol, ()))
+
+
+class QuotePoller:
+    """
+    Polls the quotes of the symbols visible in the sessions of this server process every `interval` seconds, in one
+    batched provider call, into a QuoteStore. Sessions watch their visible symbols; a watch not renewed within
+    `watch_ttl` seconds (the session left the page or closed) stops the polling of its symbols.
+    """
+
+    def __init__(self, interval, size, watch_ttl, market_hours_only=True):
+        self.interval = interval
+        self.watch_ttl = watch_ttl
+        self.market_hours_only = market_hours_only
+        self.store = QuoteStore(size)
+        # watcher -> (symbols, expiry)
+        self._watches = {}
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def watch(self, watcher, symbols):
+        """
+        Sets the symbols visible to a watcher (e.g. a session), replacing the previous ones, and starts the
+        polling thread if needed.
+
+        Parameters:
+            watcher (str): Identifier of the watcher.
+            symbols (list of str): The symbols to poll.
+        """
+        with self._lock:
+            self._watches[watcher] = (set(symbols), time.time() + self.watch_ttl)
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="quote-poller", daemon=True
+                )
+                self._thread.start()
+
+    def watched_symbols(self):
+        now = time.time()
+        with self._lock:
+            self._watches = {
+                watcher: watch
+                for watcher, watch in self._watches.items()
+                if watch[1] > now
+            }
+            return sorted(
+                set().union(*(symbols for symbols, _ in self._watches.values()))
+            )
+
+    def poll_once(self):
+        """
+        Fetches the quotes of the watched symbols.
+
+        Returns:
+            int: Number of symbols quoted.
+        """
+        symbols = self.watched_symbols()
+        if not symbols:
+            return 0
+        quotes = get_data_provider().quotes(symbols)
+        self.store.add(quotes, time.time())
+        return len(quotes)
+
+    def _run(self):
+        while True:
+            start = time.time()
+            if not self.market_hours_only or is_market_open():
+                try:
+                    logger.debug(f"Quoted {self.poll_once()} symbols")
+                except Exception as e:
+                    logger.error(f"Failed to poll quotes: {e}")
+            time.sleep(max(self.interval - (time.time() - start), 0))
+
+
+_poller = None
+_poller_lock = threading.Lock()
+
+
+def get_quote_poller():
+    """
+    Returns the quote poller of this process, created from the `quote_*` config on first use,
+    or None if live quotes are disabled (`quote_poll_interval` = 0).
+    """
+    global _poller
+    interval = get_app_custom_config("quote_poll_interval")
+    if not interval:
+        return None
+    with _poller_lock:
+        if _poller is None:
+            _poller = QuotePoller(
+                interval,
+                get_app_custom_config("quote_history"),
+                # a fragment showing the quotes renews its watch every interval
+                watch_ttl=3 * interval,
+                market_hours_only=get_app_custom_config("quote_market_hours_only"),
+            )
+    return _poller
+
+
+def quotes_polled():
+    """
+    Returns whether the quote poller of this process is polling now: live quotes are enabled and, with
+    `quote_market_hours_only`, the market is open. Otherwise no new quote can arrive.
+    """
+    poller = get_quote_poller()
+    return poller is not None and (not poller.market_hours_only or is_market_open())
+
+
+def patch_live_prices(data, watcher):
+    """
+    Returns a copy of the industry wide stock data with the 'Current Price' and 'Day Change' of its stocks
+    replaced by their latest quotes, and watches these stocks for the next polls.
+
+    Parameters:
+        data (pandas.DataFrame): Industry wide stock data, with a 'Symbol' column.
+        watcher (str): Identifier of the watcher, e.g. the session id.
+
+    Returns:
+        pandas.DataFrame: The patched copy (data itself if live quotes are disabled).
+    """
+    poller = get_quote_poller()
+    if poller is None or data.empty:
+        return data
+    symbols = data["Symbol"].tolist()
+    poller.watch(watcher, symbols)
+    latest = poller.store.latest(symbols)
+    if latest.empty:
+        return data
+    data = data.copy()
+    quoted = data["Symbol"].isin(latest.index)
+    quoted_symbols = data.loc[quoted, "Symbol"]
+    data.loc[quoted, "Current Price"] = latest["price"].reindex(quoted_symbols).values
+    data.loc[quoted, "Day Change"] = latest["change"].reindex(quoted_symbols).values
+    return data
@@ -4,6 +4,7 @@ import plotly.graph_objects as go
 import streamlit as st
 
 import data_fetch
+import tracing
 from cacheUtil import cached_with_force_update
 
 logger = logging.getLogger(__name__)
@@ -91,9 +92,7 @@ def fetch_financial_ratios_for_multiple_symbols(symbols):
     Returns:
         dict: A dictionary with symbols as keys and their financial ratios as values.
     """
-    data = {
-        symbol: _fetch_financial_ratio_for_single_symbol(symbol) for symbol in symbols
-    }
+    data = dict(zip(symbols, _fetch_financial_ratio_for_single_symbol.many(symbols)))
     return data
 
 
@@ -144,8 +143,10 @@ def plot_financial_ratios(stock_data):
     charts = [st.columns(2), st.columns(2)]
     for i, metric in enumerate(financial_ratios):
         with charts[i // 2][i % 2]:
-            fig = get_financial_ratios_figure_for_single_metric(metric, stock_data)
-            st.plotly_chart(fig, use_container_width=True)
+            with tracing.span("build figure"):
+                fig = get_financial_ratios_figure_for_single_metric(metric, stock_data)
+            with tracing.span("st.plotly_chart"):
+                st.plotly_chart(fig, use_container_width=True)
 
 
 def display_financial_ratios(selected_stocks):
@@ -2,6 +2,7 @@ import pandas as pd
 import streamlit as st
 
 import data_fetch
+import tracing
 from cacheUtil import cached_with_force_update
 from common_data import default_time_periods
 
@@ -23,12 +24,11 @@ def calculate_returns(symbol, periods=None):
     returns = {}
     for period, period_abbreviation in periods.items():
         hist = data_fetch.history(symbol, period_abbreviation)
-        if not hist.empty:
-            hist["Daily Returns"] = hist["Close"].pct_change()
-            hist["Cumulative Returns"] = (
-                1 + hist["Daily Returns"].iloc[1:]
-            ).cumprod() - 1
-            cumulative_returns = hist["Cumulative Returns"].iloc[-1] * 100
+        if hist is not None and not hist.empty:
+            # computed on their own rather than as new columns of hist, which must not be modified
+            daily_returns = hist["Close"].pct_change()
+            cumulative_returns = (1 + daily_returns.iloc[1:]).cumprod() - 1
+            cumulative_returns = cumulative_returns.iloc[-1] * 100
             returns[period + " Returns"] = f"{cumulative_returns:.2f} %"
         else:
             returns[period + " Returns"] = None
@@ -43,7 +43,9 @@ def display_returns(selected_stocks):
         selected_stocks (list of str): A list of stock symbols.
     """
     st.subheader("Performance")
-    returns_data = {stock: calculate_returns(stock) for stock in selected_stocks}
-    returns_df = pd.DataFrame(returns_data).transpose()
-    returns_df.index.name = "Symbol"
-    st.dataframe(returns_df, use_container_width=True)
+    returns_data = dict(zip(selected_stocks, calculate_returns.many(selected_stocks)))
+    with tracing.span("build DataFrame"):
+        returns_df = pd.DataFrame(returns_data).transpose()
+        returns_df.index.name = "Symbol"
+    with tracing.span("st.dataframe"):
+        st.dataframe(returns_df, use_container_width=True)
@@ -0,0 +1,278 @@
+import argparse
+import logging
+import math
+import os
+import socket
+import time
+import zlib
+
+import pandas as pd
+
+from CacheUpdater import CacheUpdater, UPDATER_LEASE, LAST_REFRESH_KEY
+from cacheUtil import CentralCache, RemoteCacheBackend
+from constituents import get_constituent_index
+from memory import process_memory
+from updater_pool import updater_pool_memory
+from utils import get_app_custom_config
+
+logger = logging.getLogger(__name__)
+
+# Leases in the shared cache: one per updater node, renewed every cycle, and one per shard held by the node
+# refreshing it. A node that stops renewing its leases loses them after their TTL and its shards are reclaimed.
+NODE_LEASE_PREFIX = f"{UPDATER_LEASE}:node:"
+SHARD_LEASE_PREFIX = f"{UPDATER_LEASE}:shard:"
+# Cache key of the last refresh of a shard: dict with owner, refreshed_at, duration and symbols. Read without
+# expiry, a shard not refreshed for longer than the cache TTL is shown as stale rather than never refreshed.
+SHARD_STATUS_KEY = "cache_updater_shard_status:{}"
+# Cache key of the memory of a node: dict with pid, rss_mb, peak_rss_mb, workers (RSS in MB of its updater workers by
+# pid) and reported_at
+NODE_MEMORY_KEY = "cache_updater_node_memory:{}"
+
+
+def node_id():
+    """
+    Returns:
+        str: Identifier of this updater node, unique across hosts and processes.
+    """
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def shard_of(symbol, shards):
+    """
+    Returns the shard of a symbol. Uses crc32, which unlike hash() is the same in every process.
+
+    Parameters:
+        symbol (str): Stock symbol.
+        shards (int): Number of shards.
+
+    Returns:
+        int: Shard number in [0, shards).
+    """
+    return zlib.crc32(symbol.encode()) % shards
+
+
+def _live_leases(leases, prefix, now):
+    return {
+        name[len(prefix) :]: lease
+        for name, lease in leases.items()
+        if name.startswith(prefix) and lease[1] > now
+    }
+
+
+def claim_shards(owner, shards, ttl):
+    """
+    Registers the node and claims its fair share of the shards, ceil(shards / live nodes): the shards it already
+    holds are renewed first, then free or expired shards are taken. Shards held beyond the fair share (after
+    other nodes joined) are released for the other nodes to take on their next cycle.
+
+    Parameters:
+        owner (str): Node identifier.
+        shards (int): Number of shards.
+        ttl (float): Seconds after which the leases of a node that stopped can be reclaimed.
+
+    Returns:
+        list: Shards held by the node for this cycle.
+    """
+    CentralCache.acquire_lease(NODE_LEASE_PREFIX + owner, owner, ttl)
+    leases = CentralCache.leases()
+    now = time.time()
+    nodes = _live_leases(leases, NODE_LEASE_PREFIX, now)
+    shard_leases = _live_leases(leases, SHARD_LEASE_PREFIX, now)
+    fair_share = math.ceil(shards / max(len(nodes), 1))
+
+    held = sorted(
+        int(shard)
+        for shard, (shard_owner, expiry) in shard_leases.items()
+        if shard_owner == owner and int(shard) < shards
+    )
+    for shard in held[fair_share:]:
+        CentralCache.release_lease(f"{SHARD_LEASE_PREFIX}{shard}", owner)
+    claimed = [
+        shard
+        for shard in held[:fair_share]
+        if CentralCache.acquire_lease(f"{SHARD_LEASE_PREFIX}{shard}", owner, ttl)
+    ]
+
+    # nodes start scanning at different shards, so that nodes starting together don't contend for the same ones
+    start = zlib.crc32(owner.encode()) % shards
+    for offset in range(shards):
+        if len(claimed) >= fair_share:
+            break
+        shard = (start + offset) % shards
+        if str(shard) in shard_leases or shard in claimed:
+            continue
+        if CentralCache.acquire_lease(f"{SHARD_LEASE_PREFIX}{shard}", owner, ttl):
+            claimed.append(shard)
+    return sorted(claimed)
+
+
+def refresh_owned_shards(count, owner, shards=None, ttl=None):
+    """
+    Runs one update cycle of a node: claims shards and refreshes the top `count` stocks of every sector falling
+    in them, then records the status of each shard for the coordinator view.
+
+    Parameters:
+        count (int): Top stocks updated per sector.
+        owner (str): Node identifier.
+        shards (int): Number of shards, defaults to the `updater_shards` config.
+        ttl (float): Lease TTL, defaults to the `updater_lease_ttl` config.
+
+    Returns:
+        list: Shards refreshed by the node, empty if all shards are held by other nodes.
+    """
+    shards = shards or get_app_custom_config("updater_shards")
+    ttl = ttl or get_app_custom_config("updater_lease_ttl")
+    claimed = claim_shards(owner, shards, ttl)
+    if not claimed:
+        return claimed
+    constituent_index = get_constituent_index()
+    if constituent_index is None:
+        logger.error(f"Node {owner} has no constituents to refresh")
+        return []
+
+    logger.info(f"Node {owner} refreshing shards {claimed} of {shards}")
+    cache_updater = CacheUpdater(count)
+    symbols = [
+        symbol
+        for symbol in cache_updater.symbols_to_update(
+            constituent_index.tickers_and_weights
+        )
+        if shard_of(symbol, shards) in claimed
+    ]
+    start = time.time()
+    cache_updater.update_symbols(symbols)
+    end = time.time()
+
+    CentralCache.set_many(
+        {
+            SHARD_STATUS_KEY.format(shard): {
+                "owner": owner,
+                "refreshed_at": end,
+                "duration": end - start,
+                "symbols": [
+                    symbol for symbol in symbols if shard_of(symbol, shards) == shard
+                ],
+            }
+            for shard in claimed
+        }
+    )
+    CentralCache.set(LAST_REFRESH_KEY, end)
+    return claimed
+
+
+def shard_status(shards=None):
+    """
+    Coordinator view of a sharded refresh: owner, lease and staleness of every shard.
+
+    Parameters:
+        shards (int): Number of shards, defaults to the `updater_shards` config.
+
+    Returns:
+        pandas.DataFrame: One row per shard. 'age' is the seconds since the shard was last refreshed, missing if
+        it never was.
+    """
+    shards = shards or get_app_custom_config("updater_shards")
+    now = time.time()
+    shard_leases = _live_leases(CentralCache.leases(), SHARD_LEASE_PREFIX, now)
+    statuses = CentralCache.get_many(
+        [SHARD_STATUS_KEY.format(shard) for shard in range(shards)], expire=False
+    )
+    rows = []
+    for shard in range(shards):
+        owner, expiry = shard_leases.get(str(shard), (None, None))
+        status = statuses.get(SHARD_STATUS_KEY.format(shard)) or {}
+        rows.append(
+            {
+                "shard": shard,
+                "owner": owner,
+                "lease_expires_in": None if expiry is None else expiry - now,
+                "refreshed_by": status.get("owner"),
+                "age": (
+                    None
+                    if "refreshed_at" not in status
+                    else now - status["refreshed_at"]
+                ),
+                "duration": status.get("duration"),
+                "n_symbols": len(status.get("symbols", [])),
+                "symbols": status.get("symbols", []),
+            }
+        )
+    return pd.DataFrame(rows).set_index("shard")
+
+
+def publish_node_memory(owner):
+    """
+    Records the memory of this node and of its updater workers in the cache, for the admin page and the metrics of
+    the data API.
+
+    Parameters:
+        owner (str): Node identifier.
+    """
+    CentralCache.set(
+        NODE_MEMORY_KEY.format(owner),
+        {
+            **process_memory(),
+            "workers": updater_pool_memory(),
+            "reported_at": time.time(),
+        },
+    )
+
+
+def node_memory():
+    """
+    Returns:
+        dict: Latest memory record of every live updater node, see publish_node_memory.
+    """
+    nodes = sorted(live_nodes())
+    records = CentralCache.get_many([NODE_MEMORY_KEY.format(node) for node in nodes])
+    return {
+        node: records[NODE_MEMORY_KEY.format(node)]
+        for node in nodes
+        if NODE_MEMORY_KEY.format(node) in records
+    }
+
+
+def live_nodes():
+    """
+    Returns:
+        dict: Identifier of every live updater node mapped to the expiry of its node lease.
+    """
+    nodes = _live_leases(CentralCache.leases(), NODE_LEASE_PREFIX, time.time())
+    return {node: expiry for node, (owner, expiry) in nodes.items()}
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.WARNING)
+    parser = argparse.ArgumentParser(
+        description="Coordinator view of the sharded cache refresh, read from the shared cache server"
+    )
+    parser.add_argument(
+        "--address",
+        default=get_app_custom_config("cache_server_address"),
+        help="defaults to the cache_server_address config",
+    )
+    parser.add_argument(
+        "--authkey",
+        default=get_app_custom_config("cache_server_authkey"),
+        help="defaults to the cache_server_authkey config",
+    )
+    parser.add_argument(
+        "--shards", type=int, default=get_app_custom_config("updater_shards")
+    )
+    parser.add_argument(
+        "--symbols", action="store_true", help="list the symbols of every shard"
+    )
+    args = parser.parse_args()
+
+    CentralCache.initialise(backend=RemoteCacheBackend(args.address, args.authkey))
+    nodes = live_nodes()
+    print(f"{len(nodes)} live updater node(s): {', '.join(sorted(nodes)) or '-'}\n")
+    status = shard_status(args.shards)
+    pd.set_option("display.width", 200)
+    pd.set_option("display.max_colwidth", None)
+    print(status.drop(columns="symbols").round(1).to_string())
+    if args.symbols:
+        for shard, row in status.iterrows():
+            print(
+                f"\nshard {shard} ({row['owner'] or 'unowned'}): {' '.join(row['symbols'])}"
+            )
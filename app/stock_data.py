@@ -1,11 +1,16 @@
 import logging
 
+import numpy as np
 import pandas as pd
 import streamlit as st
+from streamlit.runtime.scriptrunner import get_script_run_ctx
 
 import data_fetch
+import tracing
 from cacheUtil import cached_with_force_update
 from common_data import stock_dataframe_column_config
+from quotes import patch_live_prices, quotes_polled
+from utils import get_app_custom_config
 
 # Create and configure logger
 logger = logging.getLogger(__name__)
@@ -101,7 +106,7 @@ def fetch_stock_data(symbol):
 def fetch_multiple_stocks_data(ticker_and_weight_list):
     """
     Fetches stock data for multiple symbols.
-    Calls the fetch_stock_data for every stock and returns the combined result
+    Reads the fetch_stock_data of every stock in one batch and returns the combined result
 
     Parameters:
         ticker_and_weight_list (list of tuple(str,str)): List of stock's (ticker,weight).
@@ -110,12 +115,48 @@ def fetch_multiple_stocks_data(ticker_and_weight_list):
         pandas.DataFrame: A DataFrame containing collected stock data.
     """
     stock_details = []
-    for symbol, weight in ticker_and_weight_list:
-        data_dict = fetch_stock_data(symbol)
+    data_dicts = fetch_stock_data.many(
+        [symbol for symbol, weight in ticker_and_weight_list]
+    )
+    for (symbol, weight), data_dict in zip(ticker_and_weight_list, data_dicts):
         if data_dict:
             data_dict["Weight"] = weight
             stock_details.append(data_dict)
-    return pd.DataFrame(stock_details)
+    with tracing.span("build DataFrame"):
+        return pd.DataFrame(stock_details)
+
+
+def prepare_industry_wide_stock_data(filtered_data):
+    """
+    Converts the raw values of the industry wide stock data into display units, in place. Zero and missing
+    values become NaN.
+
+    Parameters:
+        filtered_data (pandas.DataFrame): Data as returned by fetch_multiple_stocks_data.
+
+    Returns:
+        pandas.DataFrame: The same DataFrame with amounts in billions and ratios in percent.
+    """
+    # amounts to billions and ratios to percent, on all the columns at once
+    amounts = [
+        "Market Capitalization",
+        "Net Income Latest Quarter",
+        "Sales Latest Quarter",
+    ]
+    ratios = [
+        "Dividend Yield",
+        "YOY Quarterly Profit Growth",
+        "YOY Quarterly Sales Growth",
+    ]
+    values = filtered_data[amounts + ratios].to_numpy(dtype="float64", na_value=np.nan)
+    values[values == 0] = np.nan
+    values[:, : len(amounts)] /= 1e9
+    values[:, len(amounts) :] *= 100
+    filtered_data[amounts + ratios] = values
+
+    # live during market hours only, see quotes.patch_live_prices
+    filtered_data["Day Change"] = np.nan
+    return filtered_data
 
 
 def display_industry_wide_stock_data(filtered_data, selected_columns):
@@ -127,30 +168,46 @@ def display_industry_wide_stock_data(filtered_data, selected_columns):
         selected_columns (list of str): Columns to display.
     """
     # Prepare the data for display
+    with tracing.span("prepare DataFrame"):
+        prepare_industry_wide_stock_data(filtered_data)
 
-    # convert to a billion
-    for column in [
-        "Market Capitalization",
-        "Net Income Latest Quarter",
-        "Sales Latest Quarter",
-    ]:
-        filtered_data[column] = filtered_data[column].apply(
-            lambda x: x / 1e9 if x else None
-        )
+    display_industry_wide_stock_table(filtered_data, selected_columns)
 
-    # convert to percentage
-    for column in [
-        "Dividend Yield",
-        "YOY Quarterly Profit Growth",
-        "YOY Quarterly Sales Growth",
-    ]:
-        filtered_data[column] = filtered_data[column].apply(
-            lambda x: x * 100 if x else None
+
+def display_industry_wide_stock_table(prepared_data, selected_columns):
+    """
+    Displays the prepared industry wide stock data with live prices. While quotes are polled, the table runs again
+    on its own every `quote_poll_interval` seconds to show the latest ones, without rerunning the rest of the page.
+    Otherwise (e.g. outside market hours) it is displayed once per rerun, with the last quotes.
+
+    Parameters:
+        prepared_data (pandas.DataFrame): Data as returned by prepare_industry_wide_stock_data.
+        selected_columns (list of str): Columns to display.
+    """
+    if quotes_polled():
+        _live_stock_table(prepared_data, selected_columns)
+    else:
+        _stock_table(prepared_data, selected_columns)
+
+
+def _stock_table(prepared_data, selected_columns):
+    with tracing.span("patch live prices"):
+        data = patch_live_prices(prepared_data, get_script_run_ctx().session_id)
+
+    with tracing.span("st.dataframe"):
+        st.dataframe(
+            data[selected_columns],
+            use_container_width=True,
+            hide_index=True,
+            column_config=stock_dataframe_column_config,
         )
 
-    st.dataframe(
-        filtered_data[selected_columns],
-        use_container_width=True,
-        hide_index=True,
-        column_config=stock_dataframe_column_config,
-    )
+
+@st.experimental_fragment(
+    run_every=get_app_custom_config("quote_poll_interval") or None
+)
+def _live_stock_table(prepared_data, selected_columns):
+    # once the polling stopped (the market closed), a full rerun displays the table without running it again
+    if not quotes_polled():
+        st.rerun()
+    _stock_table(prepared_data, selected_columns)
@@ -1,6 +1,9 @@
 import streamlit as st
 import data_fetch
 import plotly.graph_objects as go
+from plotly.subplots import make_subplots
+import tracing
+from indicators import chart_indicators, oscillator_overlays, price_overlays
 
 
 def get_time_series_data(symbol, time_frame):
@@ -26,7 +29,37 @@ def get_time_series_data(symbol, time_frame):
         return None
 
 
-def plot_time_series(all_data, time_series, selected_stocks):
+def indicator_traces(all_indicators, overlays):
+    """
+    Builds the traces of the selected indicator overlays.
+
+    Parameters:
+        all_indicators (dict): Indicator frames indexed by stock symbol, see indicators.chart_indicators.
+        overlays (dict): Selected overlays mapped to the indicator columns they draw.
+
+    Returns:
+        list: The traces.
+    """
+    traces = []
+    for stock, indicators in all_indicators.items():
+        for overlay, columns in overlays.items():
+            for column in columns:
+                name = column if len(all_indicators) == 1 else f"{stock} {column}"
+                traces.append(
+                    go.Scatter(
+                        x=indicators.index,
+                        y=indicators[column],
+                        name=name,
+                        mode="lines",
+                        line=dict(width=1, dash="dot"),
+                    )
+                )
+    return traces
+
+
+def plot_time_series(
+    all_data, time_series, selected_stocks, all_indicators=None, selected_overlays=()
+):
     """
     Plot the time series data using Plotly for the selected stocks.
 
@@ -34,59 +67,93 @@ def plot_time_series(all_data, time_series, selected_stocks):
         all_data (dict): A dictionary of pandas DataFrames indexed by stock symbol.
         time_series (str): Column name to plot, e.g., 'Close'.
         selected_stocks (list): List of selected stock symbols.
+        all_indicators (dict): Indicator frames indexed by stock symbol, for the overlays.
+        selected_overlays (list): Indicator overlays to draw, keys of price_overlays and oscillator_overlays.
+            Price overlays are not drawn over the volume.
     """
-    traces = []
-    if len(selected_stocks) == 1:
-        data = all_data[selected_stocks[0]]
-        traces.append(
-            go.Scatter(
-                x=data.index,
-                y=data[time_series],
-                name="",
-                mode="lines",
-                hovertemplate="Close: %{customdata[0]:.2f}<br>"
-                + "Open: %{customdata[1]:.2f}<br>"
-                + "High: %{customdata[2]:.2f}<br>"
-                + "Low: %{customdata[3]:.2f}<br>"
-                + "Volume: %{customdata[4]:.0f}",
-                customdata=list(
-                    zip(
-                        data["Close"],
-                        data["Open"],
-                        data["High"],
-                        data["Low"],
-                        data["Volume"],
-                    )
-                ),
-            )
-        )
-    else:
-        for stock, data in all_data.items():
+    with tracing.span("build traces"):
+        traces = []
+        if len(selected_stocks) == 1:
+            data = all_data[selected_stocks[0]]
             traces.append(
                 go.Scatter(
                     x=data.index,
                     y=data[time_series],
+                    name="",
                     mode="lines",
-                    name=f"{stock}",
+                    hovertemplate="Close: %{customdata[0]:.2f}<br>"
+                    + "Open: %{customdata[1]:.2f}<br>"
+                    + "High: %{customdata[2]:.2f}<br>"
+                    + "Low: %{customdata[3]:.2f}<br>"
+                    + "Volume: %{customdata[4]:.0f}",
+                    customdata=list(
+                        zip(
+                            data["Close"],
+                            data["Open"],
+                            data["High"],
+                            data["Low"],
+                            data["Volume"],
+                        )
+                    ),
                 )
             )
+        else:
+            for stock, data in all_data.items():
+                traces.append(
+                    go.Scatter(
+                        x=data.index,
+                        y=data[time_series],
+                        mode="lines",
+                        name=f"{stock}",
+                    )
+                )
 
     if not traces:
         st.warning("No data available to plot.")
         return
 
-    fig = go.Figure(traces)
-    fig.update_layout(
-        title=f"{time_series.capitalize()} Over Time",
-        xaxis_title="Date",
-        yaxis_title=time_series.capitalize(),
-        template="plotly_dark",
-        hovermode="x unified",
-    )
-    st.plotly_chart(fig, use_container_width=True)
+    with tracing.span("build figure"):
+        all_indicators = all_indicators or {}
+        overlays = {
+            overlay: columns
+            for overlay, columns in price_overlays.items()
+            if overlay in selected_overlays and time_series != "Volume"
+        }
+        oscillators = {
+            overlay: columns
+            for overlay, columns in oscillator_overlays.items()
+            if overlay in selected_overlays
+        }
+        if oscillators and all_indicators:
+            # oscillators have their own scale, in a panel below the chart
+            fig = make_subplots(
+                rows=2, cols=1, shared_xaxes=True, row_heights=[0.7, 0.3]
+            )
+            fig.add_traces(traces, rows=1, cols=1)
+            oscillator_traces = indicator_traces(all_indicators, oscillators)
+            fig.add_traces(oscillator_traces, rows=[2] * len(oscillator_traces), cols=1)
+        else:
+            fig = go.Figure(traces)
+        if overlays and all_indicators:
+            overlay_traces = indicator_traces(all_indicators, overlays)
+            if oscillators:
+                fig.add_traces(overlay_traces, rows=1, cols=1)
+            else:
+                fig.add_traces(overlay_traces)
+        fig.update_layout(
+            title=f"{time_series.capitalize()} Over Time",
+            xaxis_title="Date",
+            yaxis_title=time_series.capitalize(),
+            template="plotly_dark",
+            hovermode="x unified",
+        )
+    with tracing.span("st.plotly_chart"):
+        st.plotly_chart(fig, use_container_width=True)
 
 
-def fetch_time_series_data_and_plot(selected_stocks, time_series, time_frame):
+def fetch_time_series_data_and_plot(
+    selected_stocks, time_series, time_frame, selected_overlays=()
+):
     """
     Main function to fetch data and trigger plotting for selected stocks.
 
@@ -94,6 +161,7 @@ def fetch_time_series_data_and_plot(selected_stocks, time_series, time_frame):
         selected_stocks (list): Stock symbols to fetch.
         time_series (str): The data type to plot, e.g., 'Close'.
         time_frame (str): The period over which to fetch the data.
+        selected_overlays (list): Indicator overlays to draw, see plot_time_series.
     """
     if not selected_stocks:
         st.warning("Please select at least one stock to proceed.")
@@ -105,7 +173,22 @@ def fetch_time_series_data_and_plot(selected_stocks, time_series, time_frame):
         if data is not None:
             time_series_data[stock] = data
 
+    all_indicators = None
+    if time_series_data and selected_overlays:
+        with tracing.span("indicators"):
+            all_indicators = chart_indicators(
+                list(time_series_data),
+                time_frame,
+                {stock: data.index for stock, data in time_series_data.items()},
+            )
+
     if time_series_data:
-        plot_time_series(time_series_data, time_series, selected_stocks)
+        plot_time_series(
+            time_series_data,
+            time_series,
+            selected_stocks,
+            all_indicators,
+            selected_overlays,
+        )
     else:
         st.error("Failed to retrieve data for plotting.")
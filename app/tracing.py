@@ -0,0 +1,268 @@
+import collections
+import logging
+import random
+import threading
+import time
+
+import pandas as pd
+import plotly.graph_objects as go
+import streamlit as st
+
+from utils import get_app_custom_config
+
+logger = logging.getLogger(__name__)
+if get_app_custom_config("debug"):
+    logger.setLevel(logging.DEBUG)
+
+# Every Streamlit session runs its script in its own thread, so the trace of the rerun in progress is kept per thread.
+_local = threading.local()
+
+# Most recent sampled traces of this process (all sessions), newest last
+recent_traces = collections.deque(maxlen=get_app_custom_config("trace_history"))
+
+
+class Span:
+    __slots__ = ("name", "start", "end", "children")
+
+    def __init__(self, name):
+        self.name = name
+        self.start = time.perf_counter()
+        self.end = None
+        self.children = []
+
+    @property
+    def duration(self):
+        end = self.end if self.end is not None else time.perf_counter()
+        return end - self.start
+
+
+class RerunTrace:
+    """
+    Span tree recorded for one sampled rerun of the script.
+    """
+
+    def __init__(self, name):
+        self.root = Span(name)
+        self.created_at = time.time()
+        self._stack = [self.root]
+
+    def open(self, name):
+        span = Span(name)
+        self._stack[-1].children.append(span)
+        self._stack.append(span)
+        return span
+
+    def close(self, span):
+        span.end = time.perf_counter()
+        # pop up to (and including) the span, tolerating spans left open by an exception
+        while len(self._stack) > 1:
+            if self._stack.pop() is span:
+                break
+
+
+class _SpanContext:
+    __slots__ = ("trace", "name", "span")
+
+    def __init__(self, trace, name):
+        self.trace = trace
+        self.name = name
+        self.span = None
+
+    def __enter__(self):
+        self.span = self.trace.open(self.name)
+        return self.span
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.trace.close(self.span)
+        return False
+
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return None
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+def start_rerun(name="rerun"):
+    """
+    Starts a new trace for the current rerun if it is picked by the sampling rate.
+    Any trace left unfinished by an interrupted rerun of the same session is discarded.
+
+    Parameters:
+        name (str): Name of the root span.
+
+    Returns:
+        bool: True if this rerun is traced.
+    """
+    sample_rate = get_app_custom_config("trace_sample_rate")
+    if sample_rate and random.random() < sample_rate:
+        _local.trace = RerunTrace(name)
+        return True
+    _local.trace = None
+    return False
+
+
+def finish_rerun():
+    """
+    Closes the trace of the current rerun and stores it in the recent traces.
+
+    Returns:
+        RerunTrace or None: The finished trace, None if the rerun was not sampled.
+    """
+    trace = getattr(_local, "trace", None)
+    _local.trace = None
+    if trace is None:
+        return None
+    trace.root.end = time.perf_counter()
+    recent_traces.append(trace)
+    logger.debug("Rerun trace:\n%s", format_trace(trace))
+    return trace
+
+
+def span(name):
+    """
+    Context manager timing a block of the current rerun as a child of the innermost open span.
+    It is a no-op if the rerun is not sampled (or outside a rerun, e.g. in the cache updater processes).
+
+    Parameters:
+        name (str): Name of the span.
+    """
+    trace = getattr(_local, "trace", None)
+    if trace is None:
+        return _NOOP_SPAN
+    return _SpanContext(trace, name)
+
+
+def flame_rows(trace):
+    """
+    Flattens a trace into flame graph rows. Sibling spans with the same name are merged the way a flame graph merges
+    identical stacks, so calling a cached function 50 times shows up as one block with a count of 50.
+
+    Parameters:
+        trace (RerunTrace): The trace to flatten.
+
+    Returns:
+        list of dict: Rows with id, parent, name, calls, total_ms and self_ms, parents before children.
+    """
+    rows = []
+
+    def visit(spans, parent_id):
+        merged = {}
+        for child in spans:
+            merged.setdefault(child.name, []).append(child)
+        for name, group in merged.items():
+            row_id = f"{parent_id}/{name}" if parent_id else name
+            total = sum(s.duration for s in group)
+            children = [c for s in group for c in s.children]
+            rows.append(
+                {
+                    "id": row_id,
+                    "parent": parent_id,
+                    "name": name,
+                    "calls": len(group),
+                    "total_ms": total * 1e3,
+                    "self_ms": (total - sum(c.duration for c in children)) * 1e3,
+                }
+            )
+            visit(children, row_id)
+
+    visit([trace.root], "")
+    return rows
+
+
+def format_trace(trace):
+    """
+    Formats a trace as an indented text breakdown, used for logging.
+
+    Parameters:
+        trace (RerunTrace): The trace to format.
+
+    Returns:
+        str: One line per merged span.
+    """
+    lines = []
+    for row in flame_rows(trace):
+        depth = row["id"].count("/")
+        lines.append(
+            f"{'  ' * depth}{row['name']} x{row['calls']}: {row['total_ms']:.1f} ms (self {row['self_ms']:.1f} ms)"
+        )
+    return "\n".join(lines)
+
+
+def display_trace(trace):
+    """
+    Displays a flame-style (icicle) breakdown of a rerun trace along with its span table.
+
+    Parameters:
+        trace (RerunTrace): The trace to display.
+    """
+    rows = flame_rows(trace)
+    with st.expander(
+        f"Render trace: {trace.root.name} ({rows[0]['total_ms']:.0f} ms) @{time.ctime(trace.created_at)}"
+    ):
+        fig = go.Figure(
+            go.Icicle(
+                ids=[row["id"] for row in rows],
+                labels=[row["name"] for row in rows],
+                parents=[row["parent"] for row in rows],
+                values=[max(row["self_ms"], 0) for row in rows],
+                branchvalues="remainder",
+                customdata=[
+                    [row["calls"], row["self_ms"], row["total_ms"]] for row in rows
+                ],
+                hovertemplate="%{label}<br>%{customdata[2]:.1f} ms total<br>%{customdata[1]:.1f} ms self"
+                + "<br>%{customdata[0]} call(s)<extra></extra>",
+                tiling=dict(orientation="v"),
+            )
+        )
+        fig.update_layout(margin=dict(t=10, l=10, r=10, b=10), height=400)
+        st.plotly_chart(fig, use_container_width=True)
+        st.dataframe(
+            pd.DataFrame(rows).drop(columns=["parent"]),
+            use_container_width=True,
+            hide_index=True,
+        )
+
+
+def recent_trace_table():
+    """
+    Summarizes the recent traces of this process (all sessions), newest first.
+
+    Returns:
+        pandas.DataFrame: Time, total ms and the slowest top level span of every trace.
+    """
+    rows = []
+    for trace in reversed(list(recent_traces)):
+        slowest = max(
+            trace.root.children, key=lambda child: child.duration, default=None
+        )
+        rows.append(
+            {
+                "Time": time.strftime("%H:%M:%S", time.localtime(trace.created_at)),
+                "Total (ms)": trace.root.duration * 1e3,
+                "Slowest Span": slowest.name if slowest else None,
+                "Slowest Span (ms)": slowest.duration * 1e3 if slowest else None,
+            }
+        )
+    return pd.DataFrame(rows)
+
+
+def display_recent_traces():
+    """
+    Displays the recent traces of this process with the percentiles of their total time.
+    """
+    table = recent_trace_table()
+    if table.empty:
+        return
+    p50, p95 = table["Total (ms)"].quantile([0.5, 0.95])
+    with st.expander(
+        f"Recent render traces: {len(table)} in this process, p50 {p50:.0f} ms, p95 {p95:.0f} ms"
+    ):
+        st.dataframe(table.round(1), use_container_width=True, hide_index=True)
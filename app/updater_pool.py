@@ -0,0 +1,238 @@
+import atexit
+import logging
+import multiprocessing
+import os
+import threading
+from multiprocessing.connection import wait
+
+from cacheUtil import CentralCache
+from data_provider import get_data_provider, set_data_provider
+from memory import peak_rss_mb, process_rss_mb
+from utils import get_app_custom_config
+
+logger = logging.getLogger(__name__)
+
+# Modules imported once by the fork server, so that every worker starts with them loaded
+PRELOADED_MODULES = ["CacheUpdater"]
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def _worker_main(conn, cache, ttl, provider, max_tasks, max_memory_mb, log_level):
+    """
+    Main loop of a worker process: receives (symbol, build) work items on its connection and sends back the result
+    of CacheUpdater.update_symbol for each, with its peak RSS and whether it retires after this item.
+    """
+    from CacheUpdater import CacheUpdater
+
+    logging.basicConfig(
+        level=log_level,
+        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s (%(filename)s:%(lineno)d)",
+    )
+    CentralCache.cache, CentralCache.ttl = cache, ttl
+    # kept for the life of the worker, with any HTTP session of the provider
+    set_data_provider(provider)
+    cache_updater = CacheUpdater(None)
+    tasks = 0
+    while True:
+        try:
+            item = conn.recv()
+        except EOFError:
+            return
+        if item is None:
+            return
+        symbol, cache_updater.build = item
+        result = cache_updater.update_symbol(symbol)
+        tasks += 1
+        rss = peak_rss_mb()
+        retire = (max_tasks and tasks >= max_tasks) or (
+            max_memory_mb and rss > max_memory_mb
+        )
+        conn.send((result, rss, bool(retire)))
+        if retire:
+            return
+
+
+class _Worker:
+    def __init__(self, context, init_args):
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(
+            target=_worker_main, args=(child_conn, *init_args), daemon=True
+        )
+        self.process.start()
+        child_conn.close()
+        # symbol being updated, None when idle
+        self.symbol = None
+        self.tasks = 0
+
+
+class UpdaterPool:
+    """
+    Long-lived pool of cache updater processes, started once and fed the stocks of every refresh cycle.
+
+    The workers are forked from a fork server with the updater modules preloaded rather than from the server
+    process, so that they are small, start with their imports done, and keep their data provider (and its HTTP
+    session) from one cycle to the next. A worker is replaced after `max_tasks` stocks, or after the stock during
+    which its peak RSS went over `max_memory_mb`, to contain leaks; a worker that dies fails its stock and is
+    replaced as well.
+    """
+
+    def __init__(self, workers=None, max_tasks=None, max_memory_mb=None):
+        """
+        Parameters:
+            workers (int): Number of worker processes, the number of CPUs by default.
+            max_tasks (int): Stocks updated by a worker before it is replaced, 0 for no limit.
+            max_memory_mb (float): Peak RSS in MB over which a worker is replaced, 0 for no limit.
+        """
+        self.workers = workers or os.cpu_count()
+        self.max_tasks = max_tasks
+        self.max_memory_mb = max_memory_mb
+        self.recycled = 0
+        self._pool = []
+        self._lock = threading.Lock()
+        methods = multiprocessing.get_all_start_methods()
+        self._context = multiprocessing.get_context(
+            "forkserver" if "forkserver" in methods else "spawn"
+        )
+        if self._context.get_start_method() == "forkserver":
+            # the fork server imports the preloaded modules without the sys.path of this process, it finds the
+            # modules of the app through PYTHONPATH
+            paths = os.environ.get("PYTHONPATH", "").split(os.pathsep)
+            if APP_DIR not in paths:
+                os.environ["PYTHONPATH"] = os.pathsep.join(
+                    filter(None, [APP_DIR, *paths])
+                )
+            self._context.set_forkserver_preload(PRELOADED_MODULES)
+
+    def _start_worker(self):
+        return _Worker(
+            self._context,
+            (
+                CentralCache.cache,
+                CentralCache.ttl,
+                get_data_provider(),
+                self.max_tasks,
+                self.max_memory_mb,
+                logging.getLogger().getEffectiveLevel(),
+            ),
+        )
+
+    def _replace(self, worker, reason):
+        worker.conn.close()
+        worker.process.join(timeout=5)
+        self.recycled += 1
+        logger.info(f"Updater worker {worker.process.pid} replaced: {reason}")
+        self._pool[self._pool.index(worker)] = self._start_worker()
+
+    def update_symbols(self, symbols, build, on_result):
+        """
+        Updates stocks in the workers, one stock at a time per worker, into a build of the cache.
+
+        Parameters:
+            symbols (list): Symbols to update.
+            build (int): The build written to, see CentralCache.begin_generation.
+            on_result (callable): Called with the symbol and the result of CacheUpdater.update_symbol as every
+                stock is updated, in the order they finish.
+        """
+        with self._lock:
+            while len(self._pool) < self.workers:
+                self._pool.append(self._start_worker())
+            pending = list(reversed(symbols))
+            while True:
+                for worker in self._pool:
+                    if pending and worker.symbol is None:
+                        if not worker.process.is_alive():
+                            self._replace(worker, "exited while idle")
+                            continue
+                        worker.symbol = pending.pop()
+                        worker.conn.send((worker.symbol, build))
+                busy = [worker for worker in self._pool if worker.symbol is not None]
+                if not busy:
+                    if pending:
+                        continue
+                    return
+                ready = wait(
+                    [worker.conn for worker in busy]
+                    + [worker.process.sentinel for worker in busy]
+                )
+                for worker in busy:
+                    if worker.conn in ready or worker.conn.poll():
+                        try:
+                            result, rss, retire = worker.conn.recv()
+                        except (EOFError, OSError):
+                            self._fail(worker, on_result)
+                            continue
+                        symbol, worker.symbol = worker.symbol, None
+                        worker.tasks += 1
+                        on_result(symbol, result)
+                        if retire:
+                            self._replace(
+                                worker,
+                                f"retired after {worker.tasks} stocks, peak RSS {rss:.0f} MB",
+                            )
+                    elif worker.process.sentinel in ready:
+                        self._fail(worker, on_result)
+
+    def _fail(self, worker, on_result):
+        # the worker died updating its stock
+        symbol, worker.symbol = worker.symbol, None
+        worker.process.join()
+        message = f"Updater worker {worker.process.pid} died with exit code {worker.process.exitcode} updating {symbol}"
+        logger.error(message)
+        on_result(symbol, (False, 0.0, message))
+        self._replace(worker, "died")
+
+    def worker_memory(self):
+        """
+        Returns:
+            dict: RSS in MB of every worker process, by pid.
+        """
+        return {
+            worker.process.pid: process_rss_mb(worker.process.pid)
+            for worker in list(self._pool)
+        }
+
+    def close(self):
+        """
+        Stops the workers once they are idle.
+        """
+        with self._lock:
+            for worker in self._pool:
+                try:
+                    worker.conn.send(None)
+                except OSError:
+                    pass
+            for worker in self._pool:
+                worker.process.join(timeout=5)
+                worker.conn.close()
+            self._pool = []
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def updater_pool_memory():
+    """
+    Returns:
+        dict: RSS in MB of the updater workers of this process by pid, empty if its pool was not started.
+    """
+    return {} if _pool is None else _pool.worker_memory()
+
+
+def get_updater_pool(workers=None):
+    """
+    Returns the updater pool of this process, started on first use and stopped when the process exits.
+
+    Parameters:
+        workers (int): Number of worker processes when the pool is started, defaults to the `updater_workers` config.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = UpdaterPool(
+                workers or get_app_custom_config("updater_workers"),
+                get_app_custom_config("updater_worker_max_tasks"),
+                get_app_custom_config("updater_worker_max_memory_mb"),
+            )
+            atexit.register(_pool.close)
+    return _pool
@@ -3,6 +3,15 @@ import logging
 import streamlit as st
 from cachetools import cached
 
+# Custom VERBOSE log level used by the cache utilities, registered here so that it is available to every entry point
+logging.VERBOSE = 5
+logging.addLevelName(logging.VERBOSE, "VERBOSE")
+logging.Logger.verbose = lambda inst, msg, *args, **kwargs: inst.log(
+    logging.VERBOSE, msg, *args, **kwargs
+)
+logging.verbose = lambda msg, *args, **kwargs: logging.log(
+    logging.VERBOSE, msg, *args, **kwargs
+)
 logger = logging.getLogger(__name__)
 
 
@@ -16,11 +25,47 @@ def get_app_custom_config(arg):
         "thread_details": False,
         "cache_updater_details": False,
         "cache_util_verbose_log": False,
+        "trace_sample_rate": 0.0,  # fraction of reruns for which a render trace is recorded
+        "trace_history": 50,  # number of recent render traces kept per process
+        "metrics_cache_seconds": 15,  # seconds the cache memory served by the data API /metrics is reused
+        "admin_page": False,  # show the Admin page, with the memory of the deployment, to every session
+        "cache_backend": "local",  # local (manager process of this app) or remote (cache_server.py)
+        "cache_server_address": "127.0.0.1:50000",  # host:port or unix socket path of the cache server
+        "cache_server_authkey": None,  # shared secret of the cache server, required by the remote backend
+        "updater_lease_ttl": 2 * 60 * 60,  # seconds before another replica takes over
+        "updater_shards": 1,  # the stocks refreshed are split among the replicas sharing a cache by shard
+        "generation_pin_ttl": 600,  # seconds a rerun can keep reading a cache generation that is no longer current
+        "change_feed_size": 10000,  # latest changes of the central cache kept for its subscribers
+        "updater_item_timeout": 120,  # seconds allowed to update one stock, 0 to disable
+        "updater_workers": 0,  # worker processes of the cache updater, 0 for the number of CPUs
+        "updater_worker_max_tasks": 500,  # stocks updated by a worker before it is replaced, 0 for no limit
+        "updater_worker_max_memory_mb": 1024,  # peak RSS over which a worker is replaced, 0 for no limit
+        "negative_cache_ttl": 60,  # seconds a failed fetch is cached, doubled on every consecutive failure
+        "negative_cache_max_ttl": 3600,
+        "constituents_file": "constituents.json",  # S&P 500 constituents of the day, shared by the processes
+        "external_cache_updater": False,  # the cache is filled and refreshed by another process
+        "prefetch_workers": 2,  # background threads warming the cache for the next pages, 0 to disable
+        "quote_poll_interval": 15,  # seconds between live quotes of the visible stocks, 0 to disable
+        "quote_history": 240,  # quotes kept per stock
+        "quote_market_hours_only": True,
+        "cache_value_format": "pickle",  # pickle, arrow (Arrow IPC for DataFrames) or raw (stored as is)
+        "cache_compression": "lz4",  # lz4, zstd or none
+        "history_precision": "auto",  # float32, float64 or auto (float32 unless prices need float64 for cents)
+        "data_provider": "yfinance",  # yfinance, record or replay
+        "replay_data_dir": "replay_data",  # directory of recorded responses for the record and replay providers
+        "replay_latency": 0.0,  # mean injected latency in seconds of replayed calls
+        "replay_error_rate": 0.0,  # fraction of replayed calls failing with an injected error
     }
     if arg in default_values:
+        try:
+            has_config = st.secrets.has_key("config")
+        except FileNotFoundError:
+            # no secrets.toml, e.g. when running benchmarks or scripts outside the app
+            has_config = False
+        # a value set to false or 0 in the config overrides the default too
         value = (
             st.secrets.config.get(arg)
-            if (st.secrets.has_key("config") and st.secrets.config.get(arg))
+            if (has_config and arg in st.secrets.config)
             else default_values[arg]
         )
         return value
@@ -30,3 +75,7 @@ def get_app_custom_config(arg):
 
 class CacheExpiredException(Exception):
     pass
+
+
+class DataProviderError(Exception):
+    pass
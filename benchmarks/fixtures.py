@@ -0,0 +1,357 @@
+"""
+Fixture data for the offline benchmarks.
+
+If a recording made by record_fixtures.py exists it is used as is, otherwise a deterministic universe with the same
+shapes and dtypes as the yfinance responses (history frames, statement frames and `info` dicts) is generated.
+"""
+
+import argparse
+import os
+import pickle
+import sys
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app")
+)
+
+from backtest import BENCHMARK_SYMBOL  # noqa: E402
+from cacheUtil import CentralCache, make_cache_key  # noqa: E402
+from data_fetch import InfoRecord, lean_history_frame  # noqa: E402
+from data_provider import DataProvider, RecordingProvider  # noqa: E402
+from common_data import (  # noqa: E402
+    default_time_periods,
+    financial_columns,
+    financial_columns_renamed,
+)
+
+RECORDED_FIXTURES_FILE = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "fixtures", "recorded.pkl"
+)
+
+SECTORS = [
+    "Information Technology",
+    "Health Care",
+    "Financials",
+    "Consumer Discretionary",
+    "Communication Services",
+    "Industrials",
+    "Consumer Staples",
+    "Energy",
+    "Utilities",
+    "Real Estate",
+    "Materials",
+]
+
+STATEMENT_PRODUCERS = [
+    "annual_financials",
+    "annual_balance_sheet",
+    "quarterly_financials",
+    "quarterly_balance_sheet",
+]
+
+BALANCE_SHEET_ROWS = [
+    "Total Assets",
+    "Current Assets",
+    "Cash And Cash Equivalents",
+    "Receivables",
+    "Inventory",
+    "Net PPE",
+    "Goodwill",
+    "Total Liabilities Net Minority Interest",
+    "Current Liabilities",
+    "Accounts Payable",
+    "Current Debt",
+    "Long Term Debt",
+    "Total Debt",
+    "Net Debt",
+    "Stockholders Equity",
+    "Common Stock Equity",
+    "Retained Earnings",
+    "Total Capitalization",
+    "Invested Capital",
+    "Working Capital",
+    "Tangible Book Value",
+    "Share Issued",
+    "Ordinary Shares Number",
+    "Treasury Shares Number",
+]
+
+INFO_FIELDS_USED = {
+    "shortName": "str",
+    "sector": "str",
+    "previousClose": "price",
+    "trailingPE": "ratio",
+    "forwardPE": "ratio",
+    "marketCap": "amount",
+    "dividendYield": "fraction",
+    "earningsQuarterlyGrowth": "fraction",
+    "revenueGrowth": "fraction",
+    "debtToEquity": "ratio",
+    "returnOnEquity": "fraction",
+    "returnOnAssets": "fraction",
+    "priceToBook": "ratio",
+    "priceToSalesTrailing12Months": "ratio",
+    "sharesOutstanding": "amount",
+    "trailingEps": "ratio",
+    "pegRatio": "ratio",
+    "enterpriseToRevenue": "ratio",
+    "totalDebt": "amount",
+    "currentRatio": "ratio",
+}
+
+# yfinance `info` dicts carry well over a hundred fields, most of which the app never reads
+INFO_FILLER_FIELDS = 120
+
+
+def _history_frame(rng, dates):
+    close = 100 * np.exp(np.cumsum(rng.normal(0.0003, 0.018, len(dates))))
+    spread = np.abs(rng.normal(0, 0.01, len(dates)))
+    return pd.DataFrame(
+        {
+            "Open": close * (1 + rng.normal(0, 0.005, len(dates))),
+            "High": close * (1 + spread),
+            "Low": close * (1 - spread),
+            "Close": close,
+            "Volume": rng.integers(1_000_000, 80_000_000, len(dates)),
+            "Dividends": np.where(rng.random(len(dates)) < 0.016, 0.25, 0.0),
+            "Stock Splits": 0.0,
+        },
+        index=pd.Index(dates, name="Date"),
+    )
+
+
+def _period_slice(frame, period):
+    end = frame.index[-1]
+    if period == "ytd":
+        return frame[
+            frame.index >= pd.Timestamp(year=end.year, month=1, day=1, tz=end.tz)
+        ]
+    if period.endswith("mo"):
+        start = end - pd.DateOffset(months=int(period[:-2]))
+    else:
+        start = end - pd.DateOffset(years=int(period[:-1]))
+    return frame[frame.index > start]
+
+
+def _statement_frame(rng, rows, dates, scale):
+    values = rng.normal(1.0, 0.3, (len(rows), len(dates))) * scale
+    values[rng.random(values.shape) < 0.03] = np.nan
+    return pd.DataFrame(values, index=pd.Index(rows), columns=pd.DatetimeIndex(dates))
+
+
+def _info_dict(rng, symbol, sector):
+    info = {}
+    for field, kind in INFO_FIELDS_USED.items():
+        if kind == "price":
+            info[field] = float(rng.uniform(10, 900))
+        elif kind == "ratio":
+            info[field] = float(rng.uniform(0.5, 60))
+        elif kind == "fraction":
+            info[field] = float(rng.normal(0.05, 0.1))
+        elif kind == "amount":
+            info[field] = int(rng.uniform(1e9, 3e12))
+    info["shortName"] = f"{symbol} Holdings Inc."
+    info["sector"] = sector
+    for i in range(INFO_FILLER_FIELDS):
+        info[f"field{i}"] = float(rng.random()) if i % 3 else f"value {i}"
+    info["companyOfficers"] = [
+        {
+            "name": f"Officer {i}",
+            "title": "Officer",
+            "totalPay": int(rng.uniform(1e5, 1e7)),
+        }
+        for i in range(10)
+    ]
+    return info
+
+
+def generate_fixtures(n_symbols=300, seed=42):
+    """
+    Generates a deterministic universe of fixture data.
+
+    Parameters:
+        n_symbols (int): Number of ticker symbols.
+        seed (int): Seed of the random generator.
+
+    Returns:
+        dict: Fixtures keyed by producer function name ("info", "history", statements) and symbol, plus the
+        "symbols" list and the "sector_wise_stock_symbol_and_weight" dict. The histories also include the one of
+        the backtest benchmark, BENCHMARK_SYMBOL, which is not a symbol.
+    """
+    rng = np.random.default_rng(seed)
+    symbols = [f"S{i:03d}" for i in range(n_symbols)]
+    history_dates = pd.bdate_range(
+        end="2024-06-28", periods=5 * 252 + 5, tz="America/New_York"
+    )
+    quarter_ends = pd.date_range(end="2024-03-31", periods=5, freq="QE")[::-1]
+    year_ends = pd.date_range(end="2023-12-31", periods=4, freq="YE")[::-1]
+    income_rows = financial_columns + list(financial_columns_renamed)
+
+    weights = np.sort(rng.pareto(1.5, n_symbols))[::-1]
+    weights = weights / weights.sum() * 100
+    fixtures = {"symbols": symbols, "info": {}, "history": {}}
+    for producer in STATEMENT_PRODUCERS:
+        fixtures[producer] = {}
+    sector_wise = {"S&P 500 Index": []}
+    for i, symbol in enumerate(symbols):
+        sector = SECTORS[i % len(SECTORS)]
+        weight = round(float(weights[i]), 3)
+        sector_wise["S&P 500 Index"].append((symbol, weight))
+        sector_wise.setdefault(sector, []).append((symbol, weight))
+
+        scale = float(rng.uniform(1e8, 5e10))
+        fixtures["info"][symbol] = _info_dict(rng, symbol, sector)
+        fixtures["annual_financials"][symbol] = _statement_frame(
+            rng, income_rows, year_ends, scale * 4
+        )
+        fixtures["annual_balance_sheet"][symbol] = _statement_frame(
+            rng, BALANCE_SHEET_ROWS, year_ends, scale * 10
+        )
+        fixtures["quarterly_financials"][symbol] = _statement_frame(
+            rng, income_rows, quarter_ends, scale
+        )
+        fixtures["quarterly_balance_sheet"][symbol] = _statement_frame(
+            rng, BALANCE_SHEET_ROWS, quarter_ends, scale * 10
+        )
+        full_history = _history_frame(rng, history_dates)
+        fixtures["history"][symbol] = {
+            period: _period_slice(full_history, period)
+            for period in default_time_periods.values()
+        }
+    full_history = _history_frame(rng, history_dates)
+    fixtures["history"][BENCHMARK_SYMBOL] = {
+        period: _period_slice(full_history, period)
+        for period in default_time_periods.values()
+    }
+    fixtures["sector_wise_stock_symbol_and_weight"] = sector_wise
+    return fixtures
+
+
+def load_fixtures(n_symbols=300):
+    """
+    Loads the recorded fixtures if available, otherwise generates them.
+
+    Parameters:
+        n_symbols (int): Number of ticker symbols to generate when there is no recording.
+
+    Returns:
+        dict: Fixtures in the format of generate_fixtures.
+    """
+    if os.path.exists(RECORDED_FIXTURES_FILE):
+        with open(RECORDED_FIXTURES_FILE, "rb") as file:
+            return pickle.load(file)
+    return generate_fixtures(n_symbols)
+
+
+def populate_cache(fixtures):
+    """
+    Writes the fixture data into the CentralCache under the keys used by the data_fetch producer functions, as they
+    would cache it, so that everything downstream of data_fetch runs without network access.
+
+    Parameters:
+        fixtures (dict): Fixtures in the format of generate_fixtures.
+    """
+    CentralCache.set(
+        make_cache_key("get_sector_wise_stock_symbol_and_weight", ()),
+        fixtures["sector_wise_stock_symbol_and_weight"],
+    )
+    for symbol in fixtures["symbols"]:
+        CentralCache.set(
+            make_cache_key("info", (symbol,)),
+            InfoRecord.from_info(fixtures["info"][symbol]),
+        )
+        for producer in STATEMENT_PRODUCERS:
+            CentralCache.set(
+                make_cache_key(producer, (symbol,)), fixtures[producer][symbol]
+            )
+    for symbol, history in fixtures["history"].items():
+        for period, frame in history.items():
+            CentralCache.set(
+                make_cache_key("history", (symbol, period)), lean_history_frame(frame)
+            )
+
+
+class FixtureProvider(DataProvider):
+    """
+    Data provider serving fixture data from memory.
+    """
+
+    name = "fixtures"
+
+    def __init__(self, fixtures):
+        self.fixtures = fixtures
+
+    def tickers_sector(self):
+        return pd.DataFrame(
+            [
+                (symbol, sector)
+                for sector, symbol_and_weight in self.fixtures[
+                    "sector_wise_stock_symbol_and_weight"
+                ].items()
+                if sector != "S&P 500 Index"
+                for symbol, weight in symbol_and_weight
+            ],
+            columns=["Symbol", "GICS Sector"],
+        ).set_index("Symbol")
+
+    def tickers_weight(self):
+        return pd.DataFrame(
+            [
+                (symbol, f"{weight:.2f}%")
+                for symbol, weight in self.fixtures[
+                    "sector_wise_stock_symbol_and_weight"
+                ]["S&P 500 Index"]
+            ],
+            columns=["Symbol", "Weight"],
+        ).set_index("Symbol")
+
+    def history(self, symbol, period):
+        return self.fixtures["history"][symbol][period]
+
+    def info(self, symbol):
+        return self.fixtures["info"][symbol]
+
+    def annual_financials(self, symbol):
+        return self.fixtures["annual_financials"][symbol]
+
+    def annual_balance_sheet(self, symbol):
+        return self.fixtures["annual_balance_sheet"][symbol]
+
+    def quarterly_financials(self, symbol):
+        return self.fixtures["quarterly_financials"][symbol]
+
+    def quarterly_balance_sheet(self, symbol):
+        return self.fixtures["quarterly_balance_sheet"][symbol]
+
+
+def write_replay_data(fixtures, directory):
+    """
+    Writes the fixtures in the format served by the replay data provider.
+
+    Parameters:
+        fixtures (dict): Fixtures in the format of generate_fixtures.
+        directory (str): The replay data directory.
+    """
+    provider = RecordingProvider(FixtureProvider(fixtures), directory)
+    provider.tickers_sector()
+    provider.tickers_weight()
+    for symbol in fixtures["symbols"]:
+        provider.info(symbol)
+        for producer in STATEMENT_PRODUCERS:
+            getattr(provider, producer)(symbol)
+    for symbol, history in fixtures["history"].items():
+        for period in history:
+            provider.history(symbol, period)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Writes the benchmark fixtures as replay data for the replay data provider"
+    )
+    parser.add_argument("directory")
+    parser.add_argument("--symbols", type=int, default=500)
+    args = parser.parse_args()
+    write_replay_data(load_fixtures(args.symbols), args.directory)
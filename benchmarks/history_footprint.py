@@ -0,0 +1,42 @@
+"""
+Reports the bytes saved per symbol by the lean history frames over the fixture universe (or recorded fixtures),
+without network access.
+
+The precision policy is the `history_precision` config.
+
+Usage: python benchmarks/history_footprint.py [--symbols 500]
+"""
+
+import argparse
+import logging
+
+from fixtures import FixtureProvider, load_fixtures
+
+import data_fetch
+from cacheUtil import CentralCache
+from data_provider import set_data_provider
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--symbols", type=int, default=500)
+    args = parser.parse_args()
+
+    fixtures = load_fixtures(args.symbols)
+    set_data_provider(FixtureProvider(fixtures))
+    CentralCache.initialise()
+
+    report = data_fetch.history_footprint_report(fixtures["symbols"])
+    print(report.tail(6).to_string())
+    total = report.loc["Total"]
+    print(
+        f"\n{len(fixtures['symbols'])} symbols: {total['Original Bytes'] / 2**20:.1f} MB -> "
+        f"{total['Lean Bytes'] / 2**20:.1f} MB, "
+        f"{total['Bytes Saved'] / len(fixtures['symbols']) / 1024:.1f} KB saved per symbol "
+        f"({total['Bytes Saved'] / total['Original Bytes']:.0%})"
+    )
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.WARNING)
+    main()
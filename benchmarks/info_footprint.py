@@ -0,0 +1,61 @@
+"""
+Reports the bytes saved per symbol by caching InfoRecords instead of the full `info` dicts, and the pickling time of
+the universe's records, over the fixture universe without network access.
+
+Usage: python benchmarks/info_footprint.py [--symbols 500]
+"""
+
+import argparse
+import logging
+import pickle
+import timeit
+
+from fixtures import FixtureProvider, load_fixtures
+
+import data_fetch
+from cacheUtil import CentralCache
+from data_provider import set_data_provider
+
+
+def pickle_seconds(value, number=20):
+    return (
+        timeit.timeit(
+            lambda: pickle.loads(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)),
+            number=number,
+        )
+        / number
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--symbols", type=int, default=500)
+    args = parser.parse_args()
+
+    fixtures = load_fixtures(args.symbols)
+    symbols = fixtures["symbols"]
+    set_data_provider(FixtureProvider(fixtures))
+    CentralCache.initialise()
+
+    report = data_fetch.info_footprint_report(symbols)
+    print(report.tail(6).to_string())
+    total = report.loc["Total"]
+    print(
+        f"\n{len(symbols)} symbols: {total['Dict Bytes'] / 2**20:.2f} MB -> "
+        f"{total['Record Bytes'] / 2**20:.2f} MB, "
+        f"{total['Bytes Saved'] / len(symbols) / 1024:.1f} KB saved per symbol "
+        f"({total['Bytes Saved'] / total['Dict Bytes']:.0%})"
+    )
+
+    provider = FixtureProvider(fixtures)
+    dicts = [provider.info(symbol) for symbol in symbols]
+    records = [data_fetch.info(symbol) for symbol in symbols]
+    print(
+        f"Pickle round-trip of the universe: {pickle_seconds(dicts) * 1e3:.1f} ms as dicts, "
+        f"{pickle_seconds(records) * 1e3:.1f} ms as records"
+    )
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.WARNING)
+    main()
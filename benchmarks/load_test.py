@@ -0,0 +1,168 @@
+"""
+Concurrent-session load test of the dashboard over replayed data, without network access.
+
+The harness warms the central cache with one CacheUpdater cycle over replay data, then starts N session processes
+that share the cache (as the sessions of one Streamlit server share the Manager proxy) and each click through all
+the `menus` pages with Streamlit's AppTest. It reports the p50/p95/p99 rerun latency overall and per page, the cache
+round-trips (IPC calls) per rerun and the memory of the session processes and of the Manager process.
+
+Usage: python benchmarks/load_test.py [--sessions 8] [--rounds 3] [--symbols 500] [--count 10]
+"""
+
+import argparse
+import logging
+import multiprocessing
+import os
+import resource
+import tempfile
+import time
+
+import numpy as np
+from fixtures import load_fixtures, write_replay_data
+from streamlit.testing.v1 import AppTest
+
+import data_fetch
+from CacheUpdater import CacheUpdater
+from cacheUtil import CentralCache
+from common_data import menus
+from constituents import ConstituentIndex, set_constituent_index
+from data_provider import ReplayProvider, set_data_provider
+
+APP_FILE = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "..", "app", "app_stock_dashboard.py"
+)
+
+
+def process_rss_kb(pid):
+    """
+    Returns the current resident set size of a process in KB, read from /proc (Linux only).
+    """
+    try:
+        with open(f"/proc/{pid}/status") as file:
+            for line in file:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def run_session(session_id, rounds, count, start_barrier, results_queue):
+    """
+    Simulates one user session clicking through every page `rounds` times.
+    Puts (session_id, list of (page, seconds, proxy calls, failed), max RSS in KB) on the results queue.
+    """
+    app_test = AppTest.from_file(APP_FILE, default_timeout=120)
+    app_test.secrets["config"] = {
+        "environment": "development",
+        "external_cache_updater": True,
+        "count": count,
+        "admin_page": True,
+    }
+    app_test.secrets["credentials"] = {"password": ""}
+    # first run of the session initialises its session state, it is not measured
+    app_test.run()
+
+    start_barrier.wait()
+    reruns = []
+    for _ in range(rounds):
+        for page in menus:
+            app_test.session_state["menu"] = page
+            proxy_calls = CentralCache.proxy_calls
+            start = time.perf_counter()
+            app_test.run()
+            reruns.append(
+                (
+                    page,
+                    time.perf_counter() - start,
+                    CentralCache.proxy_calls - proxy_calls,
+                    len(app_test.exception) > 0,
+                )
+            )
+    results_queue.put(
+        (session_id, reruns, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+    )
+
+
+def _latency_percentiles(latencies):
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99]) * 1e3
+    return f"{p50:>9.1f}{p95:>9.1f}{p99:>9.1f}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sessions", type=int, default=8)
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--symbols", type=int, default=500)
+    parser.add_argument(
+        "--count", type=int, default=10, help="top stocks cached per sector"
+    )
+    parser.add_argument(
+        "--latency",
+        type=float,
+        default=0.0,
+        help="provider latency of cache misses in seconds",
+    )
+    parser.add_argument("--replay-dir")
+    args = parser.parse_args()
+
+    replay_dir = args.replay_dir
+    if replay_dir is None:
+        replay_dir = tempfile.mkdtemp(prefix="replay_data_")
+        print(f"Writing replay data for {args.symbols} symbols to {replay_dir}")
+        write_replay_data(load_fixtures(args.symbols), replay_dir)
+
+    set_data_provider(ReplayProvider(replay_dir, latency=args.latency))
+    CentralCache.initialise()
+    print("Warming the cache")
+    sector_dict = data_fetch.get_sector_wise_stock_symbol_and_weight()
+    CacheUpdater(args.count).refresh(sector_dict)
+    # the sessions, forked below, use the constituents of the fixtures instead of the constituents file
+    set_constituent_index(ConstituentIndex.from_sector_dict(sector_dict))
+
+    context = multiprocessing.get_context("fork")
+    start_barrier = context.Barrier(args.sessions + 1)
+    results_queue = context.Queue()
+    sessions = [
+        context.Process(
+            target=run_session,
+            args=(i, args.rounds, args.count, start_barrier, results_queue),
+        )
+        for i in range(args.sessions)
+    ]
+    for session in sessions:
+        session.start()
+    start_barrier.wait()
+    start = time.perf_counter()
+    results = [results_queue.get() for _ in sessions]
+    elapsed = time.perf_counter() - start
+    for session in sessions:
+        session.join()
+
+    reruns = [rerun for _, session_reruns, _ in results for rerun in session_reruns]
+    failures = sum(failed for _, _, _, failed in reruns)
+    print(
+        f"\n{args.sessions} sessions x {args.rounds} rounds x {len(menus)} pages: {len(reruns)} reruns "
+        f"in {elapsed:.2f}s ({len(reruns) / elapsed:.1f} reruns/s), {failures} failed"
+    )
+    print(f"\n{'page':<25}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'IPC/rerun':>11}")
+    for page in menus + ["all pages"]:
+        page_reruns = [r for r in reruns if page in (r[0], "all pages")]
+        print(
+            f"{page:<25}{_latency_percentiles([r[1] for r in page_reruns])}"
+            f"{np.mean([r[2] for r in page_reruns]):>11.1f}"
+        )
+
+    session_rss = [rss for _, _, rss in results]
+    print(
+        f"\nSession process max RSS: mean {np.mean(session_rss) / 1024:.1f} MB, "
+        f"max {max(session_rss) / 1024:.1f} MB"
+    )
+    manager_rss = process_rss_kb(CentralCache.manager._process.pid)
+    if manager_rss is not None:
+        print(f"Manager process RSS: {manager_rss / 1024:.1f} MB")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.WARNING)
+    main()
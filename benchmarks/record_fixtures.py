@@ -0,0 +1,121 @@
+"""
+Records live yfinance responses for the top index constituents, and the history of the backtest benchmark, into
+benchmarks/fixtures/recorded.pkl. The `info` dicts and the histories are recorded as the data provider returns
+them, before data_fetch projects them into InfoRecords and lean frames.
+Once the recording exists, the benchmarks use it instead of the generated fixtures.
+
+Usage: python benchmarks/record_fixtures.py [--symbols 300]
+"""
+
+import argparse
+import logging
+import os
+import pickle
+
+from fixtures import RECORDED_FIXTURES_FILE, STATEMENT_PRODUCERS
+
+import data_fetch
+from backtest import BENCHMARK_SYMBOL
+from cacheUtil import CentralCache
+from common_data import default_time_periods
+from data_provider import get_data_provider
+
+logger = logging.getLogger(__name__)
+
+
+def raw_history(symbol, period):
+    """
+    Returns the history frame of the data provider as it is, not the lean frame cached by data_fetch.history, so
+    that the benchmarks of lean_history_frame start from the yfinance schema. None if there is no history.
+    """
+    try:
+        history = get_data_provider().history(symbol, period)
+    except Exception as e:
+        logger.warning(f"Failed to record the {period} history of {symbol}: {e}")
+        return None
+    return None if history is None or history.empty else history
+
+
+def raw_info(symbol):
+    """
+    Returns the `info` dict of the data provider as it is, not the InfoRecord cached by data_fetch.info, so that
+    info_footprint.py and the replay data start from the full dict. None if it could not be fetched.
+    """
+    try:
+        return get_data_provider().info(symbol)
+    except Exception as e:
+        logger.warning(f"Failed to record the info of {symbol}: {e}")
+        return None
+
+
+def record_fixtures(n_symbols):
+    sector_wise_stock_symbol_and_weight = (
+        data_fetch.get_sector_wise_stock_symbol_and_weight()
+    )
+    symbols = [
+        symbol
+        for symbol, weight in sector_wise_stock_symbol_and_weight["S&P 500 Index"][
+            :n_symbols
+        ]
+    ]
+    fixtures = {
+        "symbols": [],
+        "sector_wise_stock_symbol_and_weight": {
+            sector: [(s, w) for s, w in symbol_and_weight if s in symbols]
+            for sector, symbol_and_weight in sector_wise_stock_symbol_and_weight.items()
+        },
+        "info": {},
+        "history": {},
+    }
+    for producer in STATEMENT_PRODUCERS:
+        fixtures[producer] = {}
+
+    for i, symbol in enumerate(symbols):
+        logger.info(f"Recording {symbol} ({i + 1}/{len(symbols)})")
+        info = raw_info(symbol)
+        statements = {
+            producer: getattr(data_fetch, producer)(symbol)
+            for producer in STATEMENT_PRODUCERS
+        }
+        history = {
+            period: raw_history(symbol, period)
+            for period in default_time_periods.values()
+        }
+        if (
+            info is None
+            or any(value is None for value in statements.values())
+            or any(frame is None for frame in history.values())
+        ):
+            logger.warning(f"Skipping {symbol}, incomplete data")
+            continue
+        fixtures["symbols"].append(symbol)
+        fixtures["info"][symbol] = info
+        fixtures["history"][symbol] = history
+        for producer, value in statements.items():
+            fixtures[producer][symbol] = value
+
+    benchmark_history = {
+        period: raw_history(BENCHMARK_SYMBOL, period)
+        for period in default_time_periods.values()
+    }
+    if any(history is None for history in benchmark_history.values()):
+        logger.warning(f"Skipping {BENCHMARK_SYMBOL}, incomplete history")
+    else:
+        fixtures["history"][BENCHMARK_SYMBOL] = benchmark_history
+
+    os.makedirs(os.path.dirname(RECORDED_FIXTURES_FILE), exist_ok=True)
+    with open(RECORDED_FIXTURES_FILE, "wb") as file:
+        pickle.dump(fixtures, file)
+    logger.info(
+        f"Recorded {len(fixtures['symbols'])} symbols into {RECORDED_FIXTURES_FILE}"
+    )
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--symbols", type=int, default=300)
+    args = parser.parse_args()
+
+    CentralCache.initialise()
+    record_fixtures(args.symbols)
@@ -0,0 +1,171 @@
+"""
+Offline benchmarks of the compute hot paths, measured against fixture data served from the CentralCache.
+
+Each benchmark reports the best time per call over several repeats and is compared with the stored baseline in
+benchmarks/baselines.json; the run fails if any benchmark is slower than its baseline by more than the threshold.
+Baselines are machine specific, re-record them with --update-baselines when moving to a new machine.
+
+Usage: python benchmarks/run_benchmarks.py [--update-baselines] [--threshold 0.3] [--only NAME ...]
+"""
+
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+
+from fixtures import load_fixtures, populate_cache
+
+from cacheUtil import CentralCache
+from ratios import _fetch_financial_ratio_for_single_symbol
+from returns import calculate_returns
+from stock_data import (
+    calculate_return_on_capital_employed,
+    fetch_multiple_stocks_data,
+    fetch_stock_data,
+    prepare_industry_wide_stock_data,
+)
+
+BASELINES_FILE = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "baselines.json"
+)
+
+# symbols per benchmark iteration, the size of an Industry Data page
+PAGE_SIZE = 50
+
+
+def _per_symbol(func):
+    def setup(fixtures):
+        symbols = fixtures["symbols"][:PAGE_SIZE]
+
+        def run():
+            for symbol in symbols:
+                func(symbol, force_update=True)
+
+        return run, len(symbols)
+
+    return setup
+
+
+def _fetch_multiple_stocks_data(fixtures):
+    ticker_and_weight_list = fixtures["sector_wise_stock_symbol_and_weight"][
+        "S&P 500 Index"
+    ][:PAGE_SIZE]
+    # the page reads already computed fetch_stock_data entries, as it does once the updater has run
+    for symbol, weight in ticker_and_weight_list:
+        fetch_stock_data(symbol, force_update=True)
+
+    def run():
+        fetch_multiple_stocks_data(ticker_and_weight_list)
+
+    return run, 1
+
+
+def _prepare_industry_wide_stock_data(fixtures):
+    raw_data = fetch_multiple_stocks_data(
+        fixtures["sector_wise_stock_symbol_and_weight"]["S&P 500 Index"]
+    )
+
+    def run():
+        prepare_industry_wide_stock_data(raw_data.copy())
+
+    return run, 1
+
+
+# name -> setup(fixtures) returning (callable to time, number of calls it represents)
+BENCHMARKS = {
+    "calculate_returns": _per_symbol(calculate_returns),
+    "calculate_return_on_capital_employed": _per_symbol(
+        calculate_return_on_capital_employed
+    ),
+    "_fetch_financial_ratio_for_single_symbol": _per_symbol(
+        _fetch_financial_ratio_for_single_symbol
+    ),
+    "fetch_multiple_stocks_data": _fetch_multiple_stocks_data,
+    "prepare_industry_wide_stock_data": _prepare_industry_wide_stock_data,
+}
+
+
+def measure(run, calls, repeat):
+    """
+    Times a benchmark callable.
+
+    Parameters:
+        run (callable): The benchmark body.
+        calls (int): Number of calls one run of the body represents.
+        repeat (int): Number of timed runs, after one warm up run.
+
+    Returns:
+        float: Best (minimum) seconds per call, the least noisy estimate.
+    """
+    run()
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run()
+        timings.append((time.perf_counter() - start) / calls)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--update-baselines", action="store_true")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.3,
+        help="allowed slowdown relative to the baseline (0.3 = 30%%)",
+    )
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--symbols", type=int, default=300)
+    parser.add_argument("--only", nargs="*", choices=list(BENCHMARKS))
+    args = parser.parse_args()
+
+    CentralCache.initialise()
+    fixtures = load_fixtures(args.symbols)
+    populate_cache(fixtures)
+
+    baselines = {}
+    if os.path.exists(BASELINES_FILE):
+        with open(BASELINES_FILE) as file:
+            baselines = json.load(file)
+
+    results = {}
+    regressions = []
+    print(f"{'benchmark':<45}{'per call':>12}{'baseline':>12}{'ratio':>8}")
+    for name in args.only or BENCHMARKS:
+        run, calls = BENCHMARKS[name](fixtures)
+        results[name] = measure(run, calls, args.repeat)
+        baseline = baselines.get(name)
+        if baseline:
+            ratio = results[name] / baseline
+            status = ""
+            if ratio > 1 + args.threshold:
+                regressions.append(name)
+                status = "  REGRESSION"
+            print(
+                f"{name:<45}{results[name] * 1e3:>10.3f}ms{baseline * 1e3:>10.3f}ms{ratio:>8.2f}{status}"
+            )
+        else:
+            print(f"{name:<45}{results[name] * 1e3:>10.3f}ms{'-':>12}{'-':>8}")
+
+    if args.update_baselines:
+        baselines.update(results)
+        with open(BASELINES_FILE, "w") as file:
+            json.dump(baselines, file, indent=2, sort_keys=True)
+            file.write("\n")
+        print(f"Baselines written to {BASELINES_FILE}")
+        return 0
+
+    if regressions:
+        print(
+            f"{len(regressions)} benchmark(s) regressed by more than {args.threshold:.0%}: {', '.join(regressions)}"
+        )
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.WARNING)
+    sys.exit(main())
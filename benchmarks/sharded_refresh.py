@@ -0,0 +1,100 @@
+"""
+Exercises the sharded cache refresh with local processes, without network access.
+
+Starts a cache server and N updater nodes (one process each) running refresh cycles over replay data against it,
+prints the coordinator view, then kills one node and shows its shards being reclaimed by the others once its
+leases expire.
+
+Usage: python benchmarks/sharded_refresh.py [--nodes 3] [--shards 6] [--symbols 200] [--count 10] [--lease-ttl 6]
+"""
+
+import argparse
+import logging
+import multiprocessing
+import os
+import signal
+import tempfile
+import time
+
+from fixtures import load_fixtures, write_replay_data
+
+import sharding
+from cache_server import serve
+from cacheUtil import CentralCache, RemoteCacheBackend
+from data_provider import ReplayProvider, set_data_provider
+
+ADDRESS = "127.0.0.1:50917"
+AUTHKEY = "sharded-refresh"
+
+
+def run_node(replay_dir, count, shards, lease_ttl, cycle_time):
+    # own process group, so that the node and its updater workers can be killed together as on a crash
+    os.setpgrp()
+    set_data_provider(ReplayProvider(replay_dir))
+    CentralCache.initialise(backend=RemoteCacheBackend(ADDRESS, AUTHKEY))
+    owner = sharding.node_id()
+    while True:
+        start = time.time()
+        sharding.refresh_owned_shards(count, owner, shards=shards, ttl=lease_ttl)
+        time.sleep(max(cycle_time - (time.time() - start), 0))
+
+
+def print_view(title, shards):
+    print(f"\n--- {title}")
+    print(f"live nodes: {', '.join(sorted(sharding.live_nodes()))}")
+    print(sharding.shard_status(shards).drop(columns="symbols").round(1).to_string())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--nodes", type=int, default=3)
+    parser.add_argument("--shards", type=int, default=6)
+    parser.add_argument("--symbols", type=int, default=200)
+    parser.add_argument("--count", type=int, default=10)
+    parser.add_argument(
+        "--lease-ttl",
+        type=float,
+        default=6,
+        help="seconds, the nodes run a cycle every lease-ttl / 3 seconds",
+    )
+    args = parser.parse_args()
+
+    replay_dir = tempfile.mkdtemp(prefix="replay_data_")
+    write_replay_data(load_fixtures(args.symbols), replay_dir)
+
+    context = multiprocessing.get_context("fork")
+    server = context.Process(target=serve, args=(ADDRESS, AUTHKEY), daemon=True)
+    server.start()
+    time.sleep(1)
+    CentralCache.initialise(backend=RemoteCacheBackend(ADDRESS, AUTHKEY))
+
+    cycle_time = args.lease_ttl / 3
+    nodes = [
+        context.Process(
+            target=run_node,
+            args=(replay_dir, args.count, args.shards, args.lease_ttl, cycle_time),
+        )
+        for _ in range(args.nodes)
+    ]
+    for node in nodes:
+        node.start()
+
+    try:
+        time.sleep(cycle_time * 3)
+        print_view(f"{args.nodes} nodes", args.shards)
+
+        killed = nodes.pop(0)
+        os.killpg(killed.pid, signal.SIGKILL)
+        print(f"\nkilled node {killed.pid}")
+        time.sleep(args.lease_ttl + cycle_time * 3)
+        print_view(
+            f"{len(nodes)} nodes, after the leases of {killed.pid} expired", args.shards
+        )
+    finally:
+        for node in nodes:
+            os.killpg(node.pid, signal.SIGKILL)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.WARNING)
+    main()
@@ -0,0 +1,74 @@
+"""
+Measures the throughput of one CacheUpdater refresh cycle over replayed data, without network access.
+
+The replay data is generated from the benchmark fixtures unless --replay-dir points to existing replay data
+(e.g. recorded with data_provider = 'record'). Latency and error rate are injected into every replayed call.
+
+Usage: python benchmarks/updater_throughput.py [--symbols 500] [--count 10] [--latency 0.05] [--error-rate 0.01]
+"""
+
+import argparse
+import logging
+import os
+import tempfile
+import time
+
+from fixtures import load_fixtures, write_replay_data
+
+import data_fetch
+from CacheUpdater import CacheUpdater
+from cacheUtil import CentralCache
+from common_data import default_time_periods
+from data_provider import ReplayProvider, set_data_provider
+
+# producer calls made by the updater per symbol: info, four statements and one history per default period
+PROVIDER_CALLS_PER_SYMBOL = 5 + len(default_time_periods)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--symbols", type=int, default=500)
+    parser.add_argument(
+        "--count", type=int, default=10, help="top stocks updated per sector"
+    )
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--replay-dir")
+    args = parser.parse_args()
+
+    replay_dir = args.replay_dir
+    if replay_dir is None:
+        replay_dir = tempfile.mkdtemp(prefix="replay_data_")
+        print(f"Writing replay data for {args.symbols} symbols to {replay_dir}")
+        write_replay_data(load_fixtures(args.symbols), replay_dir)
+    elif not os.path.isdir(replay_dir):
+        parser.error(f"{replay_dir} is not a directory")
+
+    set_data_provider(
+        ReplayProvider(replay_dir, latency=args.latency, error_rate=args.error_rate)
+    )
+    CentralCache.initialise()
+
+    sector_wise_stock_symbol_and_weight_dict = (
+        data_fetch.get_sector_wise_stock_symbol_and_weight()
+    )
+    updater = CacheUpdater(args.count)
+    # once each, as refreshed: a symbol in several sectors (e.g. the 'S&P 500 Index' list) is updated once
+    symbol_updates = len(
+        updater.symbols_to_update(sector_wise_stock_symbol_and_weight_dict)
+    )
+
+    start = time.perf_counter()
+    updater.refresh(sector_wise_stock_symbol_and_weight_dict)
+    elapsed = time.perf_counter() - start
+
+    print(
+        f"Refreshed {symbol_updates} symbols in {len(sector_wise_stock_symbol_and_weight_dict)} sectors "
+        f"in {elapsed:.2f}s: {symbol_updates / elapsed:.1f} symbols/s, "
+        f"{symbol_updates * PROVIDER_CALLS_PER_SYMBOL / elapsed:.1f} provider calls/s"
+    )
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.WARNING)
+    main()